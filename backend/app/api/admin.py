@@ -1,21 +1,47 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from ..models import AdminUser, Contribution, Campaign, CampaignCreate, Parent
-from ..auth import verify_password, create_token
-from ..db import get_db
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends, Query, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from ..models import AdminUser, Contribution, Campaign, CampaignCreate, CampaignTotals, EmailOutbox, Parent
+from ..auth import create_token, hash_password_async, verify_and_update_password_async
+from ..bank_import import ContributionIndex, PendingContribution, StatementFormatError, StatementParser, match_transfers
+from ..cache import CAMPAIGNS, response_cache
+from ..campaign_totals import TotalsDelta, check_campaign_totals, rebuild_campaign_totals, record_change
+from ..db_async import get_async_db
+from ..export import FORMATS, stream_csv, stream_xlsx
+from ..identity_cache import parent_identity_cache
+from ..outbox import DEAD, PENDING, STATUSES, drain_outbox, requeue
+from ..profiling import profile_store
+from ..settings import get_settings
+from ..slow_queries import slow_query_log
+from ..sql import bulk_update_by_id, dialect_name, insert_for
+from ..streaming import NDJSON_MEDIA_TYPE, coalesce, json_dumps
+from sqlalchemy import and_, case, cast, func, literal, or_, select as sa_select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
+from .parents import _get_email_client
 
 router = APIRouter()
 
 
 @router.post('/login')
-def login(payload: dict):
+async def login(payload: dict):
     username = payload.get('username')
     password = payload.get('password')
-    with get_db() as session:
+    async with get_async_db() as session:
         stmt = select(AdminUser).where(AdminUser.username == username)
-        user = session.exec(stmt).first()
-        if not user or not verify_password(password, user.password_hash):
+        user = (await session.exec(stmt)).first()
+        if not user:
             raise HTTPException(status_code=401, detail='invalid credentials')
+        valid, new_hash = await verify_and_update_password_async(password, user.password_hash)
+        if not valid:
+            raise HTTPException(status_code=401, detail='invalid credentials')
+        if new_hash:
+            user.password_hash = new_hash
+            session.add(user)
+            await session.commit()
         token = create_token({'sub': user.username})
         return {'token': token}
 
@@ -69,7 +95,7 @@ async def create_campaign_new(request: Request):
 
         print(f"Creating campaign: title={title}, amount={target_amount}")
 
-        with get_db() as session:
+        async with get_async_db() as session:
             c = Campaign(
                 title=title,
                 description=description,
@@ -78,8 +104,9 @@ async def create_campaign_new(request: Request):
                 active=active
             )
             session.add(c)
-            session.commit()
-            session.refresh(c)
+            await session.commit()
+            response_cache.bump(CAMPAIGNS)
+            await session.refresh(c)
             print(f"Campaign created successfully with ID: {c.id}")
 
             # Return the campaign data manually as dict
@@ -131,7 +158,7 @@ async def create_campaign(request: Request):
 
         print(f"Creating campaign: title={title}, amount={target_amount}")
 
-        with get_db() as session:
+        async with get_async_db() as session:
             c = Campaign(
                 title=title,
                 description=description,
@@ -140,8 +167,9 @@ async def create_campaign(request: Request):
                 active=active
             )
             session.add(c)
-            session.commit()
-            session.refresh(c)
+            await session.commit()
+            response_cache.bump(CAMPAIGNS)
+            await session.refresh(c)
             print(f"Campaign created successfully with ID: {c.id}")
 
             # Return the campaign data manually as dict
@@ -165,7 +193,7 @@ async def create_campaign(request: Request):
 
 
 @router.post('/campaigns-debug')
-def create_campaign_debug(payload: dict):
+async def create_campaign_debug(payload: dict):
     print("DEBUG RAW - Received payload:", payload)
     print("DEBUG RAW - Title type:", type(payload.get('title')))
     print("DEBUG RAW - Title value:", repr(payload.get('title')))
@@ -173,129 +201,606 @@ def create_campaign_debug(payload: dict):
 
 
 @router.post('/contributions/mark-paid')
-def mark_paid(payload: dict):
+async def mark_paid(payload: dict):
     cid = payload.get('campaign_id')
     pid = payload.get('parent_id')
     amount = payload.get('amount', 0)
     note = payload.get('note')
-    with get_db() as session:
-        stmt = select(Contribution).where(Contribution.campaign_id == cid, Contribution.parent_id == pid)
-        c = session.exec(stmt).first()
+    async with get_async_db() as session:
+        stmt = select(Contribution).where(Contribution.campaign_id == cid, Contribution.parent_id == pid).with_for_update()
+        c = (await session.exec(stmt)).first()
         if not c:
             raise HTTPException(status_code=404, detail='contribution not found')
+        before = (c.status, c.amount_expected, c.amount_paid)
         c.amount_paid = amount
         c.status = 'paid'
         c.paid_at = __import__('datetime').datetime.utcnow()
         c.note = note
         session.add(c)
-        session.commit()
-        session.refresh(c)
+        await record_change(session, c.campaign_id, before, (c.status, c.amount_expected, c.amount_paid))
+        await session.commit()
+        await session.refresh(c)
         return c
 
 
+MARK_PAID_BATCH_LIMIT = 1000
+
+
+def _mark_paid_item(item):
+    """Validate one batch item; returns (key, amount, note) or an error string."""
+    if not isinstance(item, dict):
+        return 'item must be an object'
+    cid, pid = item.get('campaign_id'), item.get('parent_id')
+    if not isinstance(cid, int) or not isinstance(pid, int):
+        return 'campaign_id and parent_id must be integers'
+    amount = item.get('amount', 0)
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0:
+        return 'amount must be a non-negative number'
+    return (cid, pid), float(amount), item.get('note')
+
+
+@router.post('/contributions/mark-paid/batch')
+async def mark_paid_batch(payload: dict):
+    """Mark many contributions paid in one transaction.
+
+    ``items``: list of ``{campaign_id, parent_id, amount, note}``. One SELECT
+    locks the matching contributions and one UPDATE writes them, whatever the
+    batch size. Each item gets a status: ``updated``, ``not_found``,
+    ``conflict`` (already paid with a different amount, or repeated in the
+    batch) or ``invalid``. Re-sending the same batch is safe.
+    """
+    items = payload.get('items')
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail='items must be a non-empty list')
+    if len(items) > MARK_PAID_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f'at most {MARK_PAID_BATCH_LIMIT} items per batch')
+
+    results = []
+    wanted = {}  # (campaign_id, parent_id) -> (index, amount, note)
+    for index, item in enumerate(items):
+        parsed = _mark_paid_item(item)
+        result = {'index': index}
+        if isinstance(parsed, str):
+            result.update(status='invalid', detail=parsed)
+        else:
+            key, amount, note = parsed
+            result.update(campaign_id=key[0], parent_id=key[1])
+            if key in wanted:
+                result.update(status='conflict', detail=f'duplicate of item {wanted[key][0]}')
+            else:
+                wanted[key] = (index, amount, note)
+        results.append(result)
+
+    async with get_async_db() as session:
+        if wanted:
+            stmt = (
+                sa_select(Contribution.id, Contribution.campaign_id, Contribution.parent_id,
+                          Contribution.status, Contribution.amount_expected, Contribution.amount_paid)
+                .where(tuple_(Contribution.campaign_id, Contribution.parent_id).in_(list(wanted)))
+                .with_for_update()
+            )
+            found = {(r.campaign_id, r.parent_id): r for r in (await session.execute(stmt)).all()}
+            updates = []
+            totals = TotalsDelta()
+            for key, (index, amount, note) in wanted.items():
+                row, result = found.get(key), results[index]
+                if row is None:
+                    result['status'] = 'not_found'
+                elif row.status == 'paid' and abs((row.amount_paid or 0) - amount) >= 0.005:
+                    result.update(status='conflict', contribution_id=row.id,
+                                  detail='already paid with a different amount')
+                else:
+                    result.update(status='updated', contribution_id=row.id)
+                    updates.append({'id': row.id, 'amount_paid': amount, 'note': note})
+                    totals.change(row.campaign_id, (row.status, row.amount_expected, row.amount_paid),
+                                  ('paid', row.amount_expected, amount))
+            if updates:
+                await session.execute(bulk_update_by_id(
+                    session, Contribution.__table__, updates, status='paid', paid_at=datetime.utcnow(),
+                ))
+                await totals.apply(session)
+            await session.commit()
+
+    counts = Counter(r['status'] for r in results)
+    return {
+        'updated': counts['updated'],
+        'not_found': counts['not_found'],
+        'conflict': counts['conflict'],
+        'invalid': counts['invalid'],
+        'results': results,
+    }
+
+
+@router.post('/bank-statements/match')
+async def match_bank_statement(request: Request, campaign_id: Optional[int] = None, min_confidence: float = 0.5):
+    """Propose contributions paid by the incoming transfers of a CSV bank statement.
+
+    The body is read chunk by chunk into the statement parser; pending
+    contributions of open campaigns (optionally one campaign) are loaded with
+    a single query into an in-memory index. Nothing is written: each proposal
+    carries a ``mark_paid`` item for ``/contributions/mark-paid/batch``.
+    """
+    if not 0 <= min_confidence <= 1:
+        raise HTTPException(status_code=400, detail='min_confidence must be between 0 and 1')
+    stmt = (
+        sa_select(Contribution.id, Contribution.campaign_id, Contribution.parent_id, Contribution.amount_expected,
+                  Parent.email, Parent.pupil_id, Parent.name)
+        .join(Parent, Parent.id == Contribution.parent_id)
+        .join(Campaign, Campaign.id == Contribution.campaign_id)
+        .where(
+            or_(Contribution.status.is_(None), Contribution.status != 'paid'),
+            Campaign.deleted_at.is_(None),
+            Campaign.is_closed == False,
+        )
+    )
+    if campaign_id is not None:
+        stmt = stmt.where(Contribution.campaign_id == campaign_id)
+    async with get_async_db() as session:
+        pending = [PendingContribution(*row) for row in (await session.execute(stmt)).all()]
+
+    parser = StatementParser()
+    transfers = []
+
+    def finish():
+        transfers.extend(parser.close())
+        return match_transfers(ContributionIndex.build(pending), transfers, min_confidence)
+
+    # parsing is CPU work too: each chunk is parsed in the threadpool as it
+    # arrives, one at a time, so a large statement never blocks the event loop
+    try:
+        async for chunk in request.stream():
+            transfers += await run_in_threadpool(parser.feed, chunk)
+        result = await run_in_threadpool(finish)
+    except StatementFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {
+        'summary': {
+            'rows': parser.rows,
+            'incoming': len(transfers),
+            'skipped': parser.skipped,
+            'proposed': len(result['proposals']),
+            'unmatched': len(result['unmatched']),
+            'pending_contributions': len(pending),
+        },
+        **result,
+    }
+
+
+def _contributions_stmt():
+    # one pass over active campaigns -> contributions -> parents, ordered so
+    # rows for a campaign arrive together and can be grouped while streaming
+    return (
+        sa_select(
+            Campaign.id.label('campaign_id'),
+            Campaign.title,
+            Campaign.target_amount,
+            Contribution.id,
+            Contribution.parent_id,
+            Parent.email.label('parent_email'),
+            Parent.name.label('parent_name'),
+            Contribution.amount_expected,
+            Contribution.amount_paid,
+            Contribution.status,
+            Contribution.paid_at,
+            Contribution.note,
+        )
+        .select_from(Campaign)
+        .outerjoin(Contribution, Contribution.campaign_id == Campaign.id)
+        .outerjoin(Parent, Parent.id == Contribution.parent_id)
+        .where(Campaign.active == True, Campaign.deleted_at == None)
+        .order_by(Campaign.id, Contribution.id)
+    )
+
+
+def _contribution_row(row):
+    if row.id is None:
+        return None
+    return {
+        'id': row.id,
+        'parent_id': row.parent_id,
+        'parent_email': row.parent_email,
+        'parent_name': row.parent_name,
+        'amount_expected': row.amount_expected,
+        'amount_paid': row.amount_paid,
+        'status': row.status,
+        'paid_at': row.paid_at,
+        'note': row.note,
+    }
+
+
+async def _stream_contributions(ndjson: bool):
+    async with get_async_db() as session:
+        result = await session.stream(_contributions_stmt())
+        if ndjson:
+            async for row in result:
+                campaign = {'id': row.campaign_id, 'title': row.title, 'target_amount': row.target_amount}
+                yield json_dumps({'campaign': campaign, 'contribution': _contribution_row(row)}) + '\n'
+            return
+
+        yield '['
+        current = None
+        first_item = True
+        async for row in result:
+            if row.campaign_id != current:
+                if current is not None:
+                    yield ']},'
+                current = row.campaign_id
+                first_item = True
+                campaign = {'id': row.campaign_id, 'title': row.title, 'target_amount': row.target_amount}
+                yield '{"campaign":' + json_dumps(campaign) + ',"contributions":['
+            item = _contribution_row(row)
+            if item is None:
+                continue
+            yield ('' if first_item else ',') + json_dumps(item)
+            first_item = False
+        if current is not None:
+            yield ']}'
+        yield ']'
+
+
 @router.get('/contributions')
-def list_contributions():
-    # Return active campaigns with their contributions and parent info
-    with get_db() as session:
-        stmt = select(Campaign).where(Campaign.active == True)
-        camps = session.exec(stmt).all()
-        results = []
-        for c in camps:
-            stmt2 = select(Contribution).where(Contribution.campaign_id == c.id)
-            contribs = session.exec(stmt2).all()
-            contribs_out = []
-            for co in contribs:
-                stmtp = select(Parent).where(Parent.id == co.parent_id)
-                p = session.exec(stmtp).first()
-                contribs_out.append({
-                    'id': co.id,
-                    'parent_id': co.parent_id,
-                    'parent_email': p.email if p else None,
-                    'parent_name': p.name if p else None,
-                    'amount_expected': co.amount_expected,
-                    'amount_paid': co.amount_paid,
-                    'status': co.status,
-                    'paid_at': co.paid_at,
-                    'note': co.note,
-                })
-            results.append({'campaign': {'id': c.id, 'title': c.title, 'target_amount': c.target_amount}, 'contributions': contribs_out})
-        return results
-
-
-# New: per-campaign roster (list parents + contribution if any)
+async def list_contributions(format: str = 'json'):
+    """Active campaigns with their contributions and parent info.
+
+    Served from a single JOIN and streamed as it is read, so memory stays flat
+    regardless of roster size. ``format=ndjson`` emits one line per
+    contribution (campaign fields inlined) for large exports.
+    """
+    if format not in ('json', 'ndjson'):
+        raise HTTPException(status_code=400, detail='format must be json or ndjson')
+    ndjson = format == 'ndjson'
+    media_type = NDJSON_MEDIA_TYPE if ndjson else 'application/json'
+    return StreamingResponse(coalesce(_stream_contributions(ndjson)), media_type=media_type)
+
+
+def _roster_filters(include_hidden, hidden, status, unpaid_only, q):
+    """WHERE clauses shared by the roster page and its summary."""
+    filters = []
+    if hidden is not None:
+        filters.append(Parent.is_hidden == hidden)
+    elif not include_hidden:
+        filters.append(Parent.is_hidden == False)
+    if status == 'none':
+        filters.append(Contribution.id.is_(None))
+    elif status:
+        filters.append(Contribution.status == status)
+    if unpaid_only:
+        filters.append(or_(Contribution.id.is_(None), func.coalesce(Contribution.status, 'pending') != 'paid'))
+    if q:
+        prefix = q.strip().lower()
+        filters.append(or_(
+            func.lower(Parent.name).startswith(prefix, autoescape=True),
+            func.lower(Parent.email).startswith(prefix, autoescape=True),
+        ))
+    return filters
+
+
+def _roster_join(campaign_id):
+    return Parent.__table__.outerjoin(
+        Contribution.__table__,
+        and_(Contribution.campaign_id == campaign_id, Contribution.parent_id == Parent.id),
+    )
+
+
+# Per-campaign roster: every parent LEFT JOINed to its contribution (if any)
 @router.get('/campaigns/{campaign_id}/roster')
-def campaign_roster(campaign_id: int, include_hidden: bool = False):
-    with get_db() as session:
-        # load campaign
-        c = session.get(Campaign, campaign_id)
+async def campaign_roster(
+    campaign_id: int,
+    include_hidden: bool = False,
+    hidden: Optional[bool] = None,
+    status: Optional[str] = None,
+    unpaid_only: bool = False,
+    q: Optional[str] = None,
+    after_parent_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
+    """Roster page plus totals for the whole filtered set.
+
+    Filters: ``hidden`` (true/false, overrides ``include_hidden``), contribution
+    ``status`` (``none`` = no contribution yet), ``unpaid_only`` and ``q`` as a
+    case-insensitive name/email prefix. Pages are keyset-based: pass the
+    returned ``next_after_parent_id`` as ``after_parent_id``; without ``limit``
+    the whole roster is returned.
+    """
+    filters = _roster_filters(include_hidden, hidden, status, unpaid_only, q)
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
         if not c:
             raise HTTPException(status_code=404, detail='campaign not found')
 
-        # build parent list with LEFT JOIN to contributions for this campaign
-        # simple approach: query all parents and then per-parent contribution
-        if include_hidden:
-            stmtp = select(Parent)
-        else:
-            try:
-                stmtp = select(Parent).where(Parent.is_hidden == False)
-            except Exception:
-                stmtp = select(Parent)
-
-        parents = session.exec(stmtp).all()
-        rows = []
-        for p in parents:
-            stmtc = select(Contribution).where(Contribution.campaign_id == campaign_id, Contribution.parent_id == p.id)
-            contrib = session.exec(stmtc).first()
-            rows.append({
-                'parent_id': p.id,
-                'parent_name': p.name,
-                'parent_email': p.email,
-                'contribution': None if not contrib else {
-                    'id': contrib.id,
-                    'amount_expected': contrib.amount_expected,
-                    'amount_paid': contrib.amount_paid,
-                    'status': contrib.status,
-                    'paid_at': contrib.paid_at,
-                    'note': contrib.note,
-                }
-            })
-
-        return {'campaign': {'id': c.id, 'title': c.title, 'target_amount': c.target_amount}, 'rows': rows}
+        page_stmt = (
+            sa_select(
+                Parent.id.label('parent_id'),
+                Parent.name.label('parent_name'),
+                Parent.email.label('parent_email'),
+                Contribution.id.label('contribution_id'),
+                Contribution.amount_expected,
+                Contribution.amount_paid,
+                Contribution.status,
+                Contribution.paid_at,
+                Contribution.note,
+            )
+            .select_from(_roster_join(campaign_id))
+            .where(*filters)
+            .order_by(Parent.id)
+        )
+        if after_parent_id is not None:
+            page_stmt = page_stmt.where(Parent.id > after_parent_id)
+        if limit is not None:
+            # one extra row tells us whether another page exists
+            page_stmt = page_stmt.limit(limit + 1)
+        page = (await session.execute(page_stmt)).all()
+
+        summary_stmt = (
+            sa_select(
+                func.count(Parent.id),
+                func.count(Contribution.id),
+                func.coalesce(func.sum(case((Contribution.status == 'paid', 1), else_=0)), 0),
+                func.coalesce(func.sum(Contribution.amount_expected), 0.0),
+                func.coalesce(func.sum(Contribution.amount_paid), 0.0),
+            )
+            .select_from(_roster_join(campaign_id))
+            .where(*filters)
+        )
+        total_parents, with_contribution, paid_count, expected_total, paid_total = (await session.execute(summary_stmt)).one()
+
+    next_after = None
+    if limit is not None and len(page) > limit:
+        page = page[:limit]
+        next_after = page[-1].parent_id
+
+    rows = [{
+        'parent_id': r.parent_id,
+        'parent_name': r.parent_name,
+        'parent_email': r.parent_email,
+        'contribution': None if r.contribution_id is None else {
+            'id': r.contribution_id,
+            'amount_expected': r.amount_expected,
+            'amount_paid': r.amount_paid,
+            'status': r.status,
+            'paid_at': r.paid_at,
+            'note': r.note,
+        }
+    } for r in page]
+
+    return {
+        'campaign': {'id': c.id, 'title': c.title, 'target_amount': c.target_amount},
+        'rows': rows,
+        'next_after_parent_id': next_after,
+        'summary': {
+            'parents': total_parents,
+            'with_contribution': with_contribution,
+            'paid': paid_count,
+            'unpaid': total_parents - paid_count,
+            'amount_expected': float(expected_total),
+            'amount_paid': float(paid_total),
+        },
+    }
+
+
+# --- Streamed exports (CSV / XLSX) ---
+
+EXPORT_BATCH_ROWS = 500
+
+ROSTER_EXPORT_COLUMNS = (
+    'parent_id', 'parent_name', 'parent_email', 'pupil_id', 'contribution_id',
+    'amount_expected', 'amount_paid', 'status', 'paid_at', 'note',
+)
+PAYMENTS_EXPORT_COLUMNS = (
+    'paid_at', 'campaign_id', 'campaign_title', 'parent_id', 'parent_name', 'parent_email', 'pupil_id',
+    'contribution_id', 'amount_expected', 'amount_paid', 'note',
+)
+
+
+async def _export_batches(stmt):
+    # server-side cursor where the driver has one; rows arrive in
+    # EXPORT_BATCH_ROWS partitions and only one partition is held at a time
+    async with get_async_db() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_BATCH_ROWS))
+        async for batch in result.partitions():
+            yield batch
+
+
+def _export_response(format: str, header, stmt, filename: str, sheet_name: str):
+    if format == 'csv':
+        body = stream_csv(header, _export_batches(stmt))
+    else:
+        body = stream_xlsx(header, _export_batches(stmt), sheet_name=sheet_name)
+    return StreamingResponse(
+        body,
+        media_type=FORMATS[format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{format}"'},
+    )
+
+
+def _check_export_format(format: str):
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail='format must be csv or xlsx')
+
+
+@router.get('/campaigns/{campaign_id}/export')
+async def export_campaign_roster(
+    campaign_id: int,
+    format: str = 'csv',
+    include_hidden: bool = False,
+    hidden: Optional[bool] = None,
+    status: Optional[str] = None,
+    unpaid_only: bool = False,
+    q: Optional[str] = None,
+):
+    """The campaign roster as a CSV or XLSX download, with the roster filters.
+
+    Rows are streamed from the database in batches straight into the file,
+    so memory use does not grow with the number of parents.
+    """
+    _check_export_format(format)
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
+        if not c:
+            raise HTTPException(status_code=404, detail='campaign not found')
+    stmt = (
+        sa_select(
+            Parent.id, Parent.name, Parent.email, Parent.pupil_id, Contribution.id,
+            Contribution.amount_expected, Contribution.amount_paid, Contribution.status,
+            Contribution.paid_at, Contribution.note,
+        )
+        .select_from(_roster_join(campaign_id))
+        .where(*_roster_filters(include_hidden, hidden, status, unpaid_only, q))
+        .order_by(Parent.id)
+    )
+    return _export_response(format, ROSTER_EXPORT_COLUMNS, stmt, f'zbiorka-{campaign_id}', c.title or 'Zbiórka')
+
+
+@router.get('/payments/export')
+async def export_payment_history(format: str = 'csv'):
+    """Every paid contribution across all campaigns (closed and deleted too), oldest first."""
+    _check_export_format(format)
+    stmt = (
+        sa_select(
+            Contribution.paid_at, Campaign.id, Campaign.title, Parent.id, Parent.name, Parent.email,
+            Parent.pupil_id, Contribution.id, Contribution.amount_expected, Contribution.amount_paid,
+            Contribution.note,
+        )
+        .select_from(Contribution)
+        .join(Campaign, Campaign.id == Contribution.campaign_id)
+        .join(Parent, Parent.id == Contribution.parent_id)
+        .where(Contribution.status == 'paid')
+        .order_by(Contribution.paid_at, Contribution.id)
+    )
+    return _export_response(format, PAYMENTS_EXPORT_COLUMNS, stmt, 'wplaty', 'Wpłaty')
 
 
 # New: allow admin to create a contribution record for (campaign, parent)
 @router.post('/contributions')
-def admin_create_contribution(payload: dict):
+async def admin_create_contribution(payload: dict):
     cid = payload.get('campaign_id')
     pid = payload.get('parent_id')
     amount_expected = payload.get('amount_expected')
     if not cid or not pid:
         raise HTTPException(status_code=400, detail='campaign_id and parent_id required')
-    with get_db() as session:
+    async with get_async_db() as session:
         # ensure campaign and parent exist
-        camp = session.get(Campaign, cid)
-        parent = session.get(Parent, pid)
+        camp = await session.get(Campaign, cid)
+        parent = await session.get(Parent, pid)
         if not camp or not parent:
             raise HTTPException(status_code=404, detail='campaign or parent not found')
         # if contribution exists, return it (idempotent)
         stmt = select(Contribution).where(Contribution.campaign_id == cid, Contribution.parent_id == pid)
-        existing = session.exec(stmt).first()
+        existing = (await session.exec(stmt)).first()
         if existing:
             return existing
         c = Contribution(campaign_id=cid, parent_id=pid, amount_expected=amount_expected or 0.0, amount_paid=0.0, status='pending')
         session.add(c)
-        session.commit()
-        session.refresh(c)
+        await record_change(session, cid, None, (c.status, c.amount_expected, c.amount_paid))
+        await session.commit()
+        await session.refresh(c)
         return c
 
 
+def _bulk_assign_insert(session, campaign_id: int, amount_expected: float, filters):
+    """INSERT ... SELECT of a pending contribution for every parent matching ``filters``."""
+    table = Contribution.__table__
+    # typed: asyncpg binds untyped, and Postgres would read the constants as text
+    source = sa_select(
+        cast(literal(campaign_id), table.c.campaign_id.type),
+        Parent.id,
+        cast(literal(amount_expected), table.c.amount_expected.type),
+        cast(literal(0.0), table.c.amount_paid.type),
+        cast(literal('pending'), table.c.status.type),
+    ).where(*filters)
+    return (
+        insert_for(session, table)
+        .from_select(['campaign_id', 'parent_id', 'amount_expected', 'amount_paid', 'status'], source)
+        .on_conflict_do_nothing(index_elements=['campaign_id', 'parent_id'])
+    )
+
+
+def _bulk_assign_counts(session, campaign_id: int, amount_expected: float, filters):
+    """Postgres: one statement inserting and counting ``(matched, created)`` in one snapshot."""
+    created = _bulk_assign_insert(session, campaign_id, amount_expected, filters).returning(
+        Contribution.__table__.c.id
+    ).cte('created')
+    return sa_select(
+        sa_select(func.count()).select_from(Parent).where(*filters).scalar_subquery(),
+        sa_select(func.count()).select_from(created).scalar_subquery(),
+    )
+
+
+@router.post('/campaigns/{campaign_id}/contributions/bulk')
+async def admin_bulk_assign_contributions(campaign_id: int, payload: dict):
+    """Create a pending contribution for every matching parent in one statement.
+
+    Payload (all optional): ``amount_expected`` (default 0), ``pupil_id_prefix``,
+    ``parent_ids``, ``include_hidden``. Parents that already have a
+    contribution for the campaign are left untouched, so the call is
+    idempotent; the response says how many were created and skipped.
+    """
+    amount_expected = payload.get('amount_expected')
+    if amount_expected is None:
+        amount_expected = 0.0
+    pupil_id_prefix = payload.get('pupil_id_prefix')
+    parent_ids = payload.get('parent_ids')
+    include_hidden = bool(payload.get('include_hidden', False))
+    # bool is an int subclass: True must not pass as 1
+    if isinstance(amount_expected, bool) or not isinstance(amount_expected, (int, float)) or amount_expected < 0:
+        raise HTTPException(status_code=400, detail='amount_expected must be a non-negative number')
+    if parent_ids is not None and not (
+        isinstance(parent_ids, list) and all(isinstance(i, int) and not isinstance(i, bool) for i in parent_ids)
+    ):
+        raise HTTPException(status_code=400, detail='parent_ids must be a list of integers')
+
+    filters = []
+    if not include_hidden:
+        filters.append(Parent.is_hidden == False)
+    if pupil_id_prefix:
+        filters.append(Parent.pupil_id.startswith(pupil_id_prefix, autoescape=True))
+    if parent_ids is not None:
+        filters.append(Parent.id.in_(parent_ids))
+    if not filters:
+        # SQLite needs a WHERE before ON CONFLICT in INSERT ... SELECT
+        filters.append(Parent.id.isnot(None))
+
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
+        if not c or c.deleted_at is not None:
+            raise HTTPException(status_code=404, detail='campaign not found')
+        if c.is_closed:
+            raise HTTPException(status_code=409, detail='campaign is closed')
+
+        # "matched" must describe the rows the insert selected, or skipped
+        # (matched - created) is off when parents change concurrently
+        if dialect_name(session) == 'postgresql':
+            # the counting subquery and the insert share the statement's snapshot
+            stmt = _bulk_assign_counts(session, campaign_id, float(amount_expected), filters)
+            matched, created = (await session.execute(stmt)).one()
+        else:
+            # SQLite: the insert takes the write lock first, so no other writer
+            # can change parents before the count in the same transaction
+            stmt = _bulk_assign_insert(session, campaign_id, float(amount_expected), filters)
+            created = max((await session.execute(stmt)).rowcount or 0, 0)
+            matched = (await session.execute(sa_select(func.count()).select_from(Parent).where(*filters))).scalar_one()
+        # every created row is identical, so the totals change is known
+        # without reading them back
+        totals = TotalsDelta()
+        totals.add(campaign_id, contributions=created, pending_count=created,
+                   expected_sum=created * float(amount_expected))
+        await totals.apply(session)
+        await session.commit()
+        return {
+            'campaign_id': campaign_id,
+            'matched': matched,
+            'created': created,
+            'skipped': matched - created,
+        }
+
+
 # --- Admin management endpoints (parents + campaigns) ---
 
 
 @router.get('/parents')
-def admin_list_parents(include_hidden: bool = False):
+async def admin_list_parents(include_hidden: bool = False):
     """Return parents; by default exclude hidden parents unless include_hidden=true"""
-    with get_db() as session:
+    async with get_async_db() as session:
         if include_hidden:
             stmt = select(Parent)
         else:
@@ -304,49 +809,61 @@ def admin_list_parents(include_hidden: bool = False):
                 stmt = select(Parent).where(Parent.is_hidden == False)
             except Exception:
                 stmt = select(Parent)
-        parents = session.exec(stmt).all()
+        parents = (await session.exec(stmt)).all()
         return parents
 
 
 @router.put('/parents/{parent_id}')
-def admin_update_parent(parent_id: int, payload: dict):
-    with get_db() as session:
-        p = session.get(Parent, parent_id)
+async def admin_update_parent(parent_id: int, payload: dict):
+    async with get_async_db() as session:
+        p = await session.get(Parent, parent_id)
         if not p:
             raise HTTPException(status_code=404, detail='parent not found')
         # allow updating name and email
         name = payload.get('name')
         email = payload.get('email')
-        if email:
+        if email and email != p.email:
+            stmt = select(Parent.id).where(func.lower(Parent.email) == email.lower(), Parent.id != parent_id)
+            if (await session.exec(stmt)).first() is not None:
+                raise HTTPException(status_code=400, detail='parent already exists')
             p.email = email
+            # tokens name the parent by email; revoke the ones issued before
+            p.credentials_version = (p.credentials_version or 0) + 1
         if name:
             p.name = name
         session.add(p)
-        session.commit()
-        session.refresh(p)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # another parent took the email concurrently (uq_parent_email_lower)
+            await session.rollback()
+            raise HTTPException(status_code=409, detail='parent already exists')
+        await session.refresh(p)
+        parent_identity_cache.invalidate(p.id)
         return p
 
 
 @router.post('/parents/{parent_id}/change-password')
-def admin_change_parent_password(parent_id: int, payload: dict):
+async def admin_change_parent_password(parent_id: int, payload: dict):
     new_password = payload.get('new_password')
     if not new_password:
         raise HTTPException(status_code=400, detail='new_password required')
-    from ..auth import hash_password
-    with get_db() as session:
-        p = session.get(Parent, parent_id)
+    async with get_async_db() as session:
+        p = await session.get(Parent, parent_id)
         if not p:
             raise HTTPException(status_code=404, detail='parent not found')
-        p.password_hash = hash_password(new_password)
+        p.password_hash = await hash_password_async(new_password)
+        p.credentials_version = (p.credentials_version or 0) + 1
         session.add(p)
-        session.commit()
+        await session.commit()
+        parent_identity_cache.invalidate(parent_id)
         return {'status': 'ok'}
 
 
 @router.post('/parents/{parent_id}/hide')
-def admin_hide_parent(parent_id: int):
-    with get_db() as session:
-        p = session.get(Parent, parent_id)
+async def admin_hide_parent(parent_id: int):
+    async with get_async_db() as session:
+        p = await session.get(Parent, parent_id)
         if not p:
             raise HTTPException(status_code=404, detail='parent not found')
         try:
@@ -355,15 +872,15 @@ def admin_hide_parent(parent_id: int):
             # older DB without column: best effort - ignore
             pass
         session.add(p)
-        session.commit()
-        session.refresh(p)
+        await session.commit()
+        await session.refresh(p)
         return p
 
 
 @router.post('/parents/{parent_id}/unhide')
-def admin_unhide_parent(parent_id: int):
-    with get_db() as session:
-        p = session.get(Parent, parent_id)
+async def admin_unhide_parent(parent_id: int):
+    async with get_async_db() as session:
+        p = await session.get(Parent, parent_id)
         if not p:
             raise HTTPException(status_code=404, detail='parent not found')
         try:
@@ -371,15 +888,15 @@ def admin_unhide_parent(parent_id: int):
         except Exception:
             pass
         session.add(p)
-        session.commit()
-        session.refresh(p)
+        await session.commit()
+        await session.refresh(p)
         return p
 
 
 @router.put('/campaigns/{campaign_id}')
-def admin_update_campaign(campaign_id: int, payload: dict):
-    with get_db() as session:
-        c = session.get(Campaign, campaign_id)
+async def admin_update_campaign(campaign_id: int, payload: dict):
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
         if not c:
             raise HTTPException(status_code=404, detail='campaign not found')
         # If campaign is closed, don't allow editing certain fields
@@ -396,15 +913,16 @@ def admin_update_campaign(campaign_id: int, payload: dict):
             if k in payload:
                 setattr(c, k, payload[k])
         session.add(c)
-        session.commit()
-        session.refresh(c)
+        await session.commit()
+        response_cache.bump(CAMPAIGNS)
+        await session.refresh(c)
         return c
 
 
 @router.post('/campaigns/{campaign_id}/close')
-def admin_close_campaign(campaign_id: int):
-    with get_db() as session:
-        c = session.get(Campaign, campaign_id)
+async def admin_close_campaign(campaign_id: int):
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
         if not c:
             raise HTTPException(status_code=404, detail='campaign not found')
         try:
@@ -413,15 +931,16 @@ def admin_close_campaign(campaign_id: int):
             # if DB doesn't have this field, ignore
             pass
         session.add(c)
-        session.commit()
-        session.refresh(c)
+        await session.commit()
+        response_cache.bump(CAMPAIGNS)
+        await session.refresh(c)
         return {'status': 'closed'}
 
 
 @router.delete('/campaigns/{campaign_id}')
-def admin_delete_campaign(campaign_id: int):
-    with get_db() as session:
-        c = session.get(Campaign, campaign_id)
+async def admin_delete_campaign(campaign_id: int):
+    async with get_async_db() as session:
+        c = await session.get(Campaign, campaign_id)
         if not c:
             raise HTTPException(status_code=404, detail='campaign not found')
         # soft-delete if supported
@@ -431,6 +950,157 @@ def admin_delete_campaign(campaign_id: int):
             session.add(c)
         except Exception:
             # fallback hard delete
-            session.delete(c)
-        session.commit()
+            await session.delete(c)
+        await session.commit()
+        response_cache.bump(CAMPAIGNS)
         return {'status': 'deleted'}
+
+
+# --- Campaign totals consistency ---
+
+
+@router.get('/campaigns/progress')
+async def admin_campaigns_progress(active: Optional[bool] = True):
+    """Listed campaigns with their contribution totals, one row per campaign.
+
+    Reads the maintained ``campaigntotals`` rows instead of aggregating
+    contributions; ``progress`` is the paid sum over ``target_amount``.
+    """
+    totals = [func.coalesce(getattr(CampaignTotals, column), 0).label(column) for column in (
+        'contributions', 'pending_count', 'paid_count', 'expected_sum', 'paid_sum')]
+    stmt = (
+        sa_select(Campaign.id, Campaign.title, Campaign.target_amount, Campaign.due_date, Campaign.is_closed, *totals)
+        .outerjoin(CampaignTotals, CampaignTotals.campaign_id == Campaign.id)
+        .where(Campaign.deleted_at == None)
+        .order_by(Campaign.id)
+    )
+    if active is not None:
+        stmt = stmt.where(Campaign.active == active)
+    async with get_async_db() as session:
+        rows = (await session.execute(stmt)).all()
+    return [
+        {
+            'campaign_id': r.id,
+            'title': r.title,
+            'target_amount': r.target_amount,
+            'due_date': r.due_date,
+            'is_closed': r.is_closed,
+            'contributions': r.contributions,
+            'pending_count': r.pending_count,
+            'paid_count': r.paid_count,
+            'expected_sum': float(r.expected_sum),
+            'paid_sum': float(r.paid_sum),
+            'progress': round(r.paid_sum / r.target_amount, 4) if r.target_amount else None,
+        }
+        for r in rows
+    ]
+
+
+@router.get('/campaign-totals/check')
+async def admin_check_campaign_totals():
+    """Compare the maintained campaign totals with a fresh aggregate of contributions."""
+    async with get_async_db() as session:
+        mismatches = await check_campaign_totals(session)
+    return {'ok': not mismatches, 'mismatches': mismatches}
+
+
+@router.post('/campaign-totals/rebuild')
+async def admin_rebuild_campaign_totals():
+    """Recompute every campaign's totals from its contributions."""
+    async with get_async_db() as session:
+        rebuilt = await rebuild_campaign_totals(session)
+        await session.commit()
+    return {'rebuilt': rebuilt}
+
+
+# --- Email outbox ---
+
+
+def _outbox_item(m: EmailOutbox) -> dict:
+    # payload is never exposed: it may hold a temporary password
+    return {
+        'id': m.id,
+        'kind': m.kind,
+        'to_email': m.to_email,
+        'parent_id': m.parent_id,
+        'status': m.status,
+        'attempts': m.attempts,
+        'next_attempt_at': m.next_attempt_at,
+        'last_error': m.last_error,
+        'created_at': m.created_at,
+        'sent_at': m.sent_at,
+    }
+
+
+@router.get('/outbox')
+async def admin_list_outbox(
+    status: Optional[str] = None,
+    parent_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Per-message delivery status (newest first) plus counts per status."""
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail='invalid status')
+    async with get_async_db() as session:
+        stmt = select(EmailOutbox).order_by(EmailOutbox.id.desc()).limit(limit)
+        if status is not None:
+            stmt = stmt.where(EmailOutbox.status == status)
+        if parent_id is not None:
+            stmt = stmt.where(EmailOutbox.parent_id == parent_id)
+        messages = (await session.exec(stmt)).all()
+        counts_stmt = sa_select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status)
+        counts = {s: 0 for s in STATUSES}
+        counts.update({s: n for s, n in (await session.execute(counts_stmt)).all()})
+        return {'items': [_outbox_item(m) for m in messages], 'counts': counts}
+
+
+@router.post('/outbox/{message_id}/retry')
+async def admin_retry_outbox(
+    message_id: int,
+    background_tasks: BackgroundTasks,
+    email_client=Depends(_get_email_client),
+):
+    async with get_async_db() as session:
+        m = await session.get(EmailOutbox, message_id)
+        if not m:
+            raise HTTPException(status_code=404, detail='message not found')
+        if m.status not in (DEAD, PENDING):
+            raise HTTPException(status_code=409, detail=f'message is {m.status}')
+        requeue(session, m)
+        await session.commit()
+        background_tasks.add_task(drain_outbox, email_client, ids=[m.id])
+        return _outbox_item(m)
+
+
+# --- Diagnostics ---
+
+
+@router.get('/debug/slow-queries')
+async def admin_slow_queries(limit: int = Query(50, ge=1, le=1000)):
+    """Newest statements over SLOW_QUERY_THRESHOLD_MS with their plans (``None`` while pending)."""
+    return {
+        'threshold_ms': get_settings().slow_query_threshold_ms,
+        'entries': slow_query_log.entries(limit),
+    }
+
+
+@router.get('/debug/profiles')
+async def admin_profiles():
+    """Saved request profiles, newest first (see ProfilingMiddleware)."""
+    return {'items': await run_in_threadpool(profile_store.list)}
+
+
+@router.get('/debug/profiles/{profile_id}')
+async def admin_profile(profile_id: str, format: str = Query('pstats'), limit: int = Query(60, ge=1, le=1000)):
+    """A profile as a pstats dump (``snakeviz``, ``python -m pstats``) or as a text report."""
+    if format not in ('pstats', 'text'):
+        raise HTTPException(status_code=400, detail='unsupported format')
+    path = profile_store.pstats_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail='profile not found')
+    if format == 'pstats':
+        return FileResponse(path, media_type='application/octet-stream', filename=f'{profile_id}.prof')
+    report = await run_in_threadpool(profile_store.report, profile_id, limit)
+    if report is None:
+        raise HTTPException(status_code=404, detail='profile not found')
+    return PlainTextResponse(report)
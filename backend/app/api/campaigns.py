@@ -1,21 +1,33 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from typing import List, Optional
 from ..models import Campaign, CampaignCreate
+from ..cache import CAMPAIGNS, response_cache
 from ..db import get_db
+from ..http_cache import conditional_response
 from sqlmodel import Session, select
 from ..models import Contribution, Parent
 
 router = APIRouter()
 
 
-@router.get("/", response_model=List[Campaign])
-def list_campaigns(active: Optional[bool] = True):
+def _campaign_list(active: Optional[bool]) -> list:
     with get_db() as session:
-        stmt = select(Campaign)
+        # soft-deleted campaigns are never listed
+        stmt = select(Campaign).where(Campaign.deleted_at == None)
         if active is not None:
             stmt = stmt.where(Campaign.active == active)
-        results = session.exec(stmt).all()
-        return results
+        return [c.dict() for c in session.exec(stmt).all()]
+
+
+@router.get("/", response_model=List[Campaign])
+def list_campaigns(request: Request, active: Optional[bool] = True):
+    """Served from the response cache; campaign writes bump its version.
+
+    A cached body carries its ETag, so a matching ``If-None-Match`` is
+    answered with 304 without touching the database.
+    """
+    body, etag, hit = response_cache.get_or_build(CAMPAIGNS, f"list:active={active}", lambda: _campaign_list(active))
+    return conditional_response(request, body, etag, "public, no-cache", headers={"X-Cache": "hit" if hit else "miss"})
 
 
 @router.post("/", response_model=Campaign)
@@ -24,6 +36,7 @@ def create_campaign(payload: CampaignCreate):
         c = Campaign.from_orm(payload)
         session.add(c)
         session.commit()
+        response_cache.bump(CAMPAIGNS)
         session.refresh(c)
         return c
 
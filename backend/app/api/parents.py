@@ -1,13 +1,27 @@
 import logging
+from collections import Counter
+from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Request
+from sqlalchemy import and_, func, insert, or_, select as sa_select
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import select
 
-from ..auth import hash_password, verify_password, create_token, decode_token
-from ..db import get_db
+from ..auth import (
+    create_token,
+    decode_token,
+    hash_password_async,
+    verify_and_update_password_async,
+    verify_password_async,
+)
+from ..campaign_totals import record_change
+from ..db_async import get_async_db
 from ..email import GmailEmailClient, gmail_client
-from ..models import Parent, Campaign, Contribution
-from ..utils import generate_readable_password
+from ..http_cache import conditional_json
+from ..identity_cache import ParentIdentity, parent_identity_cache
+from ..models import EmailOutbox, Parent, Campaign, Contribution
+from ..outbox import drain_outbox, enqueue_temporary_password, temporary_password_row
+from ..parent_import import ImportFormatError, parse_parents_csv
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -18,9 +32,10 @@ def _get_email_client() -> GmailEmailClient:
 
 
 @router.post('/admin/parents')
-def admin_create_parent(
+async def admin_create_parent(
     payload: dict,
     request: Request,
+    background_tasks: BackgroundTasks,
     email_client: GmailEmailClient = Depends(_get_email_client),
 ):
     user = getattr(request.state, 'user', None)
@@ -32,50 +47,145 @@ def admin_create_parent(
     if not email:
         raise HTTPException(status_code=400, detail='email required')
 
-    temporary_password = generate_readable_password(length=10)
-
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == email)
-        existing = session.exec(stmt).first()
+    async with get_async_db() as session:
+        # emails are unique case-insensitively (uq_parent_email_lower)
+        stmt = select(Parent).where(func.lower(Parent.email) == email.lower())
+        existing = (await session.exec(stmt)).first()
         if existing:
             raise HTTPException(status_code=400, detail='parent already exists')
-        parent = Parent(
-            name=name,
-            email=email,
-            password_hash=hash_password(temporary_password),
-            force_password_change=True,
-        )
+        # no password until the invitation is sent: the outbox issues it
+        parent = Parent(name=name, email=email, force_password_change=True)
         session.add(parent)
         try:
-            email_client.send_temporary_password_email(email, temporary_password, parent_name=name)
-        except Exception:
-            session.rollback()
-            logger.exception('Nie udało się wysłać tymczasowego hasła do %s', email)
-            raise HTTPException(status_code=500, detail='failed to send temporary password email')
-        session.commit()
-        session.refresh(parent)
-        return {"id": parent.id, "name": parent.name, "email": parent.email}
+            await session.flush()
+            # the email is committed with the parent and sent after the response;
+            # failures are retried by the outbox worker (app/outbox.py)
+            message = enqueue_temporary_password(session, parent)
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            raise HTTPException(status_code=409, detail='parent already exists')
+        background_tasks.add_task(drain_outbox, email_client, ids=[message.id])
+        return {
+            "id": parent.id,
+            "name": parent.name,
+            "email": parent.email,
+            "email_status": message.status,
+            "outbox_id": message.id,
+        }
+
+
+@router.post('/admin/parents/import')
+async def admin_import_parents(request: Request, dry_run: bool = False):
+    """Create parents from a CSV body (name, email, pupil_id) and queue their invitations.
+
+    Existing emails are found with one query, parents and outbox rows are
+    inserted with executemany in one transaction, and every row gets a status
+    in the report. Temporary passwords are issued (and hashed across the hash
+    pool) by the outbox when the invitations are sent.
+    """
+    user = getattr(request.state, 'user', None)
+    if user != 'admin':
+        raise HTTPException(status_code=403, detail='admin privileges required')
+    try:
+        rows = parse_parents_csv(await request.body())
+    except ImportFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    candidates = [r for r in rows if r.status == 'pending']
+    keys = [r.email_key for r in candidates]
+    async with get_async_db() as session:
+        if keys:
+            stmt = sa_select(func.lower(Parent.email)).where(func.lower(Parent.email).in_(keys))
+            existing = set((await session.execute(stmt)).scalars().all())
+            for r in candidates:
+                if r.email_key in existing:
+                    r.status, r.detail = 'exists', 'parent already exists'
+        to_create = [r for r in candidates if r.status == 'pending']
+
+        if dry_run:
+            for r in to_create:
+                r.status = 'valid'
+        elif to_create:
+            now = datetime.utcnow()
+            try:
+                await session.execute(insert(Parent.__table__), [
+                    {
+                        'name': r.name,
+                        'email': r.email,
+                        'pupil_id': r.pupil_id,
+                        'password_hash': None,
+                        'created_at': now,
+                        'is_hidden': False,
+                        'force_password_change': True,
+                        'password_changed_at': None,
+                        'credentials_version': 0,
+                    }
+                    for r in to_create
+                ])
+                id_stmt = sa_select(func.lower(Parent.email), Parent.id).where(
+                    func.lower(Parent.email).in_([r.email_key for r in to_create])
+                )
+                ids = dict((await session.execute(id_stmt)).all())
+                await session.execute(insert(EmailOutbox.__table__), [
+                    temporary_password_row(ids[r.email_key], r.email, r.name, now)
+                    for r in to_create
+                ])
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                raise HTTPException(status_code=409, detail='parents were created concurrently, retry the import')
+            for r in to_create:
+                r.status, r.id = 'created', ids[r.email_key]
+            logger.info('Zaimportowano %s rodziców z CSV', len(to_create))
+
+    return {
+        'dry_run': dry_run,
+        'summary': dict(Counter(r.status for r in rows)),
+        'rows': [r.to_dict() for r in rows],
+    }
 
 
 @router.post('/parents/login')
-def parent_login(payload: dict):
+async def parent_login(payload: dict):
     email = payload.get('email')
     password = payload.get('password')
     if not email or not password:
         raise HTTPException(status_code=400, detail='email and password required')
-    with get_db() as session:
+    async with get_async_db() as session:
         stmt = select(Parent).where(Parent.email == email)
-        p = session.exec(stmt).first()
-        if not p or not p.password_hash or not verify_password(password, p.password_hash):
+        p = (await session.exec(stmt)).first()
+        if not p or not p.password_hash:
+            raise HTTPException(status_code=401, detail='invalid credentials')
+        valid, new_hash = await verify_and_update_password_async(password, p.password_hash)
+        if not valid:
             raise HTTPException(status_code=401, detail='invalid credentials')
-        token = create_token({'sub': p.email, 'role': 'parent'}, expires_minutes=60*24*7)
+        if new_hash:
+            # same password under the current cost profile: credentials_version stays
+            p.password_hash = new_hash
+            session.add(p)
+            await session.commit()
+        token = create_parent_token(p)
+        parent_identity_cache.put(ParentIdentity.from_parent(p))
         response = {'token': token}
         if p.force_password_change:
             response['require_password_change'] = True
         return response
 
 
-def get_parent_from_token(request: Request):
+def create_parent_token(parent: Parent) -> str:
+    # pid/cv let later requests skip the parent lookup (see get_current_parent);
+    # pwc mirrors force_password_change for the client
+    return create_token({
+        'sub': parent.email,
+        'role': 'parent',
+        'pid': parent.id,
+        'cv': parent.credentials_version or 0,
+        'pwc': bool(parent.force_password_change),
+    }, expires_minutes=60*24*7)
+
+
+def get_parent_claims(request: Request):
     auth = request.headers.get('authorization')
     if not auth or not auth.lower().startswith('bearer '):
         return None
@@ -83,10 +193,58 @@ def get_parent_from_token(request: Request):
     payload = decode_token(token)
     if not payload or payload.get('role') != 'parent':
         return None
-    return payload.get('sub')
+    return payload
+
+
+def get_parent_from_token(request: Request):
+    payload = get_parent_claims(request)
+    return payload.get('sub') if payload else None
+
+
+async def get_current_parent(request: Request) -> ParentIdentity:
+    """Authenticate the parent token and return the caller's identity.
+
+    Tokens with ``pid``/``cv`` claims are served from the identity cache when
+    possible; a miss selects the parent by primary key. A token older than the
+    parent's credentials version (password or email changed since it was
+    issued) is rejected. A token newer than the cached identity was issued
+    after a change handled by another worker, so the row is re-read before
+    deciding. Older tokens without these claims fall back to the lookup by
+    email.
+    """
+    claims = get_parent_claims(request)
+    if not claims:
+        raise HTTPException(status_code=401, detail='unauthorized')
+    pid = claims.get('pid')
+    if pid is None:
+        async with get_async_db() as session:
+            stmt = select(Parent).where(Parent.email == claims.get('sub'))
+            p = (await session.exec(stmt)).first()
+        if not p:
+            raise HTTPException(status_code=404, detail='parent not found')
+        return ParentIdentity.from_parent(p)
+
+    cv = claims.get('cv')
+    identity = parent_identity_cache.get(pid)
+    if identity is None or (isinstance(cv, int) and cv > identity.credentials_version):
+        identity = await _load_identity(pid)
+    if identity.credentials_version != cv:
+        raise HTTPException(status_code=401, detail='token revoked')
+    return identity
 
 
-def check_password_change_required(parent: Parent):
+async def _load_identity(pid: int) -> ParentIdentity:
+    async with get_async_db() as session:
+        p = await session.get(Parent, pid)
+    if not p:
+        parent_identity_cache.invalidate(pid)
+        raise HTTPException(status_code=404, detail='parent not found')
+    identity = ParentIdentity.from_parent(p)
+    parent_identity_cache.put(identity)
+    return identity
+
+
+def check_password_change_required(parent):
     """Raise 403 if parent must change password"""
     if parent.force_password_change:
         raise HTTPException(
@@ -96,10 +254,8 @@ def check_password_change_required(parent: Parent):
 
 
 @router.post('/parents/change-password-initial')
-def parent_change_password_initial(payload: dict, request: Request):
-    sub = get_parent_from_token(request)
-    if not sub:
-        raise HTTPException(status_code=401, detail='unauthorized')
+async def parent_change_password_initial(payload: dict, request: Request):
+    parent = await get_current_parent(request)
     
     old_password = payload.get('old_password')
     new_password = payload.get('new_password')
@@ -109,101 +265,142 @@ def parent_change_password_initial(payload: dict, request: Request):
     if old_password == new_password:
         raise HTTPException(status_code=400, detail='new password must be different from old password')
     
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == sub)
-        p = session.exec(stmt).first()
+    async with get_async_db() as session:
+        p = await session.get(Parent, parent.id)
         if not p:
             raise HTTPException(status_code=404, detail='parent not found')
         
-        if not verify_password(old_password, p.password_hash):
+        if not await verify_password_async(old_password, p.password_hash):
             raise HTTPException(status_code=401, detail='invalid old password')
         
         from datetime import datetime
-        p.password_hash = hash_password(new_password)
+        p.password_hash = await hash_password_async(new_password)
         p.force_password_change = False
         p.password_changed_at = datetime.utcnow()
+        p.credentials_version = (p.credentials_version or 0) + 1
         session.add(p)
-        session.commit()
-        session.refresh(p)
+        await session.commit()
+        await session.refresh(p)
+        parent_identity_cache.invalidate(p.id)
         
-        token = create_token({'sub': p.email, 'role': 'parent'}, expires_minutes=60*24*7)
+        token = create_parent_token(p)
         return {'token': token, 'require_password_change': False}
 
 
 @router.get('/parents/me')
-def parent_me(request: Request):
-    sub = get_parent_from_token(request)
-    if not sub:
-        raise HTTPException(status_code=401, detail='unauthorized')
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == sub)
-        p = session.exec(stmt).first()
-        if not p:
-            raise HTTPException(status_code=404, detail='parent not found')
-        check_password_change_required(p)
-        return {"id": p.id, "name": p.name, "email": p.email}
+async def parent_me(request: Request):
+    p = await get_current_parent(request)
+    check_password_change_required(p)
+    return {"id": p.id, "name": p.name, "email": p.email}
+
+
+def _campaign_contributions_stmt(parent_id: int, include_history: bool):
+    """Live campaigns LEFT JOINed to this parent's contribution.
+
+    With ``include_history`` the result also carries every campaign the parent
+    has a contribution for (closed, inactive or deleted), so one query serves
+    both the campaign cards and the payment history.
+    """
+    live = and_(Campaign.active == True, Campaign.deleted_at == None)
+    stmt = (
+        sa_select(
+            Campaign.id.label('campaign_id'),
+            Campaign.title,
+            Campaign.description,
+            Campaign.target_amount,
+            Campaign.due_date,
+            Campaign.active,
+            Campaign.deleted_at,
+            Contribution.id.label('contribution_id'),
+            Contribution.amount_paid,
+            Contribution.status,
+            Contribution.paid_at,
+            Contribution.note,
+        )
+        .select_from(Campaign)
+        .outerjoin(Contribution, and_(Contribution.campaign_id == Campaign.id, Contribution.parent_id == parent_id))
+        .order_by(Campaign.id)
+    )
+    if include_history:
+        return stmt.where(or_(live, Contribution.id != None))
+    return stmt.where(live)
+
+
+def _campaign_item(row) -> dict:
+    contrib_obj = None
+    if row.contribution_id is not None:
+        contrib_obj = {"id": row.contribution_id, "amount_paid": row.amount_paid, "status": row.status, "paid_at": row.paid_at, "note": row.note}
+    return {"campaign": {"id": row.campaign_id, "title": row.title, "description": row.description, "target_amount": row.target_amount, "due_date": row.due_date, "active": row.active}, "contribution": contrib_obj}
+
+
+@router.get('/parents/dashboard')
+async def parent_dashboard(request: Request):
+    """Identity, live campaigns with this parent's contribution, and history.
+
+    Replaces the /me + /campaigns + /contributions round trips with two
+    queries (one when the identity is cached). Carries an ETag; an unchanged
+    dashboard is answered with 304.
+    """
+    p = await get_current_parent(request)
+    check_password_change_required(p)
+    async with get_async_db() as session:
+        rows = (await session.execute(_campaign_contributions_stmt(p.id, include_history=True))).all()
+
+    campaigns = [_campaign_item(row) for row in rows if row.active and row.deleted_at is None]
+    history = [
+        {"id": row.contribution_id, "campaign_id": row.campaign_id, "amount_paid": row.amount_paid, "status": row.status, "paid_at": row.paid_at, "note": row.note}
+        for row in rows if row.contribution_id is not None
+    ]
+    content = {"parent": {"id": p.id, "name": p.name, "email": p.email}, "campaigns": campaigns, "contributions": history}
+    return conditional_json(request, content)
 
 
 @router.get('/parents/campaigns')
-def parent_campaigns(request: Request):
-    sub = get_parent_from_token(request)
-    if not sub:
-        raise HTTPException(status_code=401, detail='unauthorized')
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == sub)
-        p = session.exec(stmt).first()
-        if not p:
-            raise HTTPException(status_code=404, detail='parent not found')
-        check_password_change_required(p)
-
-        # get active campaigns
-        stmt = select(Campaign).where(Campaign.active == True)
-        camps = session.exec(stmt).all()
-        results = []
-        for c in camps:
-            stmt2 = select(Contribution).where(Contribution.campaign_id == c.id, Contribution.parent_id == p.id)
-            contrib = session.exec(stmt2).first()
-            contrib_obj = None
-            if contrib:
-                contrib_obj = {"id": contrib.id, "amount_paid": contrib.amount_paid, "status": contrib.status, "paid_at": contrib.paid_at, "note": contrib.note}
-            results.append({"campaign": {"id": c.id, "title": c.title, "description": c.description, "target_amount": c.target_amount, "due_date": c.due_date, "active": c.active}, "contribution": contrib_obj})
-        return results
+async def parent_campaigns(request: Request):
+    p = await get_current_parent(request)
+    check_password_change_required(p)
+    async with get_async_db() as session:
+        rows = (await session.execute(_campaign_contributions_stmt(p.id, include_history=False))).all()
+        return [_campaign_item(row) for row in rows]
 
 
 @router.get('/parents/contributions')
-def parent_contributions(request: Request):
-    sub = get_parent_from_token(request)
-    if not sub:
-        raise HTTPException(status_code=401, detail='unauthorized')
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == sub)
-        p = session.exec(stmt).first()
-        if not p:
-            raise HTTPException(status_code=404, detail='parent not found')
-        check_password_change_required(p)
+async def parent_contributions(request: Request):
+    p = await get_current_parent(request)
+    check_password_change_required(p)
+    async with get_async_db() as session:
         stmt2 = select(Contribution).where(Contribution.parent_id == p.id)
-        items = session.exec(stmt2).all()
+        items = (await session.exec(stmt2)).all()
         return [{"id": it.id, "campaign_id": it.campaign_id, "amount_paid": it.amount_paid, "status": it.status, "paid_at": it.paid_at, "note": it.note} for it in items]
 
 
 @router.post('/parents/contributions')
-def parent_submit_contribution(payload: dict, request: Request):
-    sub = get_parent_from_token(request)
-    if not sub:
-        raise HTTPException(status_code=401, detail='unauthorized')
+async def parent_submit_contribution(payload: dict, request: Request):
+    p = await get_current_parent(request)
     campaign_id = payload.get('campaign_id')
     amount = payload.get('amount')
     note = payload.get('note')
     if not campaign_id or not amount:
         raise HTTPException(status_code=400, detail='campaign_id and amount required')
-    with get_db() as session:
-        stmt = select(Parent).where(Parent.email == sub)
-        p = session.exec(stmt).first()
-        if not p:
-            raise HTTPException(status_code=404, detail='parent not found')
-        check_password_change_required(p)
-        c = Contribution(campaign_id=campaign_id, parent_id=p.id, amount_expected=0.0, amount_paid=amount, status='pending', note=note)
+    check_password_change_required(p)
+    async with get_async_db() as session:
+        # one contribution per (campaign, parent): a repeated declaration
+        # updates the existing row instead of adding a duplicate
+        stmt = select(Contribution).where(Contribution.campaign_id == campaign_id, Contribution.parent_id == p.id).with_for_update()
+        c = (await session.exec(stmt)).first()
+        before = None
+        if c is None:
+            if not await session.get(Campaign, campaign_id):
+                raise HTTPException(status_code=404, detail='campaign not found')
+            c = Contribution(campaign_id=campaign_id, parent_id=p.id, amount_expected=0.0, amount_paid=amount, status='pending', note=note)
+        elif c.status == 'paid':
+            raise HTTPException(status_code=409, detail='contribution already paid')
+        else:
+            before = (c.status, c.amount_expected, c.amount_paid)
+            c.amount_paid = amount
+            c.note = note
         session.add(c)
-        session.commit()
-        session.refresh(c)
+        await record_change(session, campaign_id, before, (c.status, c.amount_expected, c.amount_paid))
+        await session.commit()
+        await session.refresh(c)
         return {"id": c.id, "status": c.status}
@@ -2,18 +2,78 @@ from passlib.context import CryptContext
 import jwt
 import os
 from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from .hashing import map_in_hash_pool, run_in_hash_pool
+from .settings import get_settings
 
-pwd_ctx = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 JWT_SECRET = os.getenv("JWT_SECRET", "devsecret")
 JWT_ALG = "HS256"
+# hashes in these schemes keep verifying after PASSWORD_HASH_SCHEME moves on;
+# they are flagged by needs_update and rewritten on the next successful login
+LEGACY_SCHEMES = ("pbkdf2_sha256",)
 
 
-def hash_password(password: str) -> str:
-    return pwd_ctx.hash(password)
+@lru_cache(maxsize=8)
+def build_crypt_context(scheme: str, rounds: Optional[int] = None) -> CryptContext:
+    schemes = [scheme] + [s for s in LEGACY_SCHEMES if s != scheme]
+    options = {"schemes": schemes, "default": scheme, "deprecated": "auto"}
+    if rounds:
+        # pin the cost: hashes below or above it are reported by needs_update
+        options[f"{scheme}__default_rounds"] = rounds
+        options[f"{scheme}__min_desired_rounds"] = rounds
+        options[f"{scheme}__max_desired_rounds"] = rounds
+    return CryptContext(**options)
+
+
+def _policy() -> Tuple[str, Optional[int]]:
+    settings = get_settings()
+    return settings.password_hash_scheme, settings.password_hash_rounds
+
+
+def get_crypt_context() -> CryptContext:
+    return build_crypt_context(*_policy())
+
+
+def hash_password(password: str, scheme: Optional[str] = None, rounds: Optional[int] = None) -> str:
+    context = build_crypt_context(scheme, rounds) if scheme else get_crypt_context()
+    return context.hash(password)
 
 
 def verify_password(password: str, hash: str) -> bool:
-    return pwd_ctx.verify(password, hash)
+    return get_crypt_context().verify(password, hash)
+
+
+def verify_and_update_password(password: str, hash: str, scheme: Optional[str] = None,
+                               rounds: Optional[int] = None) -> Tuple[bool, Optional[str]]:
+    """Return ``(valid, new_hash)``; ``new_hash`` is set when ``hash`` uses an outdated cost profile."""
+    context = build_crypt_context(scheme, rounds) if scheme else get_crypt_context()
+    return context.verify_and_update(password, hash)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    # batches (outbox invitations): spread them over every pool worker instead
+    # of one job per password; the policy is passed as for the async variants
+    scheme, rounds = _policy()
+    n = len(passwords)
+    return map_in_hash_pool(hash_password, passwords, [scheme] * n, [rounds] * n)
+
+
+# the async variants pass the policy explicitly so pool workers, which read
+# their own environment, hash with exactly the profile this process is using
+
+async def hash_password_async(password: str) -> str:
+    # runs on the hash process pool so request handlers never burn CPU on it
+    return await run_in_hash_pool(hash_password, password, *_policy())
+
+
+async def verify_password_async(password: str, hash: str) -> bool:
+    valid, _ = await verify_and_update_password_async(password, hash)
+    return valid
+
+
+async def verify_and_update_password_async(password: str, hash: str) -> Tuple[bool, Optional[str]]:
+    return await run_in_hash_pool(verify_and_update_password, password, hash, *_policy())
 
 
 def create_token(data: dict, expires_minutes: int = 60):
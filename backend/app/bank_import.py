@@ -0,0 +1,392 @@
+"""Bank statement parsing and transfer-to-contribution matching.
+
+Statements are CSV exports of the common Polish banks (mBank, PKO BP, ING,
+Santander, Millennium, Pekao): semicolon or comma separated, cp1250 or UTF-8,
+amounts written like ``1 234,56`` and a preamble of account details before the
+header row. ``StatementParser`` is push-based so the endpoint can feed it the
+request body chunk by chunk without holding the whole file.
+
+``ContributionIndex`` keeps the pending contributions in dicts keyed by parent
+email, normalised pupil_id, name tokens and expected amount; matching a
+transfer is a handful of dict lookups, so a year's statement is matched in
+well under a second. Proposals carry a ``mark_paid`` item that can be sent
+as-is to ``POST /api/admin/contributions/mark-paid/batch``.
+"""
+import codecs
+import csv
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+MAX_PREAMBLE_ROWS = 50
+SNIFF_BYTES = 64 * 1024
+# name tokens shared by more pending contributions than this are only
+# considered together with a matching expected amount
+COMMON_TOKEN_LIMIT = 32
+
+_FOLD = str.maketrans('ąćęłńóśźż', 'acelnoszz')
+_SEPARATORS = str.maketrans('', '', '-/.')
+EMAIL_RE = re.compile(r'[a-z0-9._%+-]+@[a-z0-9.-]+\.[a-z]{2,}')
+TOKEN_RE = re.compile(r'[0-9a-z]+(?:[-/.][0-9a-z]+)*')
+WORD_RE = re.compile(r'[0-9a-z]+')
+DATE_RE = re.compile(r'^(\d{1,2})[.\-/](\d{1,2})[.\-/](\d{4})$|^(\d{4})-(\d{2})-(\d{2})')
+
+# header names (folded, without '#') used by the supported exports
+DATE_COLUMNS = ('data operacji', 'data transakcji', 'data ksiegowania', 'data waluty', 'data')
+AMOUNT_COLUMNS = ('kwota', 'kwota operacji', 'kwota transakcji (waluta rachunku)', 'kwota transakcji', 'amount')
+CREDIT_COLUMNS = ('uznania', 'wplywy', 'uznanie')
+TITLE_COLUMNS = ('tytul', 'tytul operacji', 'tytul przelewu', 'opis operacji', 'opis transakcji', 'opis', 'szczegoly')
+PARTY_COLUMNS = ('dane kontrahenta', 'nadawca', 'nadawca / odbiorca', 'nadawca/odbiorca', 'odbiorca/zleceniodawca',
+                 'nazwa nadawcy', 'kontrahent', 'nadawca/adresat')
+
+# confidence contributed by each kind of evidence, combined as 1 - prod(1 - w)
+EMAIL_WEIGHT = 0.7
+PUPIL_WEIGHT = 0.6
+NAME_WEIGHT = 0.5
+AMOUNT_WEIGHT = 0.3
+
+
+class StatementFormatError(ValueError):
+    """The statement as a whole cannot be read (encoding, header, size)."""
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip Polish diacritics so titles typed without them match."""
+    return text.lower().translate(_FOLD)
+
+
+def compact(text: str) -> str:
+    return ''.join(WORD_RE.findall(fold(text)))
+
+
+def parse_amount(raw: str) -> Optional[float]:
+    """``1 234,56`` / ``-1.234,56 PLN`` / ``1234.56`` -> float; None if not a number."""
+    s = raw.replace('\xa0', '').replace(' ', '').replace('PLN', '').replace('zł', '').strip()
+    if not s:
+        return None
+    if ',' in s:
+        s = s.replace('.', '').replace(',', '.')
+    try:
+        return float(s)
+    except ValueError:
+        return None
+
+
+def parse_date(raw: str) -> Optional[str]:
+    m = DATE_RE.match(raw.strip())
+    if not m:
+        return None
+    if m.group(3):
+        return f'{m.group(3)}-{int(m.group(2)):02d}-{int(m.group(1)):02d}'
+    return f'{m.group(4)}-{m.group(5)}-{m.group(6)}'
+
+
+@dataclass
+class Transfer:
+    line: int  # line number in the file, first line = 1
+    date: Optional[str]
+    amount: float
+    counterparty: str
+    title: str
+
+    def to_dict(self) -> dict:
+        return {'line': self.line, 'date': self.date, 'amount': self.amount,
+                'counterparty': self.counterparty, 'title': self.title}
+
+
+def _find(header: List[str], names: Tuple[str, ...]) -> Optional[int]:
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+class _Layout(NamedTuple):
+    delimiter: str
+    width: int
+    date: Optional[int]
+    amount: Optional[int]
+    credit: Optional[int]  # split credit/debit layouts (Millennium)
+    title: Optional[int]
+    party: Optional[int]
+
+
+def _detect_layout(line: str) -> Optional[_Layout]:
+    delimiter = max(';,\t', key=line.count)
+    if not line.count(delimiter):
+        return None
+    header = [fold(h).strip().lstrip('#').strip() for h in next(csv.reader([line], delimiter=delimiter))]
+    date = _find(header, DATE_COLUMNS)
+    amount, credit = _find(header, AMOUNT_COLUMNS), _find(header, CREDIT_COLUMNS)
+    if date is None or (amount is None and credit is None):
+        return None
+    return _Layout(delimiter, len(header), date, amount, credit,
+                   _find(header, TITLE_COLUMNS), _find(header, PARTY_COLUMNS))
+
+
+class StatementParser:
+    """Incremental statement reader: ``feed(chunk)`` / ``close()`` return new transfers.
+
+    Only incoming transfers are returned; outgoing and unreadable rows are
+    counted in ``skipped``. Lines are decoded as UTF-8 unless the first
+    ``SNIFF_BYTES`` are not valid UTF-8, in which case cp1250 is used.
+    """
+
+    def __init__(self, max_rows: int = 200_000):
+        self.max_rows = max_rows
+        self.rows = 0
+        self.skipped = 0
+        self.layout: Optional[_Layout] = None
+        self._decoder: Optional[codecs.IncrementalDecoder] = None
+        self._head = b''
+        self._buffer = ''
+        self._pending = ''  # a quoted field spanning lines
+        self._line = 0
+        self._start = 0
+
+    def feed(self, chunk: bytes) -> List[Transfer]:
+        if self._decoder is None:
+            # the encoding is picked from the first SNIFF_BYTES of the file
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return []
+            chunk, self._head = self._head, b''
+            self._decoder = self._pick_decoder(chunk)
+        self._buffer += self._decode(chunk)
+        *lines, self._buffer = self._buffer.split('\n')
+        return self._lines(lines)
+
+    def close(self) -> List[Transfer]:
+        transfers = []
+        if self._decoder is None:
+            head, self._head = self._head, b''
+            self._decoder = self._pick_decoder(head)
+            transfers += self.feed(head)
+        self._buffer += self._decode(b'', final=True)
+        lines, self._buffer = [self._buffer], ''
+        transfers += self._lines(lines)
+        if self._pending:
+            line, self._pending = self._pending, ''
+            transfers += self._parse_row(self._start, line)
+        if self.layout is None:
+            raise StatementFormatError('no recognised statement header (expected date and amount columns)')
+        return transfers
+
+    def _decode(self, chunk: bytes, final: bool = False) -> str:
+        try:
+            return self._decoder.decode(chunk, final)
+        except UnicodeDecodeError:
+            raise StatementFormatError('statement is not valid UTF-8 or cp1250 text')
+
+    @staticmethod
+    def _pick_decoder(head: bytes) -> codecs.IncrementalDecoder:
+        try:
+            codecs.getincrementaldecoder('utf-8-sig')().decode(head)
+            return codecs.getincrementaldecoder('utf-8-sig')()
+        except UnicodeDecodeError:
+            # exports from banking sites on Polish Windows
+            return codecs.getincrementaldecoder('cp1250')()
+
+    def _lines(self, lines: List[str]) -> List[Transfer]:
+        transfers = []
+        for line in lines:
+            self._line += 1
+            line = line.rstrip('\r')
+            if self._pending:
+                line = self._pending + '\n' + line
+            else:
+                self._start = self._line
+            if line.count('"') % 2:
+                self._pending = line
+                continue
+            self._pending = ''
+            transfers += self._parse_row(self._start, line)
+        return transfers
+
+    def _parse_row(self, line_no: int, line: str) -> List[Transfer]:
+        if not line.strip():
+            return []
+        if self.layout is None:
+            self.layout = _detect_layout(line)
+            if self.layout is None and line_no > MAX_PREAMBLE_ROWS:
+                raise StatementFormatError('no recognised statement header (expected date and amount columns)')
+            return []
+        self.rows += 1
+        if self.rows > self.max_rows:
+            raise StatementFormatError(f'too many rows (max {self.max_rows})')
+        layout = self.layout
+        cells = next(csv.reader([line], delimiter=layout.delimiter))
+
+        def cell(i: Optional[int]) -> str:
+            return cells[i].strip() if i is not None and i < len(cells) else ''
+
+        amount = parse_amount(cell(layout.amount)) if layout.amount is not None else None
+        if amount is None and layout.credit is not None:
+            amount = parse_amount(cell(layout.credit))
+        if amount is None or amount <= 0:
+            self.skipped += 1
+            return []
+        # PKO puts the transfer details in unnamed trailing columns
+        title = ' '.join(filter(None, [cell(layout.title)] + [c.strip() for c in cells[layout.width:]]))
+        return [Transfer(line_no, parse_date(cell(layout.date)), round(amount, 2), cell(layout.party), title)]
+
+
+def parse_statement(chunks: Iterable[bytes], max_rows: int = 200_000) -> Tuple[List[Transfer], StatementParser]:
+    parser = StatementParser(max_rows=max_rows)
+    transfers = []
+    for chunk in chunks:
+        transfers += parser.feed(chunk)
+    transfers += parser.close()
+    return transfers, parser
+
+
+class PendingContribution(NamedTuple):
+    id: int
+    campaign_id: int
+    parent_id: int
+    amount_expected: float
+    email: Optional[str]
+    pupil_id: Optional[str]
+    name: Optional[str]
+
+
+def _cents(amount: Optional[float]) -> int:
+    return int(round((amount or 0) * 100))
+
+
+def _name_tokens(name: Optional[str]) -> List[str]:
+    return [t for t in WORD_RE.findall(fold(name or '')) if len(t) >= 3]
+
+
+@dataclass
+class ContributionIndex:
+    """Pending contributions keyed by the evidence a transfer title can carry.
+
+    The ``by_*`` dicts map a normalised key to contribution ids (common name
+    tokens are looked up together with the expected amount); ``entries``,
+    ``cents`` and ``name_tokens`` hold per-id data so scoring a candidate is
+    a few dict lookups.
+    """
+    entries: Dict[int, PendingContribution] = field(default_factory=dict)
+    cents: Dict[int, int] = field(default_factory=dict)
+    name_tokens: Dict[int, int] = field(default_factory=dict)  # distinct name tokens per id
+    by_email: Dict[str, List[int]] = field(default_factory=lambda: defaultdict(list))
+    by_pupil: Dict[str, List[int]] = field(default_factory=lambda: defaultdict(list))
+    by_token: Dict[str, List[int]] = field(default_factory=lambda: defaultdict(list))
+    by_token_amount: Dict[Tuple[str, int], List[int]] = field(default_factory=lambda: defaultdict(list))
+
+    @classmethod
+    def build(cls, contributions: Iterable[PendingContribution]) -> 'ContributionIndex':
+        index = cls()
+        for c in contributions:
+            index.entries[c.id] = c
+            if c.email:
+                index.by_email[c.email.lower()].append(c.id)
+            if c.pupil_id and compact(c.pupil_id):
+                index.by_pupil[compact(c.pupil_id)].append(c.id)
+            index.cents[c.id] = _cents(c.amount_expected)
+            tokens = set(_name_tokens(c.name))
+            for token in tokens:
+                index.by_token[token].append(c.id)
+                index.by_token_amount[token, index.cents[c.id]].append(c.id)
+            index.name_tokens[c.id] = len(tokens)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def candidates(self, transfer: Transfer, min_confidence: float = 0.0) -> List[Tuple[float, int, List[str]]]:
+        """``(confidence, contribution id, reasons)`` for one transfer, best first."""
+        text = fold(f'{transfer.counterparty} {transfer.title}')
+        by_email, by_pupil, by_token = self.by_email, self.by_pupil, self.by_token
+        emails = set()
+        if '@' in text:
+            for email in EMAIL_RE.findall(text):
+                emails.update(by_email.get(email, ()))
+            text = EMAIL_RE.sub(' ', text)
+        pupils = set()
+        for token in TOKEN_RE.findall(text):
+            pupils.update(by_pupil.get(token.translate(_SEPARATORS), ()))
+
+        cents = _cents(transfer.amount)
+        hits: Dict[int, int] = {}
+        for word in set(WORD_RE.findall(text)):
+            ids = by_token.get(word)
+            if not ids:
+                continue
+            if len(ids) > COMMON_TOKEN_LIMIT:
+                ids = self.by_token_amount.get((word, cents), ())
+            for cid in ids:
+                hits[cid] = hits.get(cid, 0) + 1
+
+        # a candidate with only name evidence needs at least this share of its
+        # name tokens to reach min_confidence even with a matching amount
+        share = (1.0 - (1.0 - min_confidence) / (1.0 - AMOUNT_WEIGHT)) / NAME_WEIGHT
+        named = [cid for cid, n in hits.items() if n >= share * self.name_tokens[cid]] if share > 0 else hits
+
+        scored = []
+        for cid in emails.union(pupils, named):
+            reasons, miss = [], 1.0
+            if cid in emails:
+                reasons.append('email')
+                miss *= 1.0 - EMAIL_WEIGHT
+            if cid in pupils:
+                reasons.append('pupil_id')
+                miss *= 1.0 - PUPIL_WEIGHT
+            if cid in hits:
+                reasons.append('name')
+                miss *= 1.0 - NAME_WEIGHT * hits[cid] / self.name_tokens[cid]
+            if self.cents[cid] == cents:
+                reasons.append('amount')
+                miss *= 1.0 - AMOUNT_WEIGHT
+            confidence = round(1.0 - miss, 3)
+            if confidence >= min_confidence:
+                scored.append((confidence, cid, sorted(reasons)))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return scored
+
+
+def _note(transfer: Transfer) -> str:
+    return ' '.join(filter(None, ['przelew', transfer.date, transfer.title]))[:200]
+
+
+def match_transfers(index: ContributionIndex, transfers: List[Transfer], min_confidence: float = 0.5) -> dict:
+    """Assign each transfer at most one contribution and vice versa, best scores first."""
+    options = []
+    ambiguous = set()
+    for i, transfer in enumerate(transfers):
+        scored = index.candidates(transfer, min_confidence)
+        if len(scored) > 1 and scored[0][0] == scored[1][0]:
+            ambiguous.add(i)
+        options += [(score, i, cid, reasons) for score, cid, reasons in scored]
+    options.sort(key=lambda o: (-o[0], o[1], o[2]))
+
+    chosen: Dict[int, tuple] = {}
+    taken = set()
+    for score, i, cid, reasons in options:
+        if i in chosen or cid in taken:
+            continue
+        chosen[i] = (score, index.entries[cid], reasons)
+        taken.add(cid)
+
+    proposals, unmatched = [], []
+    for i, transfer in enumerate(transfers):
+        if i not in chosen:
+            unmatched.append(transfer.to_dict())
+            continue
+        score, c, reasons = chosen[i]
+        proposals.append({
+            'transfer': transfer.to_dict(),
+            'contribution_id': c.id,
+            'campaign_id': c.campaign_id,
+            'parent_id': c.parent_id,
+            'parent_name': c.name,
+            'amount_expected': c.amount_expected,
+            'confidence': score,
+            'reasons': reasons,
+            'ambiguous': i in ambiguous,
+            'mark_paid': {'campaign_id': c.campaign_id, 'parent_id': c.parent_id,
+                          'amount': transfer.amount, 'note': _note(transfer)},
+        })
+    return {'proposals': proposals, 'unmatched': unmatched}
@@ -0,0 +1,153 @@
+"""Read-through cache for rarely changing JSON responses.
+
+A response is cached under ``<namespace>:v<version>:<key>`` together with its
+ETag. Writers call ``bump(namespace)`` after committing, which increments
+the namespace's version counter; later reads build and store a fresh
+response under the new version and the old entries age out. Only the
+counter is shared state, so the scheme works unchanged on any backend with
+``get``/``set``/``incr``/``delete``:
+
+* ``MemoryBackend`` (default): per-process LRU with TTL. Other worker
+  processes don't see a bump and converge within ``ttl_seconds``.
+* ``RedisBackend``: wraps any redis-py compatible client, so every worker
+  shares the versions and a bump is visible immediately.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Tuple
+
+from .http_cache import make_etag
+from .settings import get_settings
+from .streaming import json_dumps
+
+
+class MemoryBackend:
+    """Thread-safe LRU of bytes values with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires_at = self._entries.get(key, (b'0', None))
+            value = str(int(value) + 1).encode()
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            return int(value)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Adapter for a redis-py compatible client (``redis.Redis`` or a stand-in)."""
+
+    def __init__(self, client, prefix: str = 'skarbek:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        # redis expiries are whole seconds
+        self.client.set(self.prefix + key, value, ex=max(int(ttl), 1) if ttl else None)
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        pass  # versioned keys expire on their own
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl_seconds: float = 60.0):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None and self.ttl_seconds > 0
+
+    def version(self, namespace: str) -> int:
+        raw = self.backend.get(f'{namespace}:version')
+        return int(raw) if raw else 0
+
+    def bump(self, namespace: str) -> None:
+        """Invalidate every cached response of ``namespace``; call after the write commits."""
+        if self.backend is not None:
+            self.backend.incr(f'{namespace}:version')
+
+    def get_or_build(self, namespace: str, key: str, build: Callable[[], Any]) -> Tuple[bytes, str, bool]:
+        """``(json body, etag, hit)``; ``build`` runs only on a miss."""
+        if not self.enabled:
+            body = json_dumps(build()).encode('utf-8')
+            return body, make_etag(body), False
+        cache_key = f'{namespace}:v{self.version(namespace)}:{key}'
+        cached = self.backend.get(cache_key)
+        if cached is not None:
+            etag, _, body = cached.partition(b'\n')
+            return body, etag.decode(), True
+        body = json_dumps(build()).encode('utf-8')
+        etag = make_etag(body)
+        self.backend.set(cache_key, etag.encode() + b'\n' + body, self.ttl_seconds)
+        return body, etag, False
+
+    def clear(self) -> None:
+        if self.backend is not None:
+            self.backend.clear()
+
+
+def build_backend(kind: str, url: Optional[str] = None, max_entries: int = 256):
+    if kind == 'none':
+        return None
+    if kind == 'memory':
+        return MemoryBackend(max_entries=max_entries)
+    if kind == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RESPONSE_CACHE_BACKEND=redis requires the redis package')
+        return RedisBackend(redis.Redis.from_url(url or 'redis://localhost:6379/0'))
+    raise ValueError(f'unknown response cache backend: {kind}')
+
+
+# namespaces
+CAMPAIGNS = 'campaigns'
+
+_settings = get_settings()
+response_cache = ResponseCache(
+    build_backend(_settings.response_cache_backend, _settings.response_cache_url, _settings.response_cache_size),
+    ttl_seconds=_settings.response_cache_ttl,
+)
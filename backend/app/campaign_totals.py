@@ -0,0 +1,173 @@
+"""Incrementally maintained per-campaign contribution totals.
+
+Every path that writes a ``Contribution`` adds the change it makes to the
+campaign's ``CampaignTotals`` row in the same transaction, so progress views
+read one row per campaign instead of aggregating contributions. A row is
+an upsert of deltas (``INSERT ... ON CONFLICT DO UPDATE SET x = x + ...``),
+which is safe under concurrent writers as long as the contribution rows
+themselves are locked while being read.
+
+``check_campaign_totals`` recomputes the aggregates from ``contribution`` and
+reports rows that drifted; ``rebuild_campaign_totals`` rewrites them. Both
+are available as ``python -m app.campaign_totals [--fix]`` and through the
+admin API.
+"""
+import argparse
+import asyncio
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, select as sa_select
+
+from .models import CampaignTotals, Contribution
+from .sql import insert_for
+
+COUNTS = ('contributions', 'pending_count', 'paid_count')
+SUMS = ('expected_sum', 'paid_sum')
+COLUMNS = COUNTS + SUMS
+# sums are floats updated by deltas; smaller differences are rounding noise
+TOLERANCE = 0.005
+
+# (status, amount_expected, amount_paid) of one contribution row
+State = Tuple[Optional[str], Optional[float], Optional[float]]
+
+
+def contribution_totals(state: Optional[State]) -> Dict[str, float]:
+    """What one contribution adds to its campaign's totals (zeros for None)."""
+    if state is None:
+        return dict.fromkeys(COLUMNS, 0)
+    status, expected, paid = state
+    is_paid = status == 'paid'
+    return {
+        'contributions': 1,
+        'pending_count': 0 if is_paid else 1,
+        'paid_count': 1 if is_paid else 0,
+        'expected_sum': expected or 0.0,
+        'paid_sum': (paid or 0.0) if is_paid else 0.0,
+    }
+
+
+class TotalsDelta:
+    """Accumulates per-campaign changes of one transaction; ``apply`` writes them."""
+
+    def __init__(self):
+        self._deltas: Dict[int, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(COLUMNS, 0))
+
+    def change(self, campaign_id: int, before: Optional[State], after: Optional[State]) -> None:
+        old, new = contribution_totals(before), contribution_totals(after)
+        delta = self._deltas[campaign_id]
+        for column in COLUMNS:
+            delta[column] += new[column] - old[column]
+
+    def add(self, campaign_id: int, **columns: float) -> None:
+        delta = self._deltas[campaign_id]
+        for column, value in columns.items():
+            delta[column] += value
+
+    def rows(self) -> List[dict]:
+        return [
+            {'campaign_id': campaign_id, **delta}
+            for campaign_id, delta in self._deltas.items()
+            if any(delta.values())
+        ]
+
+    async def apply(self, session) -> None:
+        rows = self.rows()
+        if not rows:
+            return
+        table = CampaignTotals.__table__
+        stmt = insert_for(session, table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['campaign_id'],
+            set_={column: table.c[column] + stmt.excluded[column] for column in COLUMNS},
+        )
+        await session.execute(stmt, rows)
+        self._deltas.clear()
+
+
+async def record_change(session, campaign_id: int, before: Optional[State], after: Optional[State]) -> None:
+    """Single-row shortcut for ``TotalsDelta``."""
+    delta = TotalsDelta()
+    delta.change(campaign_id, before, after)
+    await delta.apply(session)
+
+
+def _aggregate_stmt(campaign_ids: Optional[Iterable[int]] = None):
+    is_paid = Contribution.status == 'paid'
+    stmt = (
+        sa_select(
+            Contribution.campaign_id,
+            func.count(),
+            func.sum(case((is_paid, 0), else_=1)),
+            func.sum(case((is_paid, 1), else_=0)),
+            func.coalesce(func.sum(Contribution.amount_expected), 0.0),
+            func.coalesce(func.sum(case((is_paid, Contribution.amount_paid), else_=0.0)), 0.0),
+        )
+        .group_by(Contribution.campaign_id)
+    )
+    if campaign_ids is not None:
+        stmt = stmt.where(Contribution.campaign_id.in_(list(campaign_ids)))
+    return stmt
+
+
+async def rebuild_campaign_totals(session, campaign_ids: Optional[Iterable[int]] = None) -> int:
+    """Recompute totals from ``contribution`` (all campaigns or the given ones).
+
+    Runs in the caller's transaction; returns the number of campaigns with
+    contributions.
+    """
+    table = CampaignTotals.__table__
+    if campaign_ids is not None:
+        campaign_ids = list(campaign_ids)
+    clear = delete(table)
+    if campaign_ids is not None:
+        clear = clear.where(table.c.campaign_id.in_(campaign_ids))
+    await session.execute(clear)
+    stmt = insert_for(session, table).from_select(['campaign_id', *COLUMNS], _aggregate_stmt(campaign_ids))
+    result = await session.execute(stmt)
+    return max(result.rowcount or 0, 0)
+
+
+async def check_campaign_totals(session) -> List[dict]:
+    """Rows of ``campaigntotals`` that differ from a fresh aggregate."""
+    actual = {row[0]: dict(zip(COLUMNS, row[1:])) for row in (await session.execute(_aggregate_stmt())).all()}
+    stored = {
+        row.campaign_id: {column: getattr(row, column) for column in COLUMNS}
+        for row in (await session.execute(sa_select(CampaignTotals.__table__))).all()
+    }
+    mismatches = []
+    for campaign_id in sorted(set(actual) | set(stored)):
+        want = actual.get(campaign_id, contribution_totals(None))
+        have = stored.get(campaign_id, contribution_totals(None))
+        if any(want[c] != have[c] for c in COUNTS) or any(abs(want[c] - have[c]) > TOLERANCE for c in SUMS):
+            mismatches.append({'campaign_id': campaign_id, 'stored': have if campaign_id in stored else None,
+                               'actual': want})
+    return mismatches
+
+
+async def _main(fix: bool) -> dict:
+    from .db_async import get_async_db
+
+    async with get_async_db() as session:
+        mismatches = await check_campaign_totals(session)
+        report = {'mismatches': mismatches}
+        if fix and mismatches:
+            report['rebuilt'] = await rebuild_campaign_totals(session)
+            await session.commit()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Check (and optionally rebuild) campaign totals')
+    parser.add_argument('--fix', action='store_true', help='rebuild all totals when any row differs')
+    args = parser.parse_args()
+    from . import db
+    db.init_db()
+    report = asyncio.run(_main(args.fix))
+    print(json.dumps(report, indent=2))
+    raise SystemExit(1 if report['mismatches'] and not args.fix else 0)
+
+
+if __name__ == '__main__':
+    main()
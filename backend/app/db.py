@@ -1,14 +1,73 @@
 from sqlmodel import SQLModel, create_engine, Session, select
 import os
+import threading
+from typing import Optional
 from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
 from .models import AdminUser
 from .auth import hash_password
+from . import query_stats
+from .settings import Settings, get_settings
 
+# count/time statements on every engine, including ones tests build
+query_stats.install()
 
-def get_engine():
-    # Read DATABASE_URL at runtime so Docker/ENV can control it
-    database_url = os.getenv("DATABASE_URL", "sqlite:///./test.db")
-    return create_engine(database_url, echo=False)
+# One engine (and therefore one connection pool) per process. Built lazily on
+# first use so DATABASE_URL can still be set by Docker/ENV before startup.
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+
+def build_engine(settings: Settings) -> Engine:
+    url = settings.database_url
+    if url.startswith("sqlite"):
+        # sqlite picks its own pool class; QueuePool options don't apply
+        return create_engine(url, echo=False, connect_args={"check_same_thread": False})
+    connect_args = {}
+    if settings.db_connect_timeout and url.startswith("postgresql"):
+        connect_args["connect_timeout"] = settings.db_connect_timeout
+    return create_engine(
+        url,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = build_engine(get_settings())
+    return _engine
+
+
+def dispose_engine() -> None:
+    """Close pooled connections and drop the engine; the next get_engine() rebuilds it."""
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.dispose()
+
+
+def _reset_engine_after_fork() -> None:
+    # Connections inherited from the parent must never be reused by the child;
+    # drop them without closing (closing would break the parent's sockets).
+    global _engine, _engine_lock
+    _engine_lock = threading.Lock()
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_engine_after_fork)
 
 
 def init_db():
@@ -32,6 +91,11 @@ def init_db():
                     except Exception:
                         # best-effort: ignore if cannot alter (e.g., permissions)
                         pass
+                if 'credentials_version' not in cols:
+                    try:
+                        conn.execute(text('ALTER TABLE parent ADD COLUMN credentials_version integer NOT NULL DEFAULT 0'))
+                    except Exception:
+                        pass
 
             # campaign.is_closed and campaign.deleted_at
             if 'campaign' in tables:
@@ -0,0 +1,99 @@
+"""Async engine/session layer for the API routers.
+
+Mirrors ``app.db``: one lazily-built ``AsyncEngine`` per process, pointed at
+the same database as the sync engine (asyncpg for Postgres, aiosqlite for
+sqlite). The sync path in ``app.db`` stays available for scripts such as
+``scripts/db_reset.py`` and for ``init_db``.
+"""
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import db as _db
+from .settings import get_settings
+
+_ASYNC_DRIVERS = (
+    ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+    ("postgresql://", "postgresql+asyncpg://"),
+    ("postgres://", "postgresql+asyncpg://"),
+    ("sqlite+pysqlite://", "sqlite+aiosqlite://"),
+    ("sqlite://", "sqlite+aiosqlite://"),
+)
+
+_async_engine: Optional[AsyncEngine] = None
+# sync engine the async one was derived from; a different one means rebuild
+_source_engine: Optional[Engine] = None
+_lock = threading.Lock()
+
+
+def async_database_url(url: str) -> str:
+    """Translate a sync SQLAlchemy URL into its async-driver equivalent."""
+    for sync_prefix, async_prefix in _ASYNC_DRIVERS:
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+def build_async_engine(url: str) -> AsyncEngine:
+    settings = get_settings()
+    url = async_database_url(url)
+    if url.startswith("sqlite"):
+        return create_async_engine(url, echo=False)
+    connect_args = {}
+    if settings.db_connect_timeout:
+        connect_args["timeout"] = settings.db_connect_timeout
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _source_engine
+    # look up through the module so tests that swap app.db.get_engine
+    # transparently move the async path to the same database
+    source = _db.get_engine()
+    if _async_engine is None or _source_engine is not source:
+        with _lock:
+            if _async_engine is None or _source_engine is not source:
+                url = source.url.render_as_string(hide_password=False)
+                _async_engine = build_async_engine(url)
+                _source_engine = source
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine, _source_engine
+    with _lock:
+        engine, _async_engine, _source_engine = _async_engine, None, None
+    if engine is not None:
+        await engine.dispose()
+
+
+def get_async_db() -> AsyncSession:
+    # expire_on_commit=False: attributes must stay readable after commit
+    # without an implicit (and in async, forbidden) lazy refresh
+    return AsyncSession(get_async_engine(), expire_on_commit=False)
+
+
+def _reset_async_engine_after_fork() -> None:
+    global _async_engine, _source_engine, _lock
+    _lock = threading.Lock()
+    if _async_engine is not None:
+        _async_engine.sync_engine.dispose(close=False)
+    _async_engine = None
+    _source_engine = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_async_engine_after_fork)
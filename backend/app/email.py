@@ -1,18 +1,46 @@
 import base64
 import logging
 import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from email.mime.text import MIMEText
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
 
 import google.auth.transport.requests
 import requests
 from google.oauth2.credentials import Credentials
+from requests.adapters import HTTPAdapter
+
+from .settings import get_settings
 
 logger = logging.getLogger(__name__)
 
 GMAIL_API_URL = "https://gmail.googleapis.com/gmail/v1/users/me/messages/send"
 DEFAULT_TOKEN_URI = "https://oauth2.googleapis.com/token"
 DEFAULT_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+# (connect, read) seconds for both the token exchange and the send call
+DEFAULT_TIMEOUT = (5.0, 30.0)
+# refresh the access token this long before Google says it expires
+TOKEN_REFRESH_MARGIN = timedelta(seconds=120)
+
+# name -> (subject, body) rendered with str.format; ``login_url`` is filled in
+# from the client and ``parent_name`` falls back to a generic greeting
+TEMPLATES: Dict[str, Tuple[str, str]] = {
+    "temporary_password": (
+        "Twoje tymczasowe hasło do portalu Skarbek",
+        "Cześć {parent_name},\n\n"
+        "Wygenerowaliśmy dla Ciebie tymczasowe hasło: {password}\n"
+        "Po pierwszym zalogowaniu musisz je zmienić.\n\n"
+        "Zaloguj się tutaj: {login_url}\n\n"
+        "Pozdrawiamy,\nZespół Skarbek",
+    ),
+}
+# Gmail answers these with "try again later"; everything else 4xx is final
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
 
 class GmailEmailClient:
@@ -25,6 +53,11 @@ class GmailEmailClient:
         parent_login_url: Optional[str] = None,
         token_uri: Optional[str] = None,
         scopes: Optional[Iterable[str]] = None,
+        send_url: Optional[str] = None,
+        timeout: Optional[Tuple[float, float]] = None,
+        pool_size: int = 10,
+        rate_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
     ):
         self.client_id = client_id or os.getenv("GMAIL_CLIENT_ID")
         self.client_secret = client_secret or os.getenv("GMAIL_CLIENT_SECRET")
@@ -39,6 +72,19 @@ class GmailEmailClient:
         if env_scopes:
             raw_scopes.extend(env_scopes.split())
         self.scopes = raw_scopes or DEFAULT_SCOPES
+        self.send_url = send_url or os.getenv("GMAIL_SEND_URL", GMAIL_API_URL)
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.pool_size = pool_size
+        settings = get_settings()
+        # every send of this client, from any thread, draws from this one bucket
+        self.rate_limiter = TokenBucket(
+            settings.email_rate_per_second if rate_per_second is None else rate_per_second,
+            settings.email_rate_burst if burst is None else burst,
+        )
+        self._credentials: Optional[Credentials] = None
+        self._token_lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
 
     def _build_parent_login_url(self, override: Optional[str]) -> str:
         if override:
@@ -53,6 +99,25 @@ class GmailEmailClient:
         if not all([self.client_id, self.client_secret, self.refresh_token, self.sender_email]):
             raise ValueError("Incomplete Gmail configuration: set GMAIL_CLIENT_ID, GMAIL_CLIENT_SECRET, GMAIL_REFRESH_TOKEN, GMAIL_SENDER_EMAIL")
 
+    def _get_session(self) -> requests.Session:
+        # one keep-alive pool per client, shared by the token exchange and sends
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+
+    def _token_is_fresh(self, credentials: Optional[Credentials]) -> bool:
+        if credentials is None or not credentials.token:
+            return False
+        if credentials.expiry is None:
+            return True
+        return credentials.expiry - TOKEN_REFRESH_MARGIN > datetime.utcnow()
+
     def _build_credentials(self) -> Credentials:
         self._ensure_configured()
         credentials = Credentials(
@@ -63,10 +128,37 @@ class GmailEmailClient:
             client_secret=self.client_secret,
             scopes=self.scopes,
         )
-        request = google.auth.transport.requests.Request()
-        credentials.refresh(request)
+        credentials.refresh(_SessionRequest(self._get_session(), self.timeout[1]))
         return credentials
 
+    def get_access_token(self) -> str:
+        """Return a cached access token, refreshing it shortly before it expires.
+
+        Only one thread performs the refresh-token exchange; the others wait for
+        it and reuse the result.
+        """
+        credentials = self._credentials
+        if self._token_is_fresh(credentials):
+            return credentials.token
+        with self._token_lock:
+            credentials = self._credentials
+            if not self._token_is_fresh(credentials):
+                credentials = self._build_credentials()
+                self._credentials = credentials
+            return credentials.token
+
+    def invalidate_token(self, token: Optional[str] = None) -> None:
+        with self._token_lock:
+            # only drop the token the caller saw rejected, not a newer one
+            if token is None or (self._credentials is not None and self._credentials.token == token):
+                self._credentials = None
+
+    def close(self) -> None:
+        with self._session_lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
     def _create_message(self, to_email: str, subject: str, body: str) -> str:
         msg = MIMEText(body, "plain")
         msg["to"] = to_email
@@ -78,26 +170,208 @@ class GmailEmailClient:
         raw = base64.urlsafe_b64encode(msg.as_bytes()).decode()
         return raw
 
-    def send_temporary_password_email(self, to_email: str, password: str, parent_name: Optional[str] = None) -> None:
-        credentials = self._build_credentials()
-        subject = "Twoje tymczasowe hasło do portalu Skarbek"
-        body = (
-            f"Cześć {parent_name or 'rodzicu'},\n\n"
-            f"Wygenerowaliśmy dla Ciebie tymczasowe hasło: {password}\n"
-            "Po pierwszym zalogowaniu musisz je zmienić.\n\n"
-            f"Zaloguj się tutaj: {self.parent_login_url}\n\n"
-            "Pozdrawiamy,\nZespół Skarbek"
-        )
-        raw = self._create_message(to_email, subject, body)
+    def _post_message(self, raw: str, token: str) -> requests.Response:
+        self.rate_limiter.acquire()
         headers = {
-            "Authorization": f"Bearer {credentials.token}",
+            "Authorization": f"Bearer {token}",
             "Content-Type": "application/json",
         }
-        response = requests.post(GMAIL_API_URL, json={"raw": raw}, headers=headers)
+        return self._get_session().post(self.send_url, json={"raw": raw}, headers=headers, timeout=self.timeout)
+
+    def send_message(self, to_email: str, subject: str, body: str) -> None:
+        raw = self._create_message(to_email, subject, body)
+        token = self.get_access_token()
+        response = self._post_message(raw, token)
+        if response.status_code == 401:
+            # revoked or expired early: refresh once and retry
+            self.invalidate_token(token)
+            response = self._post_message(raw, self.get_access_token())
         if not response.ok:
             logger.error("Gmail API returned %s: %s", response.status_code, response.text)
             response.raise_for_status()
         logger.info("Wysłano wiadomość e-mail do %s", to_email)
 
+    def render_template(self, template: str, params: dict) -> Tuple[str, str]:
+        try:
+            subject, body = TEMPLATES[template]
+        except KeyError:
+            raise ValueError(f"Unknown email template: {template}")
+        values = {"login_url": self.parent_login_url, **params}
+        values["parent_name"] = values.get("parent_name") or "rodzicu"
+        return subject.format(**values), body.format(**values)
+
+    def send_template(self, to_email: str, template: str, params: dict) -> None:
+        subject, body = self.render_template(template, params)
+        self.send_message(to_email, subject, body)
+
+    def send_temporary_password_email(self, to_email: str, password: str, parent_name: Optional[str] = None) -> None:
+        self.send_template(to_email, "temporary_password", {"password": password, "parent_name": parent_name})
+
+    def send_bulk(
+        self,
+        messages: Sequence["BulkMessage"],
+        max_workers: int = 4,
+        max_attempts: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ) -> "BulkReport":
+        """Send many templated messages and report the outcome per recipient.
+
+        At most ``max_workers`` sends are in flight. They draw from the client's
+        token bucket (``EMAIL_RATE_PER_SECOND``, bursts up to ``EMAIL_RATE_BURST``),
+        shared with every other send, so concurrent bulk sends and the outbox
+        together stay within one budget. 429 and 5xx responses and connection
+        errors are retried with full-jitter exponential backoff; a
+        ``Retry-After`` header is honoured and, on 429, pauses the whole bucket.
+        Other failures are final. Results keep the input order.
+        """
+        def send_one(message: BulkMessage) -> BulkResult:
+            return _send_with_retry(self, message, max_attempts, base_delay, max_delay)
+
+        started = time.monotonic()
+        if max_workers <= 1:
+            results = [send_one(m) for m in messages]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gmail-bulk") as executor:
+                results = list(executor.map(send_one, messages))
+        return BulkReport(results=results, elapsed_seconds=time.monotonic() - started)
+
+
+class BulkMessage(NamedTuple):
+    to_email: str
+    template: str
+    params: dict
+
+
+@dataclass
+class BulkResult:
+    to_email: str
+    status: str  # "sent" | "failed"
+    attempts: int
+    error: Optional[str] = None
+    http_status: Optional[int] = None
+
+
+@dataclass
+class BulkReport:
+    results: List[BulkResult] = field(default_factory=list)
+    elapsed_seconds: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return sum(1 for r in self.results if r.status == "sent")
+
+    @property
+    def failed(self) -> int:
+        return len(self.results) - self.sent
+
+    def to_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "results": [vars(r) for r in self.results],
+        }
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by all senders of a client."""
+
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    if self.rate > 0:
+                        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    else:
+                        self._tokens = self.capacity
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every sender back for ``seconds`` (provider said we are too fast)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None  # HTTP-date form; fall back to our own backoff
+
+
+def _send_with_retry(client: "GmailEmailClient", message: BulkMessage,
+                     max_attempts: int, base_delay: float, max_delay: float) -> BulkResult:
+    try:
+        subject, body = client.render_template(message.template, message.params)
+    except (ValueError, KeyError) as exc:
+        return BulkResult(message.to_email, "failed", 0, error=f"template: {exc}")
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            client.send_message(message.to_email, subject, body)
+            return BulkResult(message.to_email, "sent", attempt)
+        except requests.HTTPError as exc:
+            response = exc.response
+            status = response.status_code if response is not None else None
+            if status not in RETRYABLE_STATUS or attempt >= max_attempts:
+                return BulkResult(message.to_email, "failed", attempt, error=str(exc), http_status=status)
+            delay = _retry_after(response)
+            if status == 429:
+                client.rate_limiter.pause(delay if delay is not None else base_delay)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt >= max_attempts:
+                return BulkResult(message.to_email, "failed", attempt, error=str(exc))
+            delay = None
+        except Exception as exc:
+            return BulkResult(message.to_email, "failed", attempt, error=str(exc))
+        if delay is None:
+            # full jitter keeps retrying workers from moving in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+        time.sleep(delay)
+
+
+class _SessionRequest(google.auth.transport.requests.Request):
+    """google-auth transport over the client's pooled session.
+
+    The stock class closes its session when garbage collected, which would
+    tear down the shared connection pool after every refresh; it also has no
+    timeout knob for ``Credentials.refresh``, so a default one is applied here.
+    """
+
+    def __init__(self, session: requests.Session, timeout: float):
+        super().__init__(session=session)
+        self._timeout = timeout
+
+    def __del__(self):
+        pass
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        return super().__call__(url, method=method, body=body, headers=headers,
+                                timeout=timeout or self._timeout, **kwargs)
+
 
 gmail_client = GmailEmailClient()
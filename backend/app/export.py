@@ -0,0 +1,156 @@
+"""CSV and XLSX encoders for streamed exports.
+
+Both take a header and an async iterator of row batches (lists of tuples, as
+produced by ``result.partitions()`` on a streamed query) and yield bytes for
+``StreamingResponse``, so an export holds one batch in memory whatever its
+size. The XLSX workbook is written through ``zipfile`` onto an unseekable
+sink: entries use data descriptors and the sheet is deflated as it is
+produced, one ``<row>`` at a time with inline strings.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from typing import AsyncIterable, AsyncIterator, List, Sequence
+from xml.sax.saxutils import escape
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FORMATS = {"csv": CSV_MEDIA_TYPE, "xlsx": XLSX_MEDIA_TYPE}
+# characters XML 1.0 cannot carry, e.g. control codes pasted into a note
+_SHEET_NAME_INVALID = re.compile(r"[\[\]:*?/\\]")
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+# a CSV cell starting with one of these is run as a formula by spreadsheet programs
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=" ", timespec="seconds") if isinstance(value, datetime) else value.isoformat()
+    return str(value)
+
+
+def _csv_text(value) -> str:
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(_FORMULA_PREFIXES):
+        # a name or note like "=HYPERLINK(...)" stays text when the file is opened
+        return "'" + text
+    return text
+
+
+async def stream_csv(header: Sequence[str], batches: AsyncIterable[List[Sequence]]) -> AsyncIterator[bytes]:
+    """UTF-8 CSV with a BOM so spreadsheet programs detect the encoding.
+
+    Text cells that would start a formula get a leading ``'``; numbers keep
+    their sign. XLSX cells are inline strings, which are never evaluated.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    writer.writerow(header)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_text(v) for v in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _cell(value) -> str:
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value!r}</v></c>'
+    if value is None:
+        return '<c/>'
+    text = escape(_XML_INVALID.sub("", _text(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _row(values: Sequence) -> str:
+    return '<row>' + ''.join(_cell(v) for v in values) + '</row>'
+
+
+class _Sink(io.RawIOBase):
+    """Write-only, unseekable buffer that ``zipfile`` streams into."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_xlsx(header: Sequence[str], batches: AsyncIterable[List[Sequence]],
+                      sheet_name: str = "Arkusz1") -> AsyncIterator[bytes]:
+    """Single-sheet workbook; the first row is ``header``."""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        name = _SHEET_NAME_INVALID.sub(" ", sheet_name)[:31]
+        archive.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(name, {'"': "&quot;"})))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        # the sheet size is unknown up front; without force_zip64 zipfile
+        # refuses entries over 2 GiB, far beyond any school roster
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write((_SHEET_START + _row(header)).encode("utf-8"))
+            async for batch in batches:
+                sheet.write("".join(_row(row) for row in batch).encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+            sheet.write(_SHEET_END.encode("utf-8"))
+    yield sink.drain()
@@ -0,0 +1,83 @@
+"""Process pool for CPU-bound password hashing.
+
+pbkdf2 holds the GIL for tens of milliseconds per call, so running it on the
+event loop (or even the threadpool) stalls every other request in the worker.
+Jobs submitted here run in ``PASSWORD_HASH_WORKERS`` separate processes;
+with 0 workers they fall back to the threadpool.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .metrics import PASSWORD_HASH_SECONDS
+from .settings import get_settings
+
+_executor: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_hash_executor() -> Optional[ProcessPoolExecutor]:
+    global _executor
+    if _executor is None:
+        workers = get_settings().password_hash_workers
+        if workers <= 0:
+            return None
+        with _lock:
+            if _executor is None:
+                # spawn: never fork a process that already runs an event loop and threads
+                _executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _executor
+
+
+async def run_in_hash_pool(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run a picklable top-level function on the hash pool and await its result."""
+    executor = get_hash_executor()
+    started = time.perf_counter()
+    try:
+        if executor is None:
+            return await run_in_threadpool(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, fn, *args)
+    finally:
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, fn.__name__)
+
+
+def map_in_hash_pool(fn: Callable[..., Any], *iterables: Any, chunksize: int = 16) -> list:
+    """Blocking bulk variant for batch jobs (imports, scripts)."""
+    executor = get_hash_executor()
+    started = time.perf_counter()
+    try:
+        if executor is None:
+            return list(map(fn, *iterables))
+        return list(executor.map(fn, *iterables, chunksize=chunksize))
+    finally:
+        # one observation per batch, whatever its size
+        PASSWORD_HASH_SECONDS.observe(time.perf_counter() - started, f"{fn.__name__}_batch")
+
+
+def shutdown_hash_pool(wait: bool = True) -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _reset_after_fork() -> None:
+    # the parent's worker processes and pipes are not ours to use
+    global _executor, _lock
+    _executor = None
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,55 @@
+"""ETag / conditional GET helpers.
+
+Responses are serialised once, hashed into a strong ETag and answered with
+``304 Not Modified`` when the client's ``If-None-Match`` already has it.
+"""
+import hashlib
+from typing import Any, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .streaming import json_dumps
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # weak comparison (RFC 7232 2.3.2): W/ prefixes are ignored for GET
+    candidates = (tag.strip() for tag in header.split(","))
+    return etag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def not_modified(etag: str, cache_control: Optional[str] = None) -> Response:
+    headers = {"ETag": etag}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    return Response(status_code=304, headers=headers)
+
+
+def conditional_response(request: Request, body: bytes, etag: str, cache_control: str = "private, no-cache",
+                         headers: Optional[dict] = None) -> Response:
+    """200 with an already serialised JSON ``body``, or 304 if ``etag`` matches."""
+    if etag_matches(request, etag):
+        response = not_modified(etag, cache_control)
+    else:
+        response = Response(
+            body,
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": cache_control},
+        )
+    response.headers.update(headers or {})
+    return response
+
+
+def conditional_json(request: Request, content: Any, cache_control: str = "private, no-cache") -> Response:
+    """Serialise ``content`` and return 200 with an ETag, or 304 if unchanged."""
+    body = json_dumps(content).encode("utf-8")
+    return conditional_response(request, body, make_etag(body), cache_control)
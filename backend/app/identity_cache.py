@@ -0,0 +1,87 @@
+"""In-process, TTL-bounded cache of parent identities keyed by parent id.
+
+Parent tokens carry ``pid`` (parent id) and ``cv`` (credentials version), so
+most parent reads can be authorised from this cache without selecting the
+``Parent`` row. Entries are invalidated locally whenever the password or email
+changes. Other worker processes keep their entry until it expires, so a token
+issued after the change carries a newer ``cv`` than they have cached: such a
+token makes ``get_current_parent`` re-read the row instead of rejecting it.
+Old tokens are still accepted by those workers for up to ``ttl_seconds``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from .settings import get_settings
+
+
+@dataclass(frozen=True)
+class ParentIdentity:
+    id: int
+    email: Optional[str]
+    name: Optional[str]
+    force_password_change: bool
+    credentials_version: int
+
+    @classmethod
+    def from_parent(cls, parent) -> "ParentIdentity":
+        return cls(
+            id=parent.id,
+            email=parent.email,
+            name=parent.name,
+            force_password_change=bool(parent.force_password_change),
+            credentials_version=parent.credentials_version or 0,
+        )
+
+
+class IdentityCache:
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, parent_id: int) -> Optional[ParentIdentity]:
+        if self.ttl_seconds <= 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(parent_id)
+            if entry is None:
+                return None
+            identity, expires_at = entry
+            if expires_at <= now:
+                del self._entries[parent_id]
+                return None
+            self._entries.move_to_end(parent_id)
+            return identity
+
+    def put(self, identity: ParentIdentity) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[identity.id] = (identity, expires_at)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, parent_id: int) -> None:
+        with self._lock:
+            self._entries.pop(parent_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_settings = get_settings()
+parent_identity_cache = IdentityCache(
+    ttl_seconds=_settings.parent_identity_cache_ttl,
+    max_entries=_settings.parent_identity_cache_size,
+)
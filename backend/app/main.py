@@ -1,11 +1,22 @@
-from fastapi import FastAPI
+import hmac
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response
 from .api import router as api_router
 from .api import parents as parents_router
-from .db import init_db
-from .middleware import AdminAuthMiddleware
+from .db import init_db, dispose_engine
+from .hashing import shutdown_hash_pool
+from .middleware import AdminAuthMiddleware, MetricsMiddleware, ProfilingMiddleware, QueryStatsMiddleware
+from .settings import get_settings
+from . import metrics, outbox
 
 app = FastAPI(title="Skarbek API")
 app.add_middleware(AdminAuthMiddleware)
+if get_settings().query_stats_enabled:
+    # outside the admin auth check, so its queries are counted too
+    app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+# outermost, so a profile covers the whole stack
+app.add_middleware(ProfilingMiddleware)
 app.include_router(api_router, prefix="/api")
 app.include_router(parents_router.router, prefix="/api")
 
@@ -15,6 +26,44 @@ def on_startup():
     init_db()
 
 
+@app.on_event("startup")
+async def start_outbox_worker():
+    outbox.start_worker()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_worker():
+    await outbox.stop_worker()
+
+
+@app.on_event("startup")
+def start_metrics_flusher():
+    metrics.start_flusher()
+
+
+@app.on_event("shutdown")
+def stop_metrics_flusher():
+    metrics.stop_flusher()
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    dispose_engine()
+    shutdown_hash_pool()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint(request: Request):
+    # sync: the outbox gauge runs a query
+    token = get_settings().metrics_token
+    if not token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    auth = request.headers.get("authorization") or ""
+    if not hmac.compare_digest(auth.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="unauthorized")
+    return Response(metrics.generate_latest(), media_type=metrics.CONTENT_TYPE)
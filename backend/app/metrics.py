@@ -0,0 +1,426 @@
+"""Prometheus text-format metrics, without a client library.
+
+Counters, gauges and histograms keep one shard (a plain dict) per thread.
+The hot path only touches its own thread's shard, so recording takes no
+lock; a scrape copies and sums every shard. Callback gauges (pool usage,
+outbox depth) are evaluated at scrape time instead of being kept current.
+
+With several uvicorn workers a scrape only reaches one of them, so each
+process also writes a JSON snapshot of its metrics to
+``METRICS_MULTIPROC_DIR`` every ``METRICS_FLUSH_INTERVAL`` seconds (and when
+it is scraped or shuts down). The scraped worker merges every snapshot in
+the directory: counters and histograms are summed over all processes,
+including exited ones, so totals never go backwards while the service
+runs; gauges only over processes that are still alive. Clear the directory
+whenever the service starts.
+"""
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+LabelValues = Tuple[str, ...]
+
+
+class _Shards:
+    """One dict per thread; the lock is only taken when a thread gets its first shard."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # dict() of a str/tuple-keyed dict runs without releasing the GIL
+        return [dict(shard) for shard in shards]
+
+    def clear(self) -> None:
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _Shards()
+
+    def samples(self) -> Dict[LabelValues, float]:
+        merged: Dict[LabelValues, float] = {}
+        for shard in self._shards.snapshot():
+            for labels, value in shard.items():
+                merged[labels] = merged.get(labels, 0.0) + value
+        return merged
+
+    def family(self) -> dict:
+        return {"type": self.type, "help": self.documentation, "labelnames": list(self.labelnames),
+                "samples": self.samples()}
+
+    def clear(self) -> None:
+        self._shards.clear()
+
+
+class Counter(_Metric):
+    type = COUNTER
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """Additive gauge (``inc``/``dec``); shards are summed like a counter's."""
+
+    type = GAUGE
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0.0) + amount
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    type = HISTOGRAM
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        shard = self._shards.get()
+        entry = shard.get(labels)
+        if entry is None:
+            # per-bucket (not cumulative) counts, the +Inf bucket, then the sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 2)
+        entry[bisect.bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def samples(self) -> Dict[LabelValues, list]:
+        merged: Dict[LabelValues, list] = {}
+        for shard in self._shards.snapshot():
+            for labels, entry in shard.items():
+                into = merged.setdefault(labels, [0] * len(entry))
+                for i, value in enumerate(list(entry)):
+                    into[i] += value
+        return merged
+
+    def family(self) -> dict:
+        family = super().family()
+        family["buckets"] = list(self.buckets)
+        return family
+
+
+class CallbackGauge:
+    """Gauge read from ``fn`` (``{label values: value}``) at scrape time.
+
+    ``per_process`` gauges describe this process (pool usage) and go into
+    multiprocess snapshots; the others read shared state (the database) and
+    are only evaluated by the scraped process.
+    """
+
+    type = GAUGE
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 fn: Callable[[], Dict[LabelValues, float]], per_process: bool = True):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+        self.per_process = per_process
+
+    def family(self) -> Optional[dict]:
+        try:
+            samples = dict(self.fn())
+        except Exception as exc:
+            logger.warning('Nie udało się odczytać metryki %s: %s', self.name, exc)
+            return None
+        return {"type": GAUGE, "help": self.documentation, "labelnames": list(self.labelnames), "samples": samples}
+
+    def clear(self) -> None:
+        pass
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def collect(self, per_process: Optional[bool] = None) -> Dict[str, dict]:
+        """All families, or only the per-process ones (True) or only the shared callbacks (False)."""
+        families = {}
+        for name, metric in self._metrics.items():
+            if per_process is not None and getattr(metric, "per_process", True) != per_process:
+                continue
+            family = metric.family()
+            if family is not None:
+                families[name] = family
+        return families
+
+    def clear(self) -> None:
+        for metric in self._metrics.values():
+            metric.clear()
+
+
+# --- text exposition ---
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape(value: str) -> str:
+    return _escape_help(value).replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render(families: Dict[str, dict]) -> str:
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        names = family["labelnames"]
+        lines.append(f"# HELP {name} {_escape_help(family['help'])}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in sorted(family["samples"].items()):
+            if family["type"] != HISTOGRAM:
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(list(family["buckets"]) + [float("inf")], value[:-1]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{name}_bucket{_labels(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(names, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# --- multiprocess snapshots ---
+
+def _to_json(families: Dict[str, dict]) -> dict:
+    return {name: {**family, "samples": [[list(labels), value] for labels, value in family["samples"].items()]}
+            for name, family in families.items()}
+
+
+def _from_json(data: dict) -> Dict[str, dict]:
+    return {name: {**family, "samples": {tuple(labels): value for labels, value in family["samples"]}}
+            for name, family in data.items()}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(into: Dict[str, dict], families: Dict[str, dict], alive: bool) -> None:
+    for name, family in families.items():
+        if family["type"] == GAUGE and not alive:
+            continue
+        target = into.setdefault(name, {**family, "samples": {}})
+        for labels, value in family["samples"].items():
+            if family["type"] == HISTOGRAM:
+                current = target["samples"].setdefault(labels, [0] * len(value))
+                for i, v in enumerate(value):
+                    current[i] += v
+            else:
+                target["samples"][labels] = target["samples"].get(labels, 0.0) + value
+
+
+class MultiprocessStore:
+    """``metrics_<pid>.json`` snapshots of every worker in one directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def write(self, families: Dict[str, dict], pid: Optional[int] = None) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"metrics_{pid or os.getpid()}.json")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".metrics_", suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(_to_json(families), f)
+        os.replace(tmp, path)
+
+    def read(self) -> List[Tuple[int, Dict[str, dict]]]:
+        snapshots = []
+        for entry in sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []:
+            if not (entry.startswith("metrics_") and entry.endswith(".json")):
+                continue
+            try:
+                pid = int(entry[len("metrics_"):-len(".json")])
+                with open(os.path.join(self.directory, entry)) as f:
+                    snapshots.append((pid, _from_json(json.load(f))))
+            except (ValueError, OSError) as exc:
+                logger.warning('Pominięto plik metryk %s: %s', entry, exc)
+        return snapshots
+
+
+REGISTRY = Registry()
+
+
+def _multiprocess_store() -> Optional[MultiprocessStore]:
+    directory = get_settings().metrics_multiproc_dir
+    return MultiprocessStore(directory) if directory else None
+
+
+def flush(registry: Registry = REGISTRY) -> None:
+    """Write this process's snapshot (no-op without a multiprocess directory)."""
+    store = _multiprocess_store()
+    if store is not None:
+        store.write(registry.collect(per_process=True))
+
+
+def generate_latest(registry: Registry = REGISTRY) -> str:
+    """Exposition text for a scrape: this process, or all workers when multiprocess."""
+    store = _multiprocess_store()
+    if store is None:
+        return render(registry.collect())
+    store.write(registry.collect(per_process=True))
+    merged: Dict[str, dict] = {}
+    own = os.getpid()
+    for pid, families in store.read():
+        _merge(merged, families, alive=pid == own or _pid_alive(pid))
+    merged.update(registry.collect(per_process=False))
+    return render(merged)
+
+
+_flusher: Optional[threading.Thread] = None
+_flusher_stop = threading.Event()
+
+
+def _flush_loop(interval: float) -> None:
+    while not _flusher_stop.wait(interval):
+        try:
+            flush()
+        except Exception:
+            logger.exception('Błąd zapisu metryk')
+
+
+def start_flusher() -> None:
+    """Periodically write snapshots when a multiprocess directory is set (app startup)."""
+    global _flusher
+    settings = get_settings()
+    if _flusher is not None or not settings.metrics_multiproc_dir:
+        return
+    _flusher_stop.clear()
+    _flusher = threading.Thread(target=_flush_loop, args=(settings.metrics_flush_interval,),
+                                name="metrics-flush", daemon=True)
+    _flusher.start()
+
+
+def stop_flusher() -> None:
+    global _flusher
+    thread, _flusher = _flusher, None
+    if thread is None:
+        return
+    _flusher_stop.set()
+    thread.join(timeout=5)
+    flush()
+
+
+# --- the application's metrics ---
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "skarbek_http_requests_total", "HTTP requests by method, route template and status.",
+    ("method", "route", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "skarbek_http_request_duration_seconds", "Time until the response body was sent, by route template.",
+    ("method", "route")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "skarbek_http_requests_in_flight", "HTTP requests currently being served."))
+PASSWORD_HASH_SECONDS = REGISTRY.register(Histogram(
+    "skarbek_password_hash_seconds", "Password hashing/verification time including the hash pool queue.",
+    ("operation",)))
+OUTBOX_SEND_SECONDS = REGISTRY.register(Histogram(
+    "skarbek_outbox_send_seconds", "Time spent delivering one outbox message, by outcome.",
+    ("outcome",)))
+
+
+def _pool_stats() -> Dict[LabelValues, float]:
+    from . import db, db_async
+
+    engines = {"sync": db._engine}
+    if db_async._async_engine is not None:
+        engines["async"] = db_async._async_engine.sync_engine
+    samples = {}
+    for label, engine in engines.items():
+        pool = getattr(engine, "pool", None)
+        # sqlite's NullPool/SingletonThreadPool keep no counters
+        if pool is None or not hasattr(pool, "checkedout"):
+            continue
+        samples[(label, "checked_out")] = pool.checkedout()
+        samples[(label, "overflow")] = max(pool.overflow(), 0)
+        samples[(label, "size")] = pool.size()
+    return samples
+
+
+def _outbox_depth() -> Dict[LabelValues, float]:
+    from sqlalchemy import func, select
+    from . import db
+    from .models import EmailOutbox
+    from .outbox import SENT
+
+    with db.get_db() as session:
+        rows = session.execute(
+            select(EmailOutbox.status, func.count()).where(EmailOutbox.status != SENT).group_by(EmailOutbox.status)
+        ).all()
+    return {(status,): count for status, count in rows}
+
+
+DB_POOL = REGISTRY.register(CallbackGauge(
+    "skarbek_db_pool_connections", "Connection pool usage by engine (sync/async) and state.",
+    ("engine", "state"), _pool_stats))
+OUTBOX_DEPTH = REGISTRY.register(CallbackGauge(
+    "skarbek_outbox_messages", "Email outbox messages not yet sent, by status.",
+    ("status",), _outbox_depth, per_process=False))
@@ -1,30 +1,271 @@
-from starlette.middleware.base import BaseHTTPMiddleware
+import cProfile
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+from urllib.parse import parse_qsl
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
 from starlette.responses import JSONResponse
-from starlette.types import ASGIApp, Receive, Scope, Send
-from typing import Callable
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from . import metrics, query_stats
 from .auth import decode_token
+from .profiling import profile_meta, profile_store
+from .settings import get_settings
 
+logger = logging.getLogger(__name__)
 
-class AdminAuthMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
+ADMIN_PREFIX = "/api/admin"
+ADMIN_LOGIN_PREFIX = "/api/admin/login"
+
+
+class VerifiedTokenCache:
+    """LRU of already verified admin tokens, each kept until its own ``exp``.
+
+    Only touched from the event loop, so no lock is needed.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, token: str) -> Optional[dict]:
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[token]
+            return None
+        self._entries.move_to_end(token)
+        return payload
+
+    def put(self, token: str, payload: dict) -> None:
+        expires_at = payload.get("exp")
+        if self.max_entries <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        self._entries[token] = (payload, expires_at)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AdminAuthMiddleware:
+    """Bearer-token check for admin routes as plain ASGI.
+
+    Everything outside ``/api/admin`` is handed straight to the app, with no
+    extra task or response stream around it.
+    """
 
-    async def dispatch(self, request, call_next: Callable):
-        path = request.url.path
+    def __init__(self, app: ASGIApp, cache_size: Optional[int] = None):
+        self.app = app
+        if cache_size is None:
+            cache_size = get_settings().admin_token_cache_size
+        self.token_cache = VerifiedTokenCache(cache_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
         # protect admin routes except login
-        if path.startswith("/api/admin") and not path.startswith("/api/admin/login"):
-            auth = request.headers.get("authorization")
-            if not auth:
-                return JSONResponse({"detail": "Missing authorization header"}, status_code=401)
+        if not path.startswith(ADMIN_PREFIX) or path.startswith(ADMIN_LOGIN_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        auth = Headers(scope=scope).get("authorization")
+        if not auth:
+            await self._reject("Missing authorization header", scope, receive, send)
+            return
 
-            parts = auth.split()
-            if len(parts) != 2 or parts[0].lower() != "bearer":
-                return JSONResponse({"detail": "Invalid authorization format"}, status_code=401)
+        parts = auth.split()
+        if len(parts) != 2 or parts[0].lower() != "bearer":
+            await self._reject("Invalid authorization format", scope, receive, send)
+            return
 
-            token = parts[1]
+        token = parts[1]
+        payload = self.token_cache.get(token)
+        if payload is None:
             payload = decode_token(token)
             if not payload:
-                return JSONResponse({"detail": "Invalid token"}, status_code=401)
-            # attach user identity to request state
-            request.state.user = payload.get("sub")
-        return await call_next(request)
+                await self._reject("Invalid token", scope, receive, send)
+                return
+            self.token_cache.put(token, payload)
+        # attach user identity to request state
+        scope.setdefault("state", {})["user"] = payload.get("sub")
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(detail: str, scope: Scope, receive: Receive, send: Send) -> None:
+        response = JSONResponse({"detail": detail}, status_code=401)
+        await response(scope, receive, send)
+
+
+class QueryStatsMiddleware:
+    """Adds ``X-Query-Count`` and ``Server-Timing: db`` to every HTTP response.
+
+    The numbers cover the statements run before the response started; rows a
+    ``StreamingResponse`` reads afterwards are not in the headers, but still
+    count towards the N+1 warning logged when the request finishes.
+    """
+
+    def __init__(self, app: ASGIApp, repeat_threshold: Optional[int] = None):
+        self.app = app
+        if repeat_threshold is None:
+            repeat_threshold = get_settings().query_stats_repeat_threshold
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with query_stats.track() as stats:
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-Query-Count", str(stats.count))
+                    headers.append("Server-Timing", f'db;dur={stats.duration_ms:.1f};desc="{stats.count} queries"')
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_stats)
+            finally:
+                for statement, count in stats.repeated(self.repeat_threshold):
+                    logger.warning('Możliwe N+1: %s %s wykonało %s razy to samo zapytanie: %s',
+                                   scope["method"], scope["path"], count, statement)
+
+
+class MetricsMiddleware:
+    """Request count, latency and in-flight gauge per route template.
+
+    The route template (``/api/admin/campaigns/{campaign_id}/roster``) is
+    read from the scope after routing, so label values stay bounded;
+    unrouted paths share ``<unmatched>``. The scope is also bound for the
+    SQL listeners, which tag slow queries with the route.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics.HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            with query_stats.bind_request(scope):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            metrics.HTTP_REQUESTS.inc(scope["method"], template, str(status))
+            metrics.HTTP_LATENCY.observe(elapsed, scope["method"], template)
+
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_TOKEN_HEADER = "x-profile-token"
+PROFILE_QUERY_PARAM = "_profile"
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    payload = decode_token(token) if token else None
+    # admin tokens carry only the username; parent tokens have role=parent
+    return bool(payload) and payload.get("role") is None
+
+
+class ProfilingMiddleware:
+    """Runs one request under cProfile when an admin asks for it.
+
+    Triggered by an ``X-Profile: 1`` header or a ``_profile=1`` query flag,
+    with an admin token in ``X-Profile-Token`` or (for admin routes) in
+    ``Authorization``. The profile is saved to ``app.profiling`` under the
+    id returned in ``X-Profile-Id``. Requests without the flag pass straight
+    through; a flag without an admin token is ignored.
+
+    cProfile sees the event-loop thread while the request runs: sync
+    endpoints executed in the threadpool only show up as the wait for their
+    result, and requests served concurrently can appear in the profile. One
+    request is profiled at a time; one asking while another is profiled
+    gets ``X-Profile-Id: busy`` and runs normally.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._busy = False
+
+    @staticmethod
+    def _requested(scope: Scope) -> bool:
+        if any(name == PROFILE_HEADER and value.strip() == b"1" for name, value in scope["headers"]):
+            return True
+        query = scope["query_string"]
+        # parsed only when the name appears at all, so ordinary requests skip it
+        if PROFILE_QUERY_PARAM.encode() not in query:
+            return False
+        return (PROFILE_QUERY_PARAM, "1") in parse_qsl(query.decode("latin-1"))
+
+    @staticmethod
+    def _authorized(scope: Scope) -> bool:
+        headers = Headers(scope=scope)
+        token = headers.get(PROFILE_TOKEN_HEADER)
+        if token is None:
+            parts = (headers.get("authorization") or "").split()
+            token = parts[1] if len(parts) == 2 and parts[0].lower() == "bearer" else None
+        return is_admin_token(token)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope["type"] != "http" or not self._requested(scope)
+                or not get_settings().profiling_enabled or not self._authorized(scope)):
+            await self.app(scope, receive, send)
+            return
+        if self._busy:
+            await self.app(scope, receive, self._send_with_id(send, "busy"))
+            return
+
+        self._busy = True
+        profile_id = profile_store.new_id()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, self._send_with_id(send_with_status, profile_id))
+        finally:
+            profiler.disable()
+            duration = time.perf_counter() - started
+            self._busy = False
+            await run_in_threadpool(profile_store.save, profile_id, profiler, profile_meta(scope, status, duration))
+            logger.info('Zapisano profil %s dla %s %s', profile_id, scope["method"], scope["path"])
+
+    @staticmethod
+    def _send_with_id(send: Send, profile_id: str) -> Send:
+        async def wrapped(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+        return wrapped
@@ -1,5 +1,6 @@
 from typing import Optional
 from datetime import datetime
+from sqlalchemy import Index, func
 from sqlmodel import SQLModel, Field
 
 
@@ -26,8 +27,8 @@ class CampaignCreate(CampaignBase):
 class Parent(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: Optional[str] = None
-    email: Optional[str] = None
-    pupil_id: Optional[str] = None
+    email: Optional[str] = Field(default=None, index=True)
+    pupil_id: Optional[str] = Field(default=None, index=True)
     password_hash: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     # admin-visible flag: when True, parent is hidden from normal admin lists
@@ -35,12 +36,20 @@ class Parent(SQLModel, table=True):
     # force password change on first login
     force_password_change: bool = Field(default=True)
     password_changed_at: Optional[datetime] = None
+    # bumped on password/email change; tokens carrying an older value are rejected
+    credentials_version: int = Field(default=0)
 
 
 class Contribution(SQLModel, table=True):
+    # one contribution per (campaign, parent); the unique index also serves
+    # campaign-only lookups through its leading column
+    __table_args__ = (
+        Index('uq_contribution_campaign_parent', 'campaign_id', 'parent_id', unique=True),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    campaign_id: int
-    parent_id: int
+    campaign_id: int = Field(foreign_key='campaign.id')
+    parent_id: int = Field(foreign_key='parent.id', index=True)
     amount_expected: Optional[float] = 0.0
     amount_paid: Optional[float] = 0.0
     status: Optional[str] = "pending"
@@ -48,9 +57,57 @@ class Contribution(SQLModel, table=True):
     note: Optional[str] = None
 
 
+class CampaignTotals(SQLModel, table=True):
+    # Per-campaign aggregates of its contributions so progress views read one
+    # row per campaign. Kept current by app/campaign_totals.py in the same
+    # transaction as every contribution write; rebuildable from contribution.
+    # Anything not 'paid' counts as pending, as in the roster summary.
+    campaign_id: int = Field(foreign_key='campaign.id', primary_key=True)
+    contributions: int = Field(default=0)
+    pending_count: int = Field(default=0)
+    paid_count: int = Field(default=0)
+    expected_sum: float = Field(default=0.0)
+    # amount_paid of paid contributions only; pending declarations don't count
+    paid_sum: float = Field(default=0.0)
+
+
+# Expression/partial indexes need the mapped columns, so they are declared
+# after the classes. Keep in sync with migrations/002_add_lookup_indexes.sql.
+Index('uq_parent_email_lower', func.lower(Parent.__table__.c.email), unique=True)
+Index(
+    'ix_campaign_active_live',
+    Campaign.__table__.c.id,
+    postgresql_where=(Campaign.__table__.c.active == True) & Campaign.__table__.c.deleted_at.is_(None),
+    sqlite_where=(Campaign.__table__.c.active == True) & Campaign.__table__.c.deleted_at.is_(None),
+)
+
+
 class AdminUser(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     username: str
     password_hash: str
     role: Optional[str] = "admin"
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class EmailOutbox(SQLModel, table=True):
+    # Written in the same transaction as the change that triggers the email and
+    # drained by app/outbox.py. status: pending -> sending (leased until
+    # next_attempt_at) -> sent | pending (retry) | dead.
+    __table_args__ = (
+        Index('ix_emailoutbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    to_email: str
+    parent_id: Optional[int] = Field(default=None, foreign_key='parent.id')
+    # JSON with the template variables; cleared once the message is sent
+    # because it may hold a temporary password
+    payload: Optional[str] = None
+    status: str = Field(default='pending')
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    sent_at: Optional[datetime] = None
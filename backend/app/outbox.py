@@ -0,0 +1,284 @@
+"""Transactional email outbox.
+
+Request handlers add an ``EmailOutbox`` row in the same transaction as the
+change that needs an email (see ``enqueue_temporary_password``) and return
+without talking to the provider. ``drain_outbox`` delivers due messages:
+
+* a temporary password is never stored in the outbox: it is generated when
+  the message is sent, its hash replaces the parent's ``password_hash`` in
+  the same step, and every retry issues a new one;
+
+* a message is claimed with a conditional UPDATE (status + lease), so the
+  in-process worker, a request's background task and a standalone worker can
+  run side by side without sending anything twice;
+* failures are retried with exponential backoff and the message goes
+  ``dead`` after ``OUTBOX_MAX_ATTEMPTS``; an admin can requeue it;
+* a worker that dies mid-send leaves the row ``sending`` until its lease
+  expires, after which it is picked up again.
+
+Standalone worker (from backend/)::
+
+    python -m app.outbox            # poll forever
+    python -m app.outbox --once     # drain what is due and exit
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy import update
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from . import db
+from .auth import hash_passwords
+from .identity_cache import parent_identity_cache
+from .metrics import OUTBOX_SEND_SECONDS
+from .models import EmailOutbox, Parent
+from .settings import get_settings
+from .utils import generate_readable_password
+
+logger = logging.getLogger(__name__)
+
+TEMPORARY_PASSWORD = 'temporary_password'
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+DEAD = 'dead'
+STATUSES = (PENDING, SENDING, SENT, DEAD)
+
+
+def _send_temporary_password(email_client, to_email: str, data: dict) -> None:
+    email_client.send_temporary_password_email(to_email, data['password'], parent_name=data.get('parent_name'))
+
+
+SENDERS: Dict[str, Callable] = {
+    TEMPORARY_PASSWORD: _send_temporary_password,
+}
+
+
+class Undeliverable(Exception):
+    """The message can never be sent; it goes ``dead`` without further retries."""
+
+
+def enqueue_temporary_password(session, parent) -> EmailOutbox:
+    """Add the temporary-password email to ``session``; the caller commits."""
+    message = EmailOutbox(
+        kind=TEMPORARY_PASSWORD,
+        to_email=parent.email,
+        parent_id=parent.id,
+        payload=json.dumps({'parent_name': parent.name}),
+    )
+    session.add(message)
+    return message
+
+
+def temporary_password_row(parent_id: int, to_email: str, parent_name, now: datetime) -> dict:
+    """Column values for a bulk (executemany) insert into the outbox table."""
+    return {
+        'kind': TEMPORARY_PASSWORD,
+        'to_email': to_email,
+        'parent_id': parent_id,
+        'payload': json.dumps({'parent_name': parent_name}),
+        'status': PENDING,
+        'attempts': 0,
+        'next_attempt_at': now,
+        'last_error': None,
+        'created_at': now,
+        'sent_at': None,
+    }
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    settings = get_settings()
+    seconds = settings.outbox_backoff_base * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, settings.outbox_backoff_max))
+
+
+def _claim(session: Session, ids: Optional[Iterable[int]], limit: int, now: datetime) -> list:
+    stmt = (
+        select(EmailOutbox.id, EmailOutbox.status, EmailOutbox.next_attempt_at)
+        .where(EmailOutbox.status.in_((PENDING, SENDING)), EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(limit)
+    )
+    if ids is not None:
+        stmt = stmt.where(EmailOutbox.id.in_(list(ids)))
+    lease_until = now + timedelta(seconds=get_settings().outbox_lease_seconds)
+    claimed = []
+    for message_id, status, next_attempt_at in session.exec(stmt).all():
+        # only the claimer that still sees the row unchanged wins it
+        result = session.execute(
+            update(EmailOutbox)
+            .where(
+                EmailOutbox.id == message_id,
+                EmailOutbox.status == status,
+                EmailOutbox.next_attempt_at == next_attempt_at,
+            )
+            .values(status=SENDING, attempts=EmailOutbox.attempts + 1, next_attempt_at=lease_until)
+        )
+        if result.rowcount == 1:
+            claimed.append(message_id)
+    session.commit()
+    if not claimed:
+        return []
+    return session.exec(select(EmailOutbox).where(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id)).all()
+
+
+def _issue_temporary_passwords(session: Session, messages: list) -> Dict[int, str]:
+    """Set a new temporary password for every claimed invitation; ``{message id: password}``.
+
+    Committed before anything is sent, so the emailed password is always the
+    one that logs in. Parents that have set their own password since are
+    skipped, and their message is not sent.
+    """
+    wanted = [m for m in messages if m.kind == TEMPORARY_PASSWORD and m.parent_id is not None]
+    if not wanted:
+        return {}
+    parent_ids = {m.parent_id for m in wanted}
+    parents = {p.id: p for p in session.exec(select(Parent).where(Parent.id.in_(parent_ids))).all()}
+    wanted = [m for m in wanted if m.parent_id in parents and parents[m.parent_id].force_password_change]
+    passwords = [generate_readable_password(length=10) for _ in wanted]
+    for message, password_hash in zip(wanted, hash_passwords(passwords)):
+        parent = parents[message.parent_id]
+        if parent.password_hash:
+            # replaces a password issued by an earlier attempt: revoke its tokens
+            parent.credentials_version = (parent.credentials_version or 0) + 1
+        parent.password_hash = password_hash
+        session.add(parent)
+    session.commit()
+    for message in wanted:
+        parent_identity_cache.invalidate(message.parent_id)
+    return {m.id: password for m, password in zip(wanted, passwords)}
+
+
+def _deliver(email_client, message: EmailOutbox, password: Optional[str]) -> None:
+    sender = SENDERS.get(message.kind)
+    if sender is None:
+        raise Undeliverable(f'unknown outbox message kind: {message.kind}')
+    data = json.loads(message.payload or '{}')
+    if message.kind == TEMPORARY_PASSWORD:
+        if password is None:
+            raise Undeliverable('parent no longer awaits a temporary password')
+        data['password'] = password
+    sender(email_client, message.to_email, data)
+
+
+def drain_outbox(email_client=None, ids: Optional[Iterable[int]] = None, limit: Optional[int] = None) -> dict:
+    """Send due messages (optionally only ``ids``) and return per-outcome counts."""
+    if email_client is None:
+        from .email import gmail_client as email_client
+    settings = get_settings()
+    stats = {'claimed': 0, SENT: 0, 'retry': 0, DEAD: 0}
+    with db.get_db() as session:
+        messages = _claim(session, ids, limit or settings.outbox_batch_size, datetime.utcnow())
+        stats['claimed'] = len(messages)
+        passwords = _issue_temporary_passwords(session, messages)
+        for message in messages:
+            started = time.perf_counter()
+            try:
+                _deliver(email_client, message, passwords.get(message.id))
+            except Exception as exc:
+                now = datetime.utcnow()
+                message.last_error = f'{type(exc).__name__}: {exc}'[:500]
+                if isinstance(exc, Undeliverable) or message.attempts >= settings.outbox_max_attempts:
+                    message.status = DEAD
+                    stats[DEAD] += 1
+                    OUTBOX_SEND_SECONDS.observe(time.perf_counter() - started, DEAD)
+                    logger.error('Wiadomość %s do %s trafiła do dead letter: %s', message.id, message.to_email, exc)
+                else:
+                    message.status = PENDING
+                    message.next_attempt_at = now + backoff_delay(message.attempts)
+                    stats['retry'] += 1
+                    OUTBOX_SEND_SECONDS.observe(time.perf_counter() - started, 'retry')
+                    logger.warning('Nie udało się wysłać wiadomości %s do %s (próba %s): %s',
+                                   message.id, message.to_email, message.attempts, exc)
+            else:
+                message.status = SENT
+                message.sent_at = datetime.utcnow()
+                message.last_error = None
+                message.payload = None
+                stats[SENT] += 1
+                OUTBOX_SEND_SECONDS.observe(time.perf_counter() - started, SENT)
+            session.add(message)
+            session.commit()
+    return stats
+
+
+def requeue(session, message: EmailOutbox) -> None:
+    """Make a dead (or waiting) message due now with a fresh attempt budget."""
+    message.status = PENDING
+    message.attempts = 0
+    message.next_attempt_at = datetime.utcnow()
+    session.add(message)
+
+
+async def run_worker(stop: asyncio.Event, email_client=None, interval: Optional[float] = None) -> None:
+    interval = get_settings().outbox_poll_interval if interval is None else interval
+    batch_size = get_settings().outbox_batch_size
+    while not stop.is_set():
+        try:
+            stats = await run_in_threadpool(drain_outbox, email_client)
+        except Exception:
+            logger.exception('Błąd podczas przetwarzania outboxa')
+            stats = {'claimed': 0}
+        if stats['claimed'] >= batch_size:
+            continue  # more is probably due; don't sleep
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+_worker_task: Optional[asyncio.Task] = None
+_worker_stop: Optional[asyncio.Event] = None
+
+
+def start_worker() -> None:
+    """Start the in-process worker on the running event loop (app startup)."""
+    global _worker_task, _worker_stop
+    if _worker_task is not None or not get_settings().outbox_worker_enabled:
+        return
+    _worker_stop = asyncio.Event()
+    _worker_task = asyncio.get_running_loop().create_task(run_worker(_worker_stop))
+
+
+async def stop_worker() -> None:
+    global _worker_task, _worker_stop
+    task, stop = _worker_task, _worker_stop
+    _worker_task = _worker_stop = None
+    if task is None:
+        return
+    stop.set()
+    try:
+        await asyncio.wait_for(task, timeout=10)
+    except asyncio.TimeoutError:
+        task.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Email outbox worker')
+    parser.add_argument('--once', action='store_true', help='drain due messages and exit')
+    parser.add_argument('--interval', type=float, default=None, help='poll interval in seconds')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    db.init_db()
+    if args.once:
+        totals = {'claimed': 0, SENT: 0, 'retry': 0, DEAD: 0}
+        while True:
+            stats = drain_outbox()
+            for key, value in stats.items():
+                totals[key] += value
+            if stats['claimed'] < get_settings().outbox_batch_size:
+                break
+        print(json.dumps(totals))
+        return
+    asyncio.run(run_worker(asyncio.Event(), interval=args.interval))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""CSV parsing and validation for the bulk parent import.
+
+Accepts UTF-8 (with or without BOM) or cp1250 exports, comma or semicolon
+separated, with a header row naming ``name``, ``email`` and ``pupil_id`` in
+any order. Rows are validated here; uniqueness against the database is
+checked by the endpoint in a single query.
+"""
+import csv
+import io
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+REQUIRED_COLUMNS = ("email",)
+KNOWN_COLUMNS = ("name", "email", "pupil_id")
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole cannot be imported (encoding, header, size)."""
+
+
+@dataclass
+class ImportRow:
+    row: int  # line number in the file, header = 1
+    name: Optional[str]
+    email: Optional[str]
+    pupil_id: Optional[str]
+    status: str = "pending"  # pending | created | exists | duplicate | invalid
+    detail: Optional[str] = None
+    id: Optional[int] = None
+
+    @property
+    def email_key(self) -> str:
+        return (self.email or "").lower()
+
+    def to_dict(self) -> dict:
+        result = {"row": self.row, "email": self.email, "status": self.status}
+        if self.id is not None:
+            result["id"] = self.id
+        if self.detail:
+            result["detail"] = self.detail
+        return result
+
+
+def decode_csv(raw: bytes) -> str:
+    try:
+        return raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # spreadsheets saved on Polish Windows
+        return raw.decode("cp1250")
+
+
+def parse_parents_csv(raw: bytes, max_rows: int = 5000) -> List[ImportRow]:
+    text = decode_csv(raw)
+    if not text.strip():
+        raise ImportFormatError("empty file")
+    first_line = text.split("\n", 1)[0]
+    delimiter = ";" if first_line.count(";") > first_line.count(",") else ","
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    header = [h.strip().lower() for h in next(reader)]
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ImportFormatError(f"missing column(s): {', '.join(missing)}")
+    index = {c: header.index(c) for c in KNOWN_COLUMNS if c in header}
+
+    rows: List[ImportRow] = []
+    seen = set()
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        if len(rows) >= max_rows:
+            raise ImportFormatError(f"too many rows (max {max_rows})")
+
+        def cell(column: str) -> Optional[str]:
+            i = index.get(column)
+            if i is None or i >= len(values):
+                return None
+            return values[i].strip() or None
+
+        item = ImportRow(row=reader.line_num, name=cell("name"), email=cell("email"), pupil_id=cell("pupil_id"))
+        if not item.email:
+            item.status, item.detail = "invalid", "email required"
+        elif not EMAIL_RE.match(item.email):
+            item.status, item.detail = "invalid", "invalid email"
+        elif item.email_key in seen:
+            item.status, item.detail = "duplicate", "email repeated in file"
+        else:
+            seen.add(item.email_key)
+        rows.append(item)
+    return rows
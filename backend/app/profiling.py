@@ -0,0 +1,109 @@
+"""Storage for on-demand request profiles.
+
+``ProfilingMiddleware`` (app/middleware.py) runs a request under cProfile
+when an admin asks for it and saves the result here: a pstats dump plus a
+small JSON description per profile, in ``PROFILE_DIR`` (a temp directory by
+default). Only the newest ``PROFILE_STORE_SIZE`` profiles are kept. A
+directory rather than memory, so every worker process of a deployment
+saves into and lists the same store.
+"""
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from .settings import get_settings
+
+_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9]+-[0-9]+$")
+
+
+class ProfileStore:
+    def __init__(self, directory: str, max_profiles: int = 20):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, suffix: str) -> Optional[str]:
+        if not _ID.match(profile_id):
+            return None
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def new_id(self) -> str:
+        # unique across the workers sharing the directory
+        return f"{datetime.utcnow():%Y%m%dT%H%M%S}-{os.getpid()}-{next(self._counter)}"
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, meta: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(self._path(profile_id, ".prof"))
+        # the description last: list() only shows profiles that are complete
+        with open(self._path(profile_id, ".json"), "w") as f:
+            json.dump({"id": profile_id, **meta}, f)
+        self._prune()
+
+    def _prune(self) -> None:
+        with self._lock:
+            profiles = self.list()
+            for meta in profiles[self.max_profiles:]:
+                for suffix in (".json", ".prof"):
+                    try:
+                        os.remove(self._path(meta["id"], suffix))
+                    except OSError:
+                        pass
+
+    def list(self) -> List[dict]:
+        """Newest first."""
+        profiles = []
+        if not os.path.isdir(self.directory):
+            return profiles
+        for entry in os.listdir(self.directory):
+            if not entry.endswith(".json") or not _ID.match(entry[:-5]):
+                continue
+            try:
+                with open(os.path.join(self.directory, entry)) as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue  # pruned or still being written by another worker
+        profiles.sort(key=lambda p: (p.get("created", 0), p["id"]), reverse=True)
+        return profiles
+
+    def pstats_path(self, profile_id: str) -> Optional[str]:
+        path = self._path(profile_id, ".prof")
+        return path if path and os.path.exists(path) else None
+
+    def report(self, profile_id: str, limit: int = 60) -> Optional[str]:
+        """Top functions by cumulative time, as ``pstats`` prints them."""
+        path = self.pstats_path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).strip_dirs().sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+def profile_meta(scope: dict, status: int, duration: float) -> dict:
+    route = scope.get("route")
+    return {
+        "created": time.time(),
+        "at": datetime.utcnow().isoformat(timespec="seconds"),
+        "method": scope.get("method"),
+        "path": scope.get("path"),
+        "route": getattr(route, "path", None),
+        "status": status,
+        "duration_ms": round(duration * 1000, 1),
+    }
+
+
+_settings = get_settings()
+profile_store = ProfileStore(
+    _settings.profile_dir or os.path.join(tempfile.gettempdir(), "skarbek-profiles"),
+    max_profiles=_settings.profile_store_size,
+)
@@ -0,0 +1,160 @@
+"""Per-request SQL statistics from engine cursor events.
+
+``install()`` (called from ``app.db``) adds ``before/after_cursor_execute``
+listeners to every ``Engine`` - the sync one, the one behind the async
+engine and any a test builds. Each statement is recorded into the
+``QueryStats`` of the current request, if ``track()`` opened one in this
+context, and into every active ``capture()``. With neither, the listeners
+return straight away.
+
+A ``QueryStats`` keeps the statement count, the time spent in the driver
+and a count per statement fingerprint (the SQL with parameter lists and
+numbers folded), so the same statement issued once per row - an N+1 -
+shows up as one fingerprint with a large count.
+
+Statements slower than ``SLOW_QUERY_THRESHOLD_MS`` are also passed to
+``app.slow_queries``, tagged with the route of the request bound by
+``bind_request``.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .settings import get_settings
+from .slow_queries import slow_query_log
+
+_PLACEHOLDER = r"(?:\?|\$\d+|%\(\w+\)s|:\w+)"
+_PLACEHOLDER_LIST = re.compile(r"\(\s*" + _PLACEHOLDER + r"(?:\s*,\s*" + _PLACEHOLDER + r")*\s*\)")
+_REPEATED_GROUPS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+_NUMBER = re.compile(r"(?<![\w$])\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """``statement`` with whitespace, IN/VALUES lists and numbers normalised."""
+    text = _SPACE.sub(" ", statement).strip()
+    text = _PLACEHOLDER_LIST.sub("(?...)", text)
+    text = _REPEATED_GROUPS.sub("(?...)...", text)
+    return _NUMBER.sub("?", text)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.statements[fingerprint(statement)] += 1
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    def repeated(self, threshold: int) -> List[Tuple[str, int]]:
+        """Fingerprints executed at least ``threshold`` times, most frequent first."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+    def report(self) -> str:
+        lines = [f"{self.count} queries in {self.duration_ms:.1f} ms"]
+        lines += [f"  {n}x {sql}" for sql, n in self.statements.most_common()]
+        return "\n".join(lines)
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+_captures: List[QueryStats] = []
+_request: ContextVar[Optional[dict]] = ContextVar("query_request", default=None)
+
+
+def current() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@contextmanager
+def track() -> Iterator[QueryStats]:
+    """Collect statements run in this context (and tasks/threads it spawns)."""
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def capture() -> Iterator[QueryStats]:
+    """Collect every statement run anywhere in the process (tests, benchmarks)."""
+    stats = QueryStats()
+    _captures.append(stats)
+    try:
+        yield stats
+    finally:
+        _captures.remove(stats)
+
+
+@contextmanager
+def bind_request(scope: dict) -> Iterator[None]:
+    """Make the ASGI ``scope`` of the running request known to the listeners."""
+    token = _request.set(scope)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def current_route() -> Optional[str]:
+    """``METHOD /route/{template}`` of the bound request (the raw path before routing)."""
+    scope = _request.get()
+    if scope is None:
+        return None
+    route = scope.get("route")
+    return f'{scope.get("method")} {getattr(route, "path", None) or scope.get("path")}'
+
+
+def _slow_threshold() -> float:
+    return get_settings().slow_query_threshold_ms / 1000
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None or _captures or _slow_threshold() > 0:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    stats = _current.get()
+    if stats is not None:
+        stats.record(statement, duration)
+    for captured in _captures:
+        captured.record(statement, duration)
+    threshold = _slow_threshold()
+    if 0 < threshold <= duration:
+        slow_query_log.record(statement, parameters, duration, current_route(), conn.dialect.name)
+
+
+def _handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    conn = exception_context.connection
+    if conn is None or exception_context.cursor is None:
+        return
+    started = conn.info.get("query_started")
+    if started:
+        started.pop()
+
+
+def install() -> None:
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
@@ -0,0 +1,141 @@
+"""Runtime configuration read once from the environment.
+
+Everything that tunes infrastructure (connection pool, workers, caches)
+lives here so it is parsed in one place instead of scattered ``os.getenv``
+calls. Call ``get_settings.cache_clear()`` after changing env vars in tests.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return int(raw)
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return float(raw)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    return raw.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str = "sqlite:///./test.db"
+    # QueuePool tuning (ignored for sqlite, which manages its own pool)
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_connect_timeout: Optional[int] = 10
+    # parent identity cache (app/identity_cache.py); ttl 0 disables it
+    parent_identity_cache_ttl: float = 60.0
+    parent_identity_cache_size: int = 10000
+    # public response cache (app/cache.py): memory | redis | none; ttl 0 disables it
+    response_cache_backend: str = "memory"
+    response_cache_url: Optional[str] = None
+    response_cache_ttl: float = 60.0
+    response_cache_size: int = 256
+    # Server-Timing / X-Query-Count headers (app/query_stats.py); a statement run
+    # at least repeat_threshold times in one request is logged as a likely N+1
+    query_stats_enabled: bool = False
+    query_stats_repeat_threshold: int = 10
+    # /metrics (app/metrics.py): with several workers each one snapshots its
+    # metrics into multiproc_dir every flush_interval seconds for the scrape to merge.
+    # The scrape needs "Authorization: Bearer <metrics_token>"; without a token
+    # the endpoint is off
+    metrics_multiproc_dir: Optional[str] = None
+    metrics_flush_interval: float = 5.0
+    metrics_token: Optional[str] = None
+    # slow-query log (app/slow_queries.py); threshold 0 disables it. Plans come
+    # from EXPLAIN (never ANALYZE) run on a background thread
+    slow_query_threshold_ms: float = 500.0
+    slow_query_log_size: int = 200
+    slow_query_log_file: Optional[str] = None
+    slow_query_explain: bool = True
+    # admin-triggered request profiles (app/profiling.py); dir None = temp dir
+    profiling_enabled: bool = True
+    profile_dir: Optional[str] = None
+    profile_store_size: int = 20
+    # processes used for password hashing (app/hashing.py); 0 = threadpool
+    password_hash_workers: int = 2
+    # passlib scheme/cost for new hashes (app/auth.py); None rounds = passlib default.
+    # Existing hashes are upgraded on the next successful login.
+    password_hash_scheme: str = "pbkdf2_sha256"
+    password_hash_rounds: Optional[int] = None
+    # verified admin tokens kept by AdminAuthMiddleware; 0 = decode every request
+    admin_token_cache_size: int = 1024
+    # email outbox (app/outbox.py): in-process worker, retry schedule, batch size
+    outbox_worker_enabled: bool = True
+    outbox_poll_interval: float = 5.0
+    outbox_batch_size: int = 50
+    outbox_max_attempts: int = 8
+    outbox_backoff_base: float = 30.0
+    outbox_backoff_max: float = 3600.0
+    outbox_lease_seconds: float = 120.0
+    # one token bucket per email client (app/email.py) that every send draws
+    # from, outbox and bulk alike; rate 0 = unlimited
+    email_rate_per_second: float = 10.0
+    email_rate_burst: int = 4
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        connect_timeout = _env_int("DB_CONNECT_TIMEOUT", 10)
+        return cls(
+            database_url=os.getenv("DATABASE_URL", cls.database_url),
+            db_pool_size=_env_int("DB_POOL_SIZE", cls.db_pool_size),
+            db_max_overflow=_env_int("DB_MAX_OVERFLOW", cls.db_max_overflow),
+            db_pool_timeout=_env_float("DB_POOL_TIMEOUT", cls.db_pool_timeout),
+            db_pool_recycle=_env_int("DB_POOL_RECYCLE", cls.db_pool_recycle),
+            db_pool_pre_ping=_env_bool("DB_POOL_PRE_PING", cls.db_pool_pre_ping),
+            db_connect_timeout=connect_timeout or None,
+            parent_identity_cache_ttl=_env_float("PARENT_IDENTITY_CACHE_TTL", cls.parent_identity_cache_ttl),
+            parent_identity_cache_size=_env_int("PARENT_IDENTITY_CACHE_SIZE", cls.parent_identity_cache_size),
+            response_cache_backend=os.getenv("RESPONSE_CACHE_BACKEND") or cls.response_cache_backend,
+            response_cache_url=os.getenv("RESPONSE_CACHE_URL") or None,
+            response_cache_ttl=_env_float("RESPONSE_CACHE_TTL", cls.response_cache_ttl),
+            response_cache_size=_env_int("RESPONSE_CACHE_SIZE", cls.response_cache_size),
+            query_stats_enabled=_env_bool("QUERY_STATS_ENABLED", cls.query_stats_enabled),
+            query_stats_repeat_threshold=_env_int("QUERY_STATS_REPEAT_THRESHOLD", cls.query_stats_repeat_threshold),
+            metrics_multiproc_dir=os.getenv("METRICS_MULTIPROC_DIR") or None,
+            metrics_flush_interval=_env_float("METRICS_FLUSH_INTERVAL", cls.metrics_flush_interval),
+            metrics_token=os.getenv("METRICS_TOKEN") or None,
+            slow_query_threshold_ms=_env_float("SLOW_QUERY_THRESHOLD_MS", cls.slow_query_threshold_ms),
+            slow_query_log_size=_env_int("SLOW_QUERY_LOG_SIZE", cls.slow_query_log_size),
+            slow_query_log_file=os.getenv("SLOW_QUERY_LOG_FILE") or None,
+            slow_query_explain=_env_bool("SLOW_QUERY_EXPLAIN", cls.slow_query_explain),
+            profiling_enabled=_env_bool("PROFILING_ENABLED", cls.profiling_enabled),
+            profile_dir=os.getenv("PROFILE_DIR") or None,
+            profile_store_size=_env_int("PROFILE_STORE_SIZE", cls.profile_store_size),
+            password_hash_workers=_env_int("PASSWORD_HASH_WORKERS", cls.password_hash_workers),
+            password_hash_scheme=os.getenv("PASSWORD_HASH_SCHEME") or cls.password_hash_scheme,
+            password_hash_rounds=_env_int("PASSWORD_HASH_ROUNDS", 0) or None,
+            admin_token_cache_size=_env_int("ADMIN_TOKEN_CACHE_SIZE", cls.admin_token_cache_size),
+            outbox_worker_enabled=_env_bool("OUTBOX_WORKER_ENABLED", cls.outbox_worker_enabled),
+            outbox_poll_interval=_env_float("OUTBOX_POLL_INTERVAL", cls.outbox_poll_interval),
+            outbox_batch_size=_env_int("OUTBOX_BATCH_SIZE", cls.outbox_batch_size),
+            outbox_max_attempts=_env_int("OUTBOX_MAX_ATTEMPTS", cls.outbox_max_attempts),
+            outbox_backoff_base=_env_float("OUTBOX_BACKOFF_BASE", cls.outbox_backoff_base),
+            outbox_backoff_max=_env_float("OUTBOX_BACKOFF_MAX", cls.outbox_backoff_max),
+            outbox_lease_seconds=_env_float("OUTBOX_LEASE_SECONDS", cls.outbox_lease_seconds),
+            email_rate_per_second=_env_float("EMAIL_RATE_PER_SECOND", cls.email_rate_per_second),
+            email_rate_burst=_env_int("EMAIL_RATE_BURST", cls.email_rate_burst),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings.from_env()
@@ -0,0 +1,178 @@
+"""Slow-query log with query plans.
+
+``app.query_stats`` times every statement; one that takes at least
+``SLOW_QUERY_THRESHOLD_MS`` is handed to ``record``. The entry keeps the
+statement, its parameters redacted to their types, the request's route and
+the duration, and goes into a ring buffer of ``SLOW_QUERY_LOG_SIZE``
+entries (``/api/admin/debug/slow-queries``), and optionally into the
+JSON-lines file ``SLOW_QUERY_LOG_FILE``.
+
+The plan is not computed by the request that ran the statement: a single
+background thread re-runs it as ``EXPLAIN`` (``EXPLAIN QUERY PLAN`` on
+SQLite) on a pooled connection of the sync engine and fills it into the
+entry. ANALYZE is never used, so the statement itself is not executed
+again. When the thread falls behind, entries beyond ``EXPLAIN_QUEUE_SIZE``
+are kept without a plan.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from .settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+EXPLAIN_QUEUE_SIZE = 100
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.I)
+_DOLLAR_PARAM = re.compile(r"\$(\d+)")
+
+# set in the explain thread so its own statements are never logged
+_explaining: ContextVar[bool] = ContextVar("slow_query_explaining", default=False)
+
+
+def redact(parameters):
+    """Parameter types in place of values (emails, notes and hashes stay out of the log)."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+def explain_args(dialect: str, statement: str, parameters) -> Optional[Tuple[str, object]]:
+    """``(sql, params)`` for the sync engine's driver, or None if not explainable.
+
+    asyncpg statements use ``$n`` placeholders; psycopg2 wants ``%s`` (and a
+    literal ``%`` doubled), so they are rewritten with the values in order.
+    """
+    if not _EXPLAINABLE.match(statement):
+        return None
+    if dialect == "sqlite":
+        return "EXPLAIN QUERY PLAN " + statement, parameters
+    if dialect != "postgresql":
+        return None
+    if isinstance(parameters, (list, tuple)) and _DOLLAR_PARAM.search(statement):
+        values = []
+
+        def positional(match):
+            values.append(parameters[int(match.group(1)) - 1])
+            return "%s"
+        statement = _DOLLAR_PARAM.sub(positional, statement.replace("%", "%%"))
+        parameters = tuple(values)
+    return "EXPLAIN " + statement, parameters
+
+
+class SlowQueryLog:
+    def __init__(self, max_entries: int = 200, path: Optional[str] = None, explain: bool = True):
+        self.path = path
+        self.explain = explain
+        self._entries: deque = deque(maxlen=max_entries)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._worker: Optional[threading.Thread] = None
+
+    def record(self, statement: str, parameters, duration: float, route: Optional[str], dialect: str) -> None:
+        if _explaining.get():
+            return
+        if isinstance(parameters, list) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+            parameters = parameters[0]  # executemany: the first row is representative
+        entry = {
+            "id": next(self._ids),
+            "at": datetime.utcnow().isoformat(timespec="seconds"),
+            "duration_ms": round(duration * 1000, 1),
+            "route": route,
+            "statement": statement,
+            "params": redact(parameters),
+            "plan": None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+        args = explain_args(dialect, statement, parameters) if self.explain else None
+        if args is None:
+            self._write(entry)
+            return
+        try:
+            self._queue.put_nowait((entry, args))
+        except queue.Full:
+            entry["plan_error"] = "explain queue full"
+            self._write(entry)
+            return
+        self._ensure_worker()
+
+    def entries(self, limit: Optional[int] = None) -> List[dict]:
+        """Newest first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return [dict(e) for e in entries[:limit]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def wait_for_plans(self) -> None:
+        self._queue.join()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        _explaining.set(True)
+        while True:
+            entry, args = self._queue.get()
+            try:
+                entry["plan"] = self._explain(*args)
+            except Exception as exc:
+                entry["plan_error"] = f"{type(exc).__name__}: {exc}"[:500]
+            finally:
+                self._write(entry)
+                self._queue.task_done()
+
+    @staticmethod
+    def _explain(sql: str, parameters) -> List[str]:
+        from . import db
+
+        with db.get_engine().connect() as conn:
+            rows = conn.exec_driver_sql(sql, parameters or ()).all()
+        # postgres: one text column per line; sqlite: (id, parent, notused, detail)
+        return [str(row[-1]) for row in rows]
+
+    def _write(self, entry: dict) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as exc:
+            logger.warning('Nie udało się zapisać wolnego zapytania do %s: %s', self.path, exc)
+
+
+def _reset_after_fork() -> None:
+    # the explain thread does not survive a fork; start a new one on demand
+    slow_query_log._worker = None
+    slow_query_log._lock = threading.Lock()
+    slow_query_log._queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+
+
+_settings = get_settings()
+slow_query_log = SlowQueryLog(
+    max_entries=_settings.slow_query_log_size,
+    path=_settings.slow_query_log_file,
+    explain=_settings.slow_query_explain,
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,59 @@
+"""Dialect-specific statement builders for set-based bulk writes.
+
+``INSERT ... ON CONFLICT`` is spelled the same on Postgres and SQLite but
+SQLAlchemy exposes it per dialect, and multi-row UPDATEs need a different
+shape on each; these helpers pick the right construct from the session's bind.
+"""
+from typing import List
+
+from sqlalchemy import case, cast, column, literal, update, values
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+def dialect_name(session) -> str:
+    return session.bind.dialect.name
+
+
+def insert_for(session, table):
+    """INSERT with ``on_conflict_do_nothing`` / ``on_conflict_do_update`` support."""
+    name = dialect_name(session)
+    if name == 'postgresql':
+        return postgresql.insert(table)
+    if name == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f'bulk upserts are not implemented for {name}')
+
+
+def bulk_update_by_id(session, table, rows: List[dict], **static_values):
+    """One UPDATE that gives each row (keyed by ``id``) its own values.
+
+    ``rows`` are dicts with ``id`` plus the same set of column keys;
+    ``static_values`` are applied to every matched row. Postgres joins a
+    ``VALUES`` list (``UPDATE ... FROM (VALUES ...)``) whose values are cast
+    to their column types: asyncpg sends parameters untyped, and untyped
+    ``VALUES`` columns would be ``text`` on the server. SQLAlchemy 1.4 cannot
+    render UPDATE ... FROM for SQLite, so there the per-row values become
+    ``CASE id WHEN ...`` expressions. Either way it is a single statement.
+    """
+    if not rows:
+        raise ValueError('rows must not be empty')
+    keys = [k for k in rows[0] if k != 'id']
+    if dialect_name(session) == 'postgresql':
+        data = values(
+            column('id', table.c.id.type),
+            *(column(k, table.c[k].type) for k in keys),
+            name='batch',
+        ).data([
+            tuple(cast(literal(row[k], table.c[k].type), table.c[k].type) for k in ['id'] + keys)
+            for row in rows
+        ])
+        return (
+            update(table)
+            .where(table.c.id == data.c.id)
+            .values(**{k: data.c[k] for k in keys}, **static_values)
+        )
+    per_row = {
+        k: case({row['id']: literal(row[k], table.c[k].type) for row in rows}, value=table.c.id)
+        for k in keys
+    }
+    return update(table).where(table.c.id.in_([row['id'] for row in rows])).values(**per_row, **static_values)
@@ -0,0 +1,39 @@
+"""Helpers for streaming large responses without materialising them.
+
+Endpoints build an (async) iterator of rows straight from the database
+cursor and hand it to ``StreamingResponse``; these helpers take care of
+encoding and coalescing small writes into reasonably sized chunks.
+"""
+import json
+from datetime import date, datetime
+from typing import Any, AsyncIterable, AsyncIterator
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+CHUNK_SIZE = 64 * 1024
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_dumps(obj: Any) -> str:
+    """Encode like Starlette's JSONResponse, plus ISO dates as FastAPI does."""
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default)
+
+
+async def coalesce(chunks: AsyncIterable[str], size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Join small string pieces into ~``size`` byte chunks for the socket."""
+    buffer = []
+    buffered = 0
+    async for chunk in chunks:
+        data = chunk.encode("utf-8")
+        buffer.append(data)
+        buffered += len(data)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer.clear()
+            buffered = 0
+    if buffer:
+        yield b"".join(buffer)
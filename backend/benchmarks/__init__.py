@@ -0,0 +1,5 @@
+"""Performance benchmarks for the Skarbek backend.
+
+Run from the ``backend`` directory, e.g. ``python -m benchmarks.login_throughput``.
+Each script prints a JSON report on stdout.
+"""
@@ -0,0 +1,105 @@
+"""Per-request overhead of AdminAuthMiddleware, before and after the ASGI rewrite.
+
+Usage (from backend/):
+    python -m benchmarks.admin_middleware --requests 20000
+
+Requests are driven straight through the ASGI interface against a trivial
+endpoint, so the numbers are the middleware's own cost (no HTTP parsing, no
+routing). "before" is the previous BaseHTTPMiddleware implementation, kept
+here as a reference; "after" is ``app.middleware.AdminAuthMiddleware``.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable
+
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse
+
+
+class LegacyAdminAuthMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next: Callable):
+        from app.auth import decode_token
+        path = request.url.path
+        if path.startswith("/api/admin") and not path.startswith("/api/admin/login"):
+            auth = request.headers.get("authorization")
+            if not auth:
+                return JSONResponse({"detail": "Missing authorization header"}, status_code=401)
+            parts = auth.split()
+            if len(parts) != 2 or parts[0].lower() != "bearer":
+                return JSONResponse({"detail": "Invalid authorization format"}, status_code=401)
+            payload = decode_token(parts[1])
+            if not payload:
+                return JSONResponse({"detail": "Invalid token"}, status_code=401)
+            request.state.user = payload.get("sub")
+        return await call_next(request)
+
+
+async def endpoint(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-length", b"2")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+def _scope(path: str, token: str = None) -> dict:
+    headers = [(b"host", b"bench")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": headers, "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+
+
+async def _drive(app, path: str, token: str, requests: int) -> float:
+    def receiver():
+        # one empty body, then the client goes away (BaseHTTPMiddleware waits for it)
+        messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            return next(messages, {"type": "http.disconnect"})
+        return receive
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message["status"]
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(_scope(path, token), receiver(), send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+def run(requests: int) -> dict:
+    from app.auth import create_token
+    from app.middleware import AdminAuthMiddleware
+
+    token = create_token({"sub": "admin"})
+    variants = {
+        "bare": endpoint,
+        "before": LegacyAdminAuthMiddleware(endpoint),
+        "after": AdminAuthMiddleware(endpoint),
+    }
+    cases = {"non_admin": ("/api/parents/me", None), "admin": ("/api/admin/contributions", token)}
+    report = {"requests": requests, "us_per_request": {}}
+    for case, (path, case_token) in cases.items():
+        results = {}
+        for name, app in variants.items():
+            asyncio.run(_drive(app, path, case_token, min(requests, 200)))  # warm-up
+            results[name] = round(asyncio.run(_drive(app, path, case_token, requests)), 2)
+        results["before_overhead"] = round(results["before"] - results["bare"], 2)
+        results["after_overhead"] = round(results["after"] - results["bare"], 2)
+        report["us_per_request"][case] = results
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.requests), indent=2))
+
+
+if __name__ == "__main__":
+    main()
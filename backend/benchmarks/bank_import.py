@@ -0,0 +1,102 @@
+"""Parse and match time for a year's bank statement against pending contributions.
+
+Usage (from backend/):
+    python -m benchmarks.bank_import --transfers 30000 --contributions 600
+
+Generates a cp1250 mBank-style statement where about a third of the incoming
+transfers pay a pending contribution (titles carry the parent's name, some
+the pupil_id or email) and the rest are unrelated, plus outgoing payments.
+Parsing (fed in 64 KiB chunks, as the endpoint does), index building and
+matching are timed separately; no database is involved.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+FIRST = ['Anna', 'Jan', 'Ewa', 'Piotr', 'Katarzyna', 'Tomasz', 'Agnieszka', 'Paweł', 'Małgorzata', 'Michał']
+STEMS = ['Now', 'Kowal', 'Wiśniew', 'Wójc', 'Kamień', 'Lewandow', 'Zieliń', 'Szymań', 'Dąbrow', 'Kozłow',
+         'Jankow', 'Mazur', 'Kwiatkow', 'Krawcz', 'Pietrz', 'Grabow', 'Zając', 'Król', 'Wieczor', 'Jabłoń']
+LAST = [stem + suffix for stem in STEMS for suffix in ('ski', 'ska', 'ak', 'ik', 'czyk', 'ewicz', 'owska', 'iec')]
+
+
+def _pending(count: int, rng: random.Random) -> list:
+    from app.bank_import import PendingContribution
+
+    rows = []
+    for i in range(count):
+        name = f'{rng.choice(FIRST)} {rng.choice(LAST)}'
+        rows.append(PendingContribution(i + 1, i % 4 + 1, i + 1, float(rng.choice([30, 50, 80, 120, 250])),
+                                        f'rodzic{i}@example.com', f'{i % 8 + 1}{"ABC"[i % 3]}-{i:03d}', name))
+    return rows
+
+
+def _statement(transfers: int, pending: list, rng: random.Random) -> bytes:
+    lines = ['mBank S.A. Bankowość Detaliczna;', '#Za okres:;', '01.01.2024;31.12.2024;', '',
+             '#Data operacji;#Opis operacji;#Rachunek;#Kategoria;#Kwota;']
+    for i in range(transfers):
+        date = f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}'
+        kind = i % 3
+        if kind == 0:
+            c = rng.choice(pending)
+            hint = [c.pupil_id, c.email, 'składka'][i % 3]
+            title, amount = f'{c.name.upper()} PRZELEW PRZYCHODZĄCY {hint}', f'{c.amount_expected:,.2f}'
+        elif kind == 1:
+            title, amount = f'{rng.choice(FIRST)} {rng.choice(LAST)} zwrot za obiad', f'{rng.randint(5, 2000)},00'
+        else:
+            title, amount = 'ZAKUP PRZY UŻYCIU KARTY', f'-{rng.randint(1, 500)},{rng.randint(0, 99):02d}'
+        amount = amount.replace(',', ' ').replace('.', ',')
+        lines.append(f'{date};"{title}";"eKonto";"Wpływy";"{amount} PLN";')
+    return ('\n'.join(lines) + '\n').encode('cp1250')
+
+
+def run(transfers: int, contributions: int, seed: int = 1) -> dict:
+    from app.bank_import import ContributionIndex, StatementParser, match_transfers
+
+    rng = random.Random(seed)
+    pending = _pending(contributions, rng)
+    raw = _statement(transfers, pending, rng)
+
+    started = time.perf_counter()
+    parser = StatementParser()
+    parsed = []
+    for i in range(0, len(raw), 64 * 1024):
+        parsed += parser.feed(raw[i:i + 64 * 1024])
+    parsed += parser.close()
+    parse_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = ContributionIndex.build(pending)
+    index_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    result = match_transfers(index, parsed)
+    match_s = time.perf_counter() - started
+
+    return {
+        'benchmark': 'bank_import',
+        'statement_bytes': len(raw),
+        'rows': parser.rows,
+        'incoming': len(parsed),
+        'pending_contributions': contributions,
+        'proposed': len(result['proposals']),
+        'parse_ms': round(parse_s * 1000, 1),
+        'index_ms': round(index_s * 1000, 1),
+        'match_ms': round(match_s * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transfers', type=int, default=30000)
+    parser.add_argument('--contributions', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    json.dump(run(args.transfers, args.contributions, args.seed), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
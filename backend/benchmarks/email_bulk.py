@@ -0,0 +1,113 @@
+"""Bulk invitation throughput against a local fake Gmail server.
+
+Usage (from backend/):
+    python -m benchmarks.email_bulk --messages 300 --workers 1 4 8 16 --latency-ms 80
+    python -m benchmarks.email_bulk --rate 20 --throttle-every 50
+
+The fake server answers the OAuth token exchange and the send endpoint with a
+configurable latency; ``--throttle-every N`` makes every Nth send a 429 with
+``Retry-After`` so the backoff path is exercised. Reports messages/second for
+each worker count.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGmail:
+    def __init__(self, latency: float, throttle_every: int, retry_after: float):
+        self.sends = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=()):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/token":
+                    self._reply(200, {"access_token": "bench-token", "expires_in": 3600})
+                    return
+                time.sleep(latency)
+                with fake.lock:
+                    fake.sends += 1
+                    throttle = throttle_every and fake.sends % throttle_every == 0
+                    if throttle:
+                        fake.throttled += 1
+                if throttle:
+                    self._reply(429, {"error": "rate limited"}, [("Retry-After", str(retry_after))])
+                else:
+                    self._reply(200, {"id": "ok"})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def run(messages: int, workers: list, latency_ms: float, rate: float, throttle_every: int, retry_after: float) -> dict:
+    from app.email import BulkMessage, GmailEmailClient
+
+    batch = [BulkMessage(f"rodzic{i}@example.com", "temporary_password", {"password": "Abc123xyz", "parent_name": f"Rodzic {i}"})
+             for i in range(messages)]
+    report = {"messages": messages, "latency_ms": latency_ms, "rate_per_second": rate,
+              "throttle_every": throttle_every, "runs": []}
+    for n in workers:
+        fake = FakeGmail(latency_ms / 1000, throttle_every, retry_after)
+        client = GmailEmailClient(
+            client_id="bench", client_secret="bench", refresh_token="bench", sender_email="skarbek@example.com",
+            token_uri=f"{fake.url}/token", send_url=f"{fake.url}/send", pool_size=max(n, 1),
+            rate_per_second=rate, burst=max(n, 1),
+        )
+        try:
+            result = client.send_bulk(batch, max_workers=n, base_delay=0.05)
+        finally:
+            client.close()
+            fake.close()
+        report["runs"].append({
+            "workers": n,
+            "sent": result.sent,
+            "failed": result.failed,
+            "throttled_responses": fake.throttled,
+            "elapsed_seconds": round(result.elapsed_seconds, 3),
+            "messages_per_second": round(result.sent / result.elapsed_seconds, 1) if result.elapsed_seconds else None,
+        })
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--rate", type=float, default=0.0, help="token bucket rate, 0 = unlimited")
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages, args.workers, args.latency_ms, args.rate,
+                         args.throttle_every, args.retry_after), indent=2))
+
+
+if __name__ == "__main__":
+    main()
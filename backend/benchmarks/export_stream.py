@@ -0,0 +1,141 @@
+"""Peak memory of the streamed roster exports versus the JSON roster.
+
+Usage (from backend/):
+    python -m benchmarks.export_stream --parents 1000 10000 40000
+
+For each roster size a fresh temporary sqlite database is seeded with one
+campaign and a contribution per parent. The CSV and XLSX exports are read
+chunk by chunk and ``tracemalloc`` records the peak Python allocation while
+each request runs; the JSON ``/roster`` endpoint, which builds the whole
+list in memory, is measured the same way for comparison.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def _configure_database(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import db
+    from app.settings import get_settings
+    get_settings.cache_clear()
+    db.dispose_engine()
+    db.init_db()
+
+
+def _seed(parents: int) -> int:
+    from datetime import datetime
+    from sqlalchemy import insert
+    from app.db import get_db
+    from app.models import Campaign, Contribution, Parent
+
+    now = datetime.utcnow()
+    with get_db() as session:
+        campaign = Campaign(title="Benchmark")
+        session.add(campaign)
+        session.commit()
+        session.execute(insert(Parent.__table__), [
+            {"name": f"Rodzic {i}", "email": f"bench{i}@example.com", "pupil_id": f"P{i:06d}", "created_at": now,
+             "is_hidden": False, "force_password_change": False, "credentials_version": 0}
+            for i in range(parents)
+        ])
+        session.execute(insert(Contribution.__table__), [
+            {"campaign_id": campaign.id, "parent_id": i + 1, "amount_expected": 50.0,
+             "amount_paid": 50.0 if i % 2 else 0.0, "status": "paid" if i % 2 else "pending",
+             "paid_at": now if i % 2 else None, "note": "przelew" if i % 2 else None}
+            for i in range(parents)
+        ])
+        session.commit()
+        return campaign.id
+
+
+async def _get(app, path: str, query: str, token: str) -> int:
+    """Drive the ASGI app directly and drop each chunk as it is sent.
+
+    httpx's ASGI transport buffers the whole body before returning, which
+    would hide the streaming behaviour being measured.
+    """
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": query.encode(), "client": ("127.0.0.1", 1), "server": ("bench", 80),
+        "headers": [(b"host", b"bench"), (b"authorization", f"Bearer {token}".encode())],
+    }
+    done = asyncio.Event()
+    messages = iter([{"type": "http.request", "body": b"", "more_body": False}])
+    size = 0
+
+    async def receive():
+        message = next(messages, None)
+        if message is None:
+            # the client stays connected until the body is complete
+            await done.wait()
+            message = {"type": "http.disconnect"}
+        return message
+
+    async def send(message):
+        nonlocal size
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200, message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return size
+
+
+async def _measure(app, path: str, query: str, token: str) -> dict:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    size = await _get(app, path, query, token)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "bytes": size, "peak_kib": round(peak / 1024)}
+
+
+async def _run(campaign_id: int) -> dict:
+    from app.auth import create_token
+    from app.main import app
+
+    token = create_token({"sub": "admin"})
+    base = f"/api/admin/campaigns/{campaign_id}"
+    await _measure(app, f"{base}/export", "format=csv", token)  # warm-up
+    return {
+        "csv": await _measure(app, f"{base}/export", "format=csv", token),
+        "xlsx": await _measure(app, f"{base}/export", "format=xlsx", token),
+        "json_roster": await _measure(app, f"{base}/roster", "", token),
+    }
+
+
+def run(sizes: list) -> dict:
+    results = []
+    for parents in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            _configure_database(os.path.join(tmp, "bench.db"))
+            campaign_id = _seed(parents)
+            results.append({"parents": parents, **asyncio.run(_run(campaign_id))})
+            from app import db
+            db.dispose_engine()
+    return {"benchmark": "export_stream", "results": results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--parents", type=int, nargs="+", default=[1000, 10000, 40000])
+    args = parser.parse_args(argv)
+    json.dump(run(args.parents), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
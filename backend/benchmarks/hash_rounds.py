@@ -0,0 +1,86 @@
+"""Pick password hash rounds for a target verify latency on this host.
+
+Usage (from backend/):
+    python -m benchmarks.hash_rounds --target-ms 250
+    python -m benchmarks.hash_rounds --scheme sha512_crypt --target-ms 150 --samples 7
+
+Times ``verify`` at the scheme's default cost, scales the rounds linearly
+(or by powers of two for log2-cost schemes such as bcrypt) and refines the
+estimate against fresh measurements. The report ends with the
+``PASSWORD_HASH_ROUNDS`` value to put in the deployment's env file; existing
+hashes move to it on each parent's next successful login.
+"""
+import argparse
+import json
+import math
+import statistics
+import time
+
+from passlib.registry import get_crypt_handler
+
+
+def measure_verify_ms(scheme: str, rounds: int, samples: int) -> float:
+    from app.auth import build_crypt_context
+    context = build_crypt_context(scheme, rounds)
+    hashed = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _clamp(handler, rounds: int) -> int:
+    rounds = max(rounds, handler.min_rounds)
+    if handler.max_rounds:
+        rounds = min(rounds, handler.max_rounds)
+    return rounds
+
+
+def estimate_rounds(handler, rounds: int, measured_ms: float, target_ms: float) -> int:
+    ratio = target_ms / max(measured_ms, 1e-3)
+    if getattr(handler, "rounds_cost", "linear") == "log2":
+        return _clamp(handler, rounds + round(math.log2(ratio)))
+    return _clamp(handler, int(rounds * ratio))
+
+
+def calibrate(scheme: str, target_ms: float, samples: int = 5, refinements: int = 3) -> dict:
+    handler = get_crypt_handler(scheme)
+    if "rounds" not in getattr(handler, "setting_kwds", ()):
+        raise SystemExit(f"{scheme} has no configurable rounds")
+    rounds = handler.default_rounds
+    measured = measure_verify_ms(scheme, rounds, samples)
+    steps = [{"rounds": rounds, "verify_ms": round(measured, 2)}]
+    for _ in range(refinements):
+        candidate = estimate_rounds(handler, rounds, measured, target_ms)
+        if candidate == rounds:
+            break
+        rounds = candidate
+        measured = measure_verify_ms(scheme, rounds, samples)
+        steps.append({"rounds": rounds, "verify_ms": round(measured, 2)})
+        if abs(measured - target_ms) <= target_ms * 0.05:
+            break
+    return {
+        "scheme": scheme,
+        "target_ms": target_ms,
+        "rounds": rounds,
+        "verify_ms": round(measured, 2),
+        "passlib_default_rounds": handler.default_rounds,
+        "steps": steps,
+        "env": {"PASSWORD_HASH_SCHEME": scheme, "PASSWORD_HASH_ROUNDS": str(rounds)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scheme", default="pbkdf2_sha256")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--refinements", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(calibrate(args.scheme, args.target_ms, args.samples, args.refinements), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Parent login throughput with the password hash pool at different sizes.
+
+Usage (from backend/):
+    python -m benchmarks.login_throughput --workers 0 1 4 8 --logins 400 --concurrency 64
+
+``--workers 0`` is the threadpool fallback (hashing under the GIL), i.e. the
+behaviour before the hash pool existed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _configure_database(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import db
+    from app.settings import get_settings
+    get_settings.cache_clear()
+    db.dispose_engine()
+    db.init_db()
+
+
+def _seed_parents(count: int, password: str) -> list:
+    from app.auth import hash_password
+    from app.db import get_db
+    from app.models import Parent
+    # every parent shares one hash: seeding speed is not what we measure
+    hashed = hash_password(password)
+    emails = [f"bench{i}@example.com" for i in range(count)]
+    with get_db() as session:
+        session.add_all(Parent(name=f"Bench {i}", email=e, password_hash=hashed, force_password_change=False)
+                        for i, e in enumerate(emails))
+        session.commit()
+    return emails
+
+
+async def _run_logins(emails: list, password: str, logins: int, concurrency: int) -> dict:
+    import httpx
+    from app.main import app
+
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(client, email):
+        async with gate:
+            started = time.perf_counter()
+            r = await client.post("/api/parents/login", json={"email": email, "password": password})
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert r.status_code == 200, r.text
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, emails[i % len(emails)]) for i in range(logins)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "logins": logins,
+        "seconds": round(elapsed, 3),
+        "logins_per_second": round(logins / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+    }
+
+
+def run(workers: list, logins: int, concurrency: int) -> dict:
+    from app import hashing
+    from app.settings import get_settings
+
+    password = "bench-password"
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_database(os.path.join(tmp, "bench.db"))
+        emails = _seed_parents(min(logins, 200), password)
+        results = []
+        for n in workers:
+            hashing.shutdown_hash_pool()
+            os.environ["PASSWORD_HASH_WORKERS"] = str(n)
+            get_settings.cache_clear()
+            # warm the pool so process start-up is not part of the measurement
+            asyncio.run(_run_logins(emails, password, max(n, 1) * 2, max(n, 1) * 2))
+            result = asyncio.run(_run_logins(emails, password, logins, concurrency))
+            results.append({"hash_workers": n, **result})
+        hashing.shutdown_hash_pool()
+    return {"benchmark": "login_throughput", "concurrency": concurrency, "cpu_count": os.cpu_count(), "results": results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args(argv)
+    json.dump(run(args.workers, args.logins, args.concurrency), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+"""Latency of POST /api/admin/contributions/mark-paid/batch by batch size.
+
+Usage (from backend/):
+    python -m benchmarks.mark_paid_batch --sizes 10 100 500 --repeat 5
+
+Seeds one campaign with enough contributions in a temporary sqlite database
+and times the batch endpoint for each size (median of ``--repeat`` runs, on
+fresh rows each time). For comparison it also times the same rows sent one
+by one to /contributions/mark-paid. The batch issues the same two statements
+whatever its size, so only the per-row Python work grows with the batch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _configure_database(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import db
+    from app.settings import get_settings
+    get_settings.cache_clear()
+    db.dispose_engine()
+    db.init_db()
+
+
+def _seed(rows: int) -> tuple:
+    from app.db import get_db
+    from app.models import Campaign, Contribution, Parent
+    from datetime import datetime
+    from sqlalchemy import insert
+
+    with get_db() as session:
+        campaign = Campaign(title="Benchmark", target_amount=50.0)
+        session.add(campaign)
+        session.commit()
+        session.execute(insert(Parent.__table__), [
+            {"name": f"Rodzic {i}", "email": f"bench{i}@example.com", "is_hidden": False,
+             "force_password_change": False, "credentials_version": 0, "created_at": datetime.utcnow()}
+            for i in range(rows)
+        ])
+        parent_ids = [pid for (pid,) in session.execute(Parent.__table__.select().with_only_columns(Parent.id))]
+        session.execute(insert(Contribution.__table__), [
+            {"campaign_id": campaign.id, "parent_id": pid, "amount_expected": 50.0, "amount_paid": 0.0, "status": "pending"}
+            for pid in parent_ids
+        ])
+        session.commit()
+        return campaign.id, parent_ids
+
+
+async def _time_batch(client, headers, items) -> float:
+    started = time.perf_counter()
+    r = await client.post("/api/admin/contributions/mark-paid/batch", json={"items": items}, headers=headers)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert r.status_code == 200 and r.json()["updated"] == len(items), r.text
+    return elapsed
+
+
+async def _time_single(client, headers, items) -> float:
+    started = time.perf_counter()
+    for item in items:
+        r = await client.post("/api/admin/contributions/mark-paid", json=item, headers=headers)
+        assert r.status_code == 200, r.text
+    return (time.perf_counter() - started) * 1000
+
+
+async def _run(sizes: list, repeat: int, campaign_id: int, parent_ids: list) -> dict:
+    import httpx
+    from app.auth import create_token
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_token({'sub': 'admin'})}"}
+    pool = iter(parent_ids)
+
+    def items(n):
+        return [{"campaign_id": campaign_id, "parent_id": next(pool), "amount": 50, "note": "wyciąg"} for _ in range(n)]
+
+    results = []
+    async with httpx.AsyncClient(app=app, base_url="http://bench") as client:
+        await _time_batch(client, headers, items(5))  # warm-up
+        for size in sizes:
+            timings = [await _time_batch(client, headers, items(size)) for _ in range(repeat)]
+            results.append({"rows": size, "batch_ms": round(statistics.median(timings), 2),
+                            "batch_ms_per_row": round(statistics.median(timings) / size, 3)})
+        largest = max(sizes)
+        single = await _time_single(client, headers, items(largest))
+        comparison = {"rows": largest, "one_by_one_ms": round(single, 2)}
+    return {"batch": results, "one_by_one": comparison}
+
+
+def run(sizes: list, repeat: int) -> dict:
+    needed = 5 + sum(sizes) * repeat + max(sizes)
+    with tempfile.TemporaryDirectory() as tmp:
+        _configure_database(os.path.join(tmp, "bench.db"))
+        campaign_id, parent_ids = _seed(needed)
+        report = asyncio.run(_run(sizes, repeat, campaign_id, parent_ids))
+        from app import db
+        db.dispose_engine()
+    return {"benchmark": "mark_paid_batch", "repeat": repeat, **report}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    json.dump(run(args.sizes, args.repeat), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Wall time of POST /api/admin/parents/import for a generated CSV.
+
+Usage (from backend/):
+    python -m benchmarks.parent_import --rows 1000 --workers 0 2 4
+    python -m benchmarks.parent_import --rounds 1000   # isolate everything but hashing
+
+Each run imports ``--rows`` new parents into a fresh temporary sqlite
+database. Hashing dominates: with the default pbkdf2 cost the import scales
+with the number of hash pool workers (and CPU cores); ``--workers 0`` hashes
+on the threadpool under the GIL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def _configure_database(path: str) -> None:
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from app import db
+    from app.settings import get_settings
+    get_settings.cache_clear()
+    db.dispose_engine()
+    db.init_db()
+
+
+def _csv(rows: int, run: int) -> bytes:
+    lines = ["name,email,pupil_id"]
+    lines += [f"Rodzic {i},rodzic{run}-{i}@example.com,P{run}-{i:05d}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+async def _import(body: bytes) -> tuple:
+    import httpx
+    from app.auth import create_token
+    from app.main import app
+
+    headers = {"Authorization": f"Bearer {create_token({'sub': 'admin'})}", "Content-Type": "text/csv"}
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        r = await client.post("/api/admin/parents/import", content=body, headers=headers)
+        elapsed = time.perf_counter() - started
+    assert r.status_code == 200, r.text
+    return elapsed, r.json()["summary"]
+
+
+def run(rows: int, workers: list, rounds: int = 0) -> dict:
+    from app import hashing
+    from app.settings import get_settings
+
+    if rounds:
+        os.environ["PASSWORD_HASH_ROUNDS"] = str(rounds)
+    results = []
+    for run_no, n in enumerate(workers):
+        with tempfile.TemporaryDirectory() as tmp:
+            _configure_database(os.path.join(tmp, "bench.db"))
+            hashing.shutdown_hash_pool()
+            os.environ["PASSWORD_HASH_WORKERS"] = str(n)
+            get_settings.cache_clear()
+            # warm the pool so process start-up is not part of the measurement
+            asyncio.run(_import(_csv(max(n, 1) * 2, 1000 + run_no)))
+            elapsed, summary = asyncio.run(_import(_csv(rows, run_no)))
+            results.append({
+                "hash_workers": n,
+                "seconds": round(elapsed, 3),
+                "rows_per_second": round(rows / elapsed, 1),
+                "summary": summary,
+            })
+            from app import db
+            db.dispose_engine()
+    hashing.shutdown_hash_pool()
+    return {"benchmark": "parent_import", "rows": rows, "hash_rounds": rounds or "default",
+            "cpu_count": os.cpu_count(), "results": results}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--rounds", type=int, default=0, help="override PASSWORD_HASH_ROUNDS")
+    args = parser.parse_args(argv)
+    json.dump(run(args.rows, args.workers, args.rounds), sys.stdout, indent=2)
+    print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+-- Migration: Add indexes, uniqueness and foreign keys on hot lookup columns
+-- Date: 2026-10-17
+-- Description: Indexes parent.email / parent.pupil_id, enforces one contribution per
+-- (campaign, parent) and case-insensitive unique parent emails, declares the
+-- contribution foreign keys and adds a partial index on live (active, non-deleted)
+-- campaigns. Mirrors the SQLModel metadata in app/models.py.
+-- Note: runs inside the runner's transaction, so indexes are built without
+-- CONCURRENTLY; apply during a quiet period on large databases.
+
+-- Check if already executed
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM schema_migrations WHERE migration_name = '002_add_lookup_indexes') THEN
+        RAISE NOTICE 'Migration 002_add_lookup_indexes already executed, skipping';
+        RETURN;
+    END IF;
+END $$;
+
+-- Parent emails must be unique case-insensitively; refuse to guess which account to keep
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM parent WHERE email IS NOT NULL
+        GROUP BY lower(email) HAVING COUNT(*) > 1
+    ) THEN
+        RAISE EXCEPTION 'Duplicate parent emails (case-insensitive) found; merge them before running 002_add_lookup_indexes';
+    END IF;
+END $$;
+
+-- Collapse duplicate contributions per (campaign, parent): keep the paid row (or the
+-- oldest one) and carry over the highest expected/paid amounts before deleting the rest
+WITH ranked AS (
+    SELECT id,
+           ROW_NUMBER() OVER (PARTITION BY campaign_id, parent_id ORDER BY (status = 'paid') DESC, id) AS rn,
+           COUNT(*) OVER (PARTITION BY campaign_id, parent_id) AS n,
+           MAX(amount_expected) OVER (PARTITION BY campaign_id, parent_id) AS max_expected,
+           MAX(amount_paid) OVER (PARTITION BY campaign_id, parent_id) AS max_paid
+    FROM contribution
+)
+UPDATE contribution c
+SET amount_expected = r.max_expected, amount_paid = r.max_paid
+FROM ranked r
+WHERE c.id = r.id AND r.rn = 1 AND r.n > 1;
+
+DELETE FROM contribution c
+USING (
+    SELECT id, ROW_NUMBER() OVER (PARTITION BY campaign_id, parent_id ORDER BY (status = 'paid') DESC, id) AS rn
+    FROM contribution
+) d
+WHERE c.id = d.id AND d.rn > 1;
+
+-- Execute migration
+CREATE INDEX IF NOT EXISTS ix_parent_email ON parent (email);
+CREATE INDEX IF NOT EXISTS ix_parent_pupil_id ON parent (pupil_id);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_parent_email_lower ON parent (lower(email));
+CREATE UNIQUE INDEX IF NOT EXISTS uq_contribution_campaign_parent ON contribution (campaign_id, parent_id);
+CREATE INDEX IF NOT EXISTS ix_contribution_parent_id ON contribution (parent_id);
+CREATE INDEX IF NOT EXISTS ix_campaign_active_live ON campaign (id) WHERE active = true AND deleted_at IS NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'contribution_campaign_id_fkey') THEN
+        ALTER TABLE contribution
+            ADD CONSTRAINT contribution_campaign_id_fkey FOREIGN KEY (campaign_id) REFERENCES campaign (id);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'contribution_parent_id_fkey') THEN
+        ALTER TABLE contribution
+            ADD CONSTRAINT contribution_parent_id_fkey FOREIGN KEY (parent_id) REFERENCES parent (id);
+    END IF;
+END $$;
+
+-- Record migration
+INSERT INTO schema_migrations (migration_name, executed_at, success)
+VALUES ('002_add_lookup_indexes', NOW(), TRUE)
+ON CONFLICT (migration_name) DO NOTHING;
@@ -0,0 +1,22 @@
+-- Migration: Add credentials_version to Parent table
+-- Date: 2026-10-17
+-- Description: Adds a counter bumped whenever a parent's password or email changes.
+-- Parent JWTs carry it (claim "cv") so tokens issued before the change are rejected
+-- and the identity cache can be trusted without re-reading the parent row.
+
+-- Check if already executed
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM schema_migrations WHERE migration_name = '003_add_parent_credentials_version') THEN
+        RAISE NOTICE 'Migration 003_add_parent_credentials_version already executed, skipping';
+        RETURN;
+    END IF;
+END $$;
+
+-- Execute migration
+ALTER TABLE parent ADD COLUMN IF NOT EXISTS credentials_version integer NOT NULL DEFAULT 0;
+
+-- Record migration
+INSERT INTO schema_migrations (migration_name, executed_at, success)
+VALUES ('003_add_parent_credentials_version', NOW(), TRUE)
+ON CONFLICT (migration_name) DO NOTHING;
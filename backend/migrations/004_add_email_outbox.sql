@@ -0,0 +1,36 @@
+-- Migration: Add email outbox table
+-- Date: 2026-10-17
+-- Description: Emails (e.g. temporary passwords) are written to emailoutbox in the
+-- same transaction as the parent and delivered by app/outbox.py with retries,
+-- exponential backoff and a dead-letter status. Mirrors EmailOutbox in app/models.py.
+
+-- Check if already executed
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM schema_migrations WHERE migration_name = '004_add_email_outbox') THEN
+        RAISE NOTICE 'Migration 004_add_email_outbox already executed, skipping';
+        RETURN;
+    END IF;
+END $$;
+
+-- Execute migration
+CREATE TABLE IF NOT EXISTS emailoutbox (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR NOT NULL,
+    to_email VARCHAR NOT NULL,
+    parent_id INTEGER REFERENCES parent (id),
+    payload VARCHAR,
+    status VARCHAR NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+    last_error VARCHAR,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (NOW() AT TIME ZONE 'utc'),
+    sent_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+CREATE INDEX IF NOT EXISTS ix_emailoutbox_status_next_attempt ON emailoutbox (status, next_attempt_at);
+
+-- Record migration
+INSERT INTO schema_migrations (migration_name, executed_at, success)
+VALUES ('004_add_email_outbox', NOW(), TRUE)
+ON CONFLICT (migration_name) DO NOTHING;
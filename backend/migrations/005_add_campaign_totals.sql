@@ -0,0 +1,47 @@
+-- Migration: Add campaign totals table
+-- Date: 2026-10-17
+-- Description: One row of contribution aggregates per campaign (count per status,
+-- expected and paid sums), maintained by app/campaign_totals.py in the same
+-- transaction as contribution writes. Mirrors CampaignTotals in app/models.py.
+-- The backfill below is the same computation as `python -m app.campaign_totals --fix`.
+
+-- Check if already executed
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM schema_migrations WHERE migration_name = '005_add_campaign_totals') THEN
+        RAISE NOTICE 'Migration 005_add_campaign_totals already executed, skipping';
+        RETURN;
+    END IF;
+END $$;
+
+-- Execute migration
+CREATE TABLE IF NOT EXISTS campaigntotals (
+    campaign_id INTEGER PRIMARY KEY REFERENCES campaign (id),
+    contributions INTEGER NOT NULL DEFAULT 0,
+    pending_count INTEGER NOT NULL DEFAULT 0,
+    paid_count INTEGER NOT NULL DEFAULT 0,
+    expected_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    paid_sum DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+INSERT INTO campaigntotals (campaign_id, contributions, pending_count, paid_count, expected_sum, paid_sum)
+SELECT
+    campaign_id,
+    COUNT(*),
+    SUM(CASE WHEN status = 'paid' THEN 0 ELSE 1 END),
+    SUM(CASE WHEN status = 'paid' THEN 1 ELSE 0 END),
+    COALESCE(SUM(amount_expected), 0),
+    COALESCE(SUM(CASE WHEN status = 'paid' THEN amount_paid ELSE 0 END), 0)
+FROM contribution
+GROUP BY campaign_id
+ON CONFLICT (campaign_id) DO UPDATE SET
+    contributions = EXCLUDED.contributions,
+    pending_count = EXCLUDED.pending_count,
+    paid_count = EXCLUDED.paid_count,
+    expected_sum = EXCLUDED.expected_sum,
+    paid_sum = EXCLUDED.paid_sum;
+
+-- Record migration
+INSERT INTO schema_migrations (migration_name, executed_at, success)
+VALUES ('005_add_campaign_totals', NOW(), TRUE)
+ON CONFLICT (migration_name) DO NOTHING;
@@ -15,6 +15,22 @@ def setup_db(tmp_path, monkeypatch):
     yield
 
 
+@pytest.fixture(autouse=True)
+def clear_identity_cache():
+    # ids repeat across per-test databases; never serve a previous test's identity
+    from app.identity_cache import parent_identity_cache
+    parent_identity_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    # campaign ids repeat across per-test databases as well
+    from app.cache import response_cache
+    response_cache.clear()
+    yield
+
+
 @pytest.fixture(autouse=True)
 def fake_email_client(monkeypatch):
     class FakeEmailClient:
@@ -34,3 +50,31 @@ def fake_email_client(monkeypatch):
     client = FakeEmailClient()
     monkeypatch.setattr('app.api.parents.gmail_client', client)
     yield client
+
+
+@pytest.fixture
+def fake_google():
+    # local stand-in for Google's token and Gmail send endpoints
+    from tests.helpers import FakeGoogle
+    fakes = []
+
+    def make(**kwargs):
+        fakes.append(FakeGoogle(**kwargs))
+        return fakes[-1]
+    yield make
+    for fake in fakes:
+        fake.close()
+
+
+@pytest.fixture
+def query_budget():
+    """``with query_budget(3): client.get(...)`` fails if the block runs more SQL statements."""
+    from contextlib import contextmanager
+    from app.query_stats import capture
+
+    @contextmanager
+    def budget(max_queries):
+        with capture() as stats:
+            yield stats
+        assert stats.count <= max_queries, f'query budget of {max_queries} exceeded: {stats.report()}'
+    return budget
@@ -1,5 +1,13 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
 from fastapi.testclient import TestClient
 
+from app.email import GmailEmailClient
+
 
 def create_parent_and_capture_password(client: TestClient, token: str, fake_email_client, email: str, name: str) -> tuple:
     headers = {'Authorization': f'Bearer {token}'}
@@ -9,3 +17,113 @@ def create_parent_and_capture_password(client: TestClient, token: str, fake_emai
     assert sent['to_email'] == email
     assert sent['parent_name'] == name
     return response, sent['password']
+
+
+class FakeGoogle:
+    """Local stand-in for the OAuth token endpoint and the Gmail send endpoint."""
+
+    def __init__(self, expires_in=3600, token_delay=0.0, send_delay=0.0):
+        self.expires_in = expires_in
+        self.token_delay = token_delay
+        self.send_delay = send_delay
+        # (status, headers) answered to the next sends before falling back to 200
+        self.send_failures = []
+        self.send_attempts = 0
+        self.token_calls = 0
+        self.sent = []
+        self.connections = set()
+        self.reject_tokens = set()
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with fake.lock:
+                    fake.connections.add(self.client_address)
+                if self.path == '/token':
+                    assert parse_qs(body.decode())['grant_type'] == ['refresh_token']
+                    time.sleep(fake.token_delay)
+                    with fake.lock:
+                        fake.token_calls += 1
+                        token = f'token-{fake.token_calls}'
+                    self._reply(200, {'access_token': token, 'expires_in': fake.expires_in})
+                elif self.path == '/send':
+                    token = self.headers['Authorization'].split()[1]
+                    if token in fake.reject_tokens:
+                        self._reply(401, {'error': 'invalid token'})
+                        return
+                    time.sleep(fake.send_delay)
+                    with fake.lock:
+                        fake.send_attempts += 1
+                        failure = fake.send_failures.pop(0) if fake.send_failures else None
+                    if failure:
+                        status, headers = failure
+                        self._reply(status, {'error': 'fake failure'}, headers)
+                        return
+                    with fake.lock:
+                        fake.sent.append((token, json.loads(body)['raw']))
+                    self._reply(200, {'id': str(len(fake.sent))})
+                else:
+                    self._reply(404, {})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def client(self, **kwargs):
+        kwargs.setdefault('rate_per_second', 0)
+        return GmailEmailClient(
+            client_id='id', client_secret='secret', refresh_token='refresh', sender_email='skarbek@example.com',
+            token_uri=f'{self.url}/token', send_url=f'{self.url}/send', timeout=(2, 5), **kwargs,
+        )
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeRedis:
+    """The slice of the redis-py client ``app.cache.RedisBackend`` uses, with a settable clock."""
+
+    def __init__(self):
+        self.data = {}
+        self.now = 0.0
+
+    def _live(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at <= self.now:
+            del self.data[key]
+            return None
+        return value
+
+    def get(self, key):
+        return self._live(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, self.now + ex if ex else None)
+
+    def incr(self, key):
+        value = int(self._live(key) or 0) + 1
+        self.data[key] = (str(value).encode(), None)
+        return value
+
+    def delete(self, key):
+        self.data.pop(key, None)
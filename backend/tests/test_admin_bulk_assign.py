@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlmodel import select
+
+from app.api.admin import _bulk_assign_counts
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def campaign_with_parents():
+    with get_db() as session:
+        camp = Campaign(title='Wycieczka', target_amount=100.0)
+        session.add(camp)
+        parents = [
+            Parent(name='A', email='a@example.com', pupil_id='3A-01'),
+            Parent(name='B', email='b@example.com', pupil_id='3A-02'),
+            Parent(name='C', email='c@example.com', pupil_id='3B-01'),
+            Parent(name='H', email='h@example.com', pupil_id='3A-03', is_hidden=True),
+        ]
+        session.add_all(parents)
+        session.commit()
+        return camp.id, [p.id for p in parents]
+
+
+def _contributions(campaign_id):
+    with get_db() as session:
+        rows = session.exec(select(Contribution).where(Contribution.campaign_id == campaign_id)).all()
+        return {c.parent_id: c for c in rows}
+
+
+def test_bulk_assign_visible_parents_is_idempotent(headers, campaign_with_parents):
+    camp_id, (a, b, c, hidden) = campaign_with_parents
+    url = f'/api/admin/campaigns/{camp_id}/contributions/bulk'
+
+    r = client.post(url, json={'amount_expected': 25.0}, headers=headers)
+    assert r.status_code == 200
+    assert r.json() == {'campaign_id': camp_id, 'matched': 3, 'created': 3, 'skipped': 0}
+    contributions = _contributions(camp_id)
+    assert set(contributions) == {a, b, c}
+    assert all(x.amount_expected == 25.0 and x.status == 'pending' and x.amount_paid == 0.0
+               for x in contributions.values())
+
+    r = client.post(url, json={'amount_expected': 30.0}, headers=headers)
+    assert r.json() == {'campaign_id': camp_id, 'matched': 3, 'created': 0, 'skipped': 3}
+    # existing rows are not overwritten
+    assert _contributions(camp_id)[a].amount_expected == 25.0
+
+
+def test_bulk_assign_filters(headers, campaign_with_parents):
+    camp_id, (a, b, c, hidden) = campaign_with_parents
+    url = f'/api/admin/campaigns/{camp_id}/contributions/bulk'
+
+    r = client.post(url, json={'pupil_id_prefix': '3A', 'include_hidden': True}, headers=headers)
+    assert r.json()['created'] == 3
+    assert set(_contributions(camp_id)) == {a, b, hidden}
+
+    r = client.post(url, json={'parent_ids': [b, c]}, headers=headers)
+    assert r.json() == {'campaign_id': camp_id, 'matched': 2, 'created': 1, 'skipped': 1}
+
+
+def test_bulk_assign_prefix_is_literal(headers, campaign_with_parents):
+    camp_id, _ = campaign_with_parents
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'pupil_id_prefix': '3_'}, headers=headers)
+    assert r.json()['matched'] == 0
+
+
+def test_bulk_assign_validation(headers, campaign_with_parents):
+    camp_id, _ = campaign_with_parents
+    r = client.post('/api/admin/campaigns/999/contributions/bulk', json={}, headers=headers)
+    assert r.status_code == 404
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'amount_expected': -1}, headers=headers)
+    assert r.status_code == 400
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'parent_ids': 'x'}, headers=headers)
+    assert r.status_code == 400
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'amount_expected': True}, headers=headers)
+    assert r.status_code == 400
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'parent_ids': [True]}, headers=headers)
+    assert r.status_code == 400
+
+    client.post(f'/api/admin/campaigns/{camp_id}/close', headers=headers)
+    r = client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={}, headers=headers)
+    assert r.status_code == 409
+
+
+def test_bulk_assign_counts_in_one_postgres_statement():
+    session = SimpleNamespace(bind=SimpleNamespace(dialect=postgresql.dialect()))
+    stmt = _bulk_assign_counts(session, 7, 25.0, [Parent.is_hidden == False])
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert sql.startswith('WITH created AS')
+    assert 'INSERT INTO contribution' in sql and 'SELECT CAST(' in sql
+    assert 'ON CONFLICT (campaign_id, parent_id) DO NOTHING RETURNING contribution.id' in sql
+    # no parent ids are bound: the selection stays on the server
+    assert 'parent.id IN' not in sql
+
@@ -0,0 +1,65 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+
+
+def _admin_headers(client):
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    assert r.status_code == 200
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+def _seed():
+    with get_db() as session:
+        full = Campaign(title='Full', target_amount=100.0)
+        empty = Campaign(title='Empty', target_amount=10.0)
+        inactive = Campaign(title='Old', target_amount=5.0, active=False)
+        p1 = Parent(name='A', email='a@example.com')
+        p2 = Parent(name='B', email='b@example.com')
+        session.add_all([full, empty, inactive, p1, p2])
+        session.commit()
+        session.add_all([
+            Contribution(campaign_id=full.id, parent_id=p1.id, amount_expected=50.0, amount_paid=50.0, status='paid'),
+            Contribution(campaign_id=full.id, parent_id=p2.id, amount_expected=50.0),
+            Contribution(campaign_id=inactive.id, parent_id=p1.id, amount_expected=5.0),
+        ])
+        session.commit()
+        return full.id, empty.id
+
+
+def test_list_contributions_groups_joined_rows():
+    full_id, empty_id = _seed()
+    client = TestClient(app)
+    r = client.get('/api/admin/contributions', headers=_admin_headers(client))
+    assert r.status_code == 200
+    body = r.json()
+    assert [g['campaign']['id'] for g in body] == [full_id, empty_id]
+    full = body[0]
+    assert full['campaign'] == {'id': full_id, 'title': 'Full', 'target_amount': 100.0}
+    assert [c['parent_email'] for c in full['contributions']] == ['a@example.com', 'b@example.com']
+    assert full['contributions'][0]['status'] == 'paid'
+    assert full['contributions'][1]['status'] == 'pending'
+    assert body[1]['contributions'] == []
+
+
+def test_list_contributions_ndjson():
+    full_id, empty_id = _seed()
+    client = TestClient(app)
+    r = client.get('/api/admin/contributions', params={'format': 'ndjson'}, headers=_admin_headers(client))
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('application/x-ndjson')
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert len(lines) == 3
+    assert [line['campaign']['id'] for line in lines] == [full_id, full_id, empty_id]
+    assert lines[2]['contribution'] is None
+
+
+def test_list_contributions_empty_and_bad_format():
+    client = TestClient(app)
+    headers = _admin_headers(client)
+    assert client.get('/api/admin/contributions', headers=headers).json() == []
+    assert client.get('/api/admin/contributions', params={'format': 'xml'}, headers=headers).status_code == 400
@@ -0,0 +1,99 @@
+import time
+
+import jwt
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app import middleware
+from app.auth import JWT_ALG, JWT_SECRET, create_token
+from app.middleware import AdminAuthMiddleware, VerifiedTokenCache
+
+
+def _client(cache_size=16):
+    app = FastAPI()
+    app.add_middleware(AdminAuthMiddleware, cache_size=cache_size)
+
+    @app.get('/api/admin/whoami')
+    def whoami(request: Request):
+        return {'user': request.state.user}
+
+    @app.post('/api/admin/login')
+    def login():
+        return {'ok': True}
+
+    @app.get('/api/parents/ping')
+    def ping():
+        return {'ok': True}
+
+    return TestClient(app)
+
+
+def _counting_decode(monkeypatch):
+    calls = []
+    real = middleware.decode_token
+
+    def decode(token):
+        calls.append(token)
+        return real(token)
+
+    monkeypatch.setattr(middleware, 'decode_token', decode)
+    return calls
+
+
+def test_non_admin_paths_and_login_bypass_auth(monkeypatch):
+    calls = _counting_decode(monkeypatch)
+    client = _client()
+    assert client.get('/api/parents/ping').status_code == 200
+    assert client.post('/api/admin/login').status_code == 200
+    assert calls == []
+
+
+def test_rejects_missing_malformed_and_invalid_tokens():
+    client = _client()
+    r = client.get('/api/admin/whoami')
+    assert r.status_code == 401 and r.json() == {'detail': 'Missing authorization header'}
+    r = client.get('/api/admin/whoami', headers={'Authorization': 'Token abc'})
+    assert r.json() == {'detail': 'Invalid authorization format'}
+    r = client.get('/api/admin/whoami', headers={'Authorization': 'Bearer not-a-jwt'})
+    assert r.status_code == 401 and r.json() == {'detail': 'Invalid token'}
+
+
+def test_verified_token_is_decoded_once(monkeypatch):
+    calls = _counting_decode(monkeypatch)
+    client = _client()
+    headers = {'Authorization': f"Bearer {create_token({'sub': 'admin'})}"}
+    for _ in range(3):
+        r = client.get('/api/admin/whoami', headers=headers)
+        assert r.status_code == 200 and r.json() == {'user': 'admin'}
+    assert len(calls) == 1
+
+
+def test_cache_disabled_decodes_every_request(monkeypatch):
+    calls = _counting_decode(monkeypatch)
+    client = _client(cache_size=0)
+    headers = {'Authorization': f"Bearer {create_token({'sub': 'admin'})}"}
+    client.get('/api/admin/whoami', headers=headers)
+    client.get('/api/admin/whoami', headers=headers)
+    assert len(calls) == 2
+
+
+def test_token_cache_expires_at_token_exp_and_is_bounded():
+    cache = VerifiedTokenCache(max_entries=2)
+    now = time.time()
+    cache.put('expired', {'sub': 'a', 'exp': now - 1})
+    assert cache.get('expired') is None and len(cache) == 0
+    cache.put('no-exp', {'sub': 'a'})
+    assert len(cache) == 0
+
+    for name in ('t1', 't2', 't3'):
+        cache.put(name, {'sub': name, 'exp': now + 60})
+    assert len(cache) == 2
+    assert cache.get('t1') is None
+    assert cache.get('t3') == {'sub': 't3', 'exp': now + 60}
+
+
+def test_expired_token_is_rejected():
+    client = _client()
+    token = jwt.encode({'sub': 'admin', 'exp': int(time.time()) - 5}, JWT_SECRET, algorithm=JWT_ALG)
+    r = client.get('/api/admin/whoami', headers={'Authorization': f'Bearer {token}'})
+    assert r.status_code == 401
@@ -49,3 +49,67 @@ def test_campaign_roster_roundtrip():
             assert row['contribution'] is not None
         if row['parent_email'] == 'b@example.com':
             assert row['contribution'] is None
+
+
+def _seed_roster(n_parents=6):
+    with get_db() as session:
+        camp = Campaign(title='paged', target_amount=600.0)
+        session.add(camp)
+        session.commit()
+        parents = []
+        for i in range(n_parents):
+            p = Parent(name=f'Parent {i}', email=f'p{i}@example.com', is_hidden=(i == n_parents - 1))
+            session.add(p)
+            parents.append(p)
+        session.commit()
+        # p0 paid, p1 pending, rest without contribution
+        session.add(Contribution(campaign_id=camp.id, parent_id=parents[0].id, amount_expected=100.0, amount_paid=100.0, status='paid'))
+        session.add(Contribution(campaign_id=camp.id, parent_id=parents[1].id, amount_expected=100.0, amount_paid=0.0, status='pending'))
+        session.commit()
+        return camp.id, [p.id for p in parents]
+
+
+def _admin_headers(client):
+    rlogin = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {rlogin.json()['token']}"}
+
+
+def test_campaign_roster_keyset_pagination_and_summary():
+    client = TestClient(app)
+    camp_id, parent_ids = _seed_roster()
+    headers = _admin_headers(client)
+
+    seen = []
+    after = None
+    while True:
+        params = {'limit': 2}
+        if after is not None:
+            params['after_parent_id'] = after
+        body = client.get(f'/api/admin/campaigns/{camp_id}/roster', params=params, headers=headers).json()
+        seen.extend(row['parent_id'] for row in body['rows'])
+        # totals always describe the whole filtered roster, not the page
+        assert body['summary'] == {
+            'parents': 5, 'with_contribution': 2, 'paid': 1, 'unpaid': 4,
+            'amount_expected': 200.0, 'amount_paid': 100.0,
+        }
+        after = body['next_after_parent_id']
+        if after is None:
+            break
+    assert seen == parent_ids[:-1]
+
+
+def test_campaign_roster_filters():
+    client = TestClient(app)
+    camp_id, parent_ids = _seed_roster()
+    headers = _admin_headers(client)
+    url = f'/api/admin/campaigns/{camp_id}/roster'
+
+    def ids(**params):
+        return [row['parent_id'] for row in client.get(url, params=params, headers=headers).json()['rows']]
+
+    assert ids(status='paid') == [parent_ids[0]]
+    assert ids(status='none') == parent_ids[2:-1]
+    assert ids(unpaid_only='true') == parent_ids[1:-1]
+    assert ids(hidden='true') == [parent_ids[-1]]
+    assert ids(q='P3@EX') == [parent_ids[3]]
+    assert ids(q='parent 1') == [parent_ids[1]]
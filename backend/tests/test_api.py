@@ -278,3 +278,47 @@ def test_parent_contributions_access_after_password_change(fake_email_client):
     contrib_payload = {'campaign_id': campaign_id, 'amount': 50}
     r3 = client.post('/api/parents/contributions', json=contrib_payload, headers=new_headers)
     assert r3.status_code == 200
+
+
+def test_parent_resubmit_contribution_updates_existing_row(fake_email_client):
+    """Test: Ponowne zgłoszenie wpłaty aktualizuje istniejący wpis zamiast tworzyć duplikat"""
+    client = TestClient(app)
+    camp_id = client.post("/api/campaigns/", json={"title": "Resubmit", "target_amount": 10}).json()['id']
+
+    login = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    token = login.json()['token']
+    _, temporary_password = create_parent_and_capture_password(client, token, fake_email_client, 'again@test.pl', 'Again')
+    r = client.post('/api/parents/login', json={'email': 'again@test.pl', 'password': temporary_password})
+    r = client.post('/api/parents/change-password-initial',
+                    json={'old_password': temporary_password, 'new_password': 'newpass444'},
+                    headers={'Authorization': f"Bearer {r.json()['token']}"})
+    headers = {'Authorization': f"Bearer {r.json()['token']}"}
+
+    first = client.post('/api/parents/contributions', json={'campaign_id': camp_id, 'amount': 5}, headers=headers)
+    second = client.post('/api/parents/contributions', json={'campaign_id': camp_id, 'amount': 10, 'note': 'reszta'}, headers=headers)
+    assert first.status_code == 200 and second.status_code == 200
+    assert first.json()['id'] == second.json()['id']
+
+    missing = client.post('/api/parents/contributions', json={'campaign_id': 9999, 'amount': 5}, headers=headers)
+    assert missing.status_code == 404
+
+
+def test_parent_email_duplicates_are_case_insensitive(fake_email_client):
+    """Test: Adres e-mail rodzica jest unikalny bez względu na wielkość liter"""
+    client = TestClient(app)
+    login = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    headers = {'Authorization': f"Bearer {login.json()['token']}"}
+    first = client.post('/api/admin/parents', json={'name': 'Ala', 'email': 'ala@test.pl'}, headers=headers)
+    other = client.post('/api/admin/parents', json={'name': 'Ola', 'email': 'ola@test.pl'}, headers=headers)
+    assert first.status_code == 200 and other.status_code == 200
+
+    r = client.post('/api/admin/parents', json={'name': 'Ala 2', 'email': 'ALA@test.pl'}, headers=headers)
+    assert r.status_code == 400
+
+    other_id = other.json()['id']
+    r = client.put(f'/api/admin/parents/{other_id}', json={'email': 'Ala@Test.pl'}, headers=headers)
+    assert r.status_code == 400
+    # a case-only change of the parent's own address is allowed
+    r = client.put(f'/api/admin/parents/{other_id}', json={'email': 'OLA@test.pl'}, headers=headers)
+    assert r.status_code == 200 and r.json()['email'] == 'OLA@test.pl'
+
@@ -0,0 +1,147 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.bank_import import (
+    ContributionIndex, PendingContribution, StatementFormatError, StatementParser, match_transfers, parse_amount,
+    parse_statement,
+)
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+
+client = TestClient(app)
+
+MBANK = (
+    'mBank S.A. Bankowość Detaliczna;\n'
+    '#Za okres:;\n'
+    '01.09.2024;30.09.2024;\n'
+    '\n'
+    '#Data operacji;#Opis operacji;#Rachunek;#Kategoria;#Kwota;\n'
+    '2024-09-02;"ANNA NOWAK PRZELEW PRZYCHODZĄCY 3A-01 wycieczka";"eKonto";"Wpływy";"1 250,00 PLN";\n'
+    '2024-09-03;"ZAKUP BLIK";"eKonto";"Zakupy";"-45,10 PLN";\n'
+    '2024-09-04;"Jan Wisniewski składka jw@example.com";"eKonto";"Wpływy";"50,00 PLN";\n'
+)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}", 'Content-Type': 'text/csv'}
+
+
+def test_amounts():
+    assert parse_amount('1 234,56') == 1234.56
+    assert parse_amount('-1.234,56 PLN') == -1234.56
+    assert parse_amount('\xa0100.5') == 100.5
+    assert parse_amount('') is None
+
+
+def test_parses_cp1250_in_small_chunks():
+    raw = MBANK.encode('cp1250')
+    transfers, parser = parse_statement(raw[i:i + 7] for i in range(0, len(raw), 7))
+    assert [(t.line, t.date, t.amount) for t in transfers] == [(6, '2024-09-02', 1250.0), (8, '2024-09-04', 50.0)]
+    assert 'PRZYCHODZĄCY' in transfers[0].title
+    assert (parser.rows, parser.skipped) == (3, 1)
+
+
+def test_other_layouts():
+    ing = ('"Data transakcji","Data księgowania","Dane kontrahenta","Tytuł","Kwota transakcji (waluta rachunku)"\n'
+           '"05.09.2024","05.09.2024","Ewa Zając","składka\nwrzesień","80,00"\n')
+    (t,), _ = parse_statement([ing.encode('utf-8')])
+    assert (t.date, t.counterparty, t.title, t.amount) == ('2024-09-05', 'Ewa Zając', 'składka\nwrzesień', 80.0)
+
+    millennium = ('Numer rachunku;Data transakcji;Odbiorca/Zleceniodawca;Opis;Obciążenia;Uznania\n'
+                  'PL1;2024-09-06;Firma;zakupy;-20,00;\n'
+                  'PL1;2024-09-07;Ola Lis;teatr;;35,00\n')
+    transfers, parser = parse_statement([millennium.encode('cp1250')])
+    assert [(t.counterparty, t.amount) for t in transfers] == [('Ola Lis', 35.0)]
+    assert parser.skipped == 1
+
+    pko = ('"Data operacji","Data waluty","Typ transakcji","Kwota","Waluta","Saldo po transakcji","Opis transakcji"\n'
+           '"2024-09-08","2024-09-08","Przelew na konto","+60.00","PLN","100.00","Rachunek nadawcy: 1",'
+           '"Nazwa nadawcy: PIOTR KOT","Tytuł: 2B-07"\n')
+    (t,), _ = parse_statement([pko.encode('utf-8')])
+    assert t.amount == 60.0 and t.title.endswith('Nazwa nadawcy: PIOTR KOT Tytuł: 2B-07')
+
+
+def test_rejects_unknown_layout():
+    with pytest.raises(StatementFormatError):
+        parse_statement([b'a;b\n1;2\n'])
+
+
+def test_matcher_scores_and_assigns_each_contribution_once():
+    index = ContributionIndex.build([
+        PendingContribution(1, 1, 10, 1250.0, 'anna@example.com', '3A-01', 'Anna Nowak'),
+        PendingContribution(2, 1, 11, 50.0, 'jw@example.com', None, 'Jan Wiśniewski'),
+        PendingContribution(3, 2, 11, 30.0, 'jw@example.com', None, 'Jan Wiśniewski'),
+    ])
+    transfers, _ = parse_statement([MBANK.encode('utf-8')])
+    transfers.append(transfers[0])  # the same transfer twice
+    result = match_transfers(index, transfers)
+    first, second = result['proposals']
+    assert (first['contribution_id'], first['reasons']) == (1, ['amount', 'name', 'pupil_id'])
+    # the email matches both of the parent's contributions, the amount picks one
+    assert (second['contribution_id'], second['reasons']) == (2, ['amount', 'email', 'name'])
+    assert first['confidence'] > 0.8 and not second['ambiguous']
+    assert second['mark_paid'] == {'campaign_id': 1, 'parent_id': 11, 'amount': 50.0,
+                                   'note': 'przelew 2024-09-04 Jan Wisniewski składka jw@example.com'}
+    assert [t['line'] for t in result['unmatched']] == [6]
+
+
+def test_match_endpoint_feeds_batch_mark_paid(headers):
+    with get_db() as session:
+        camp, closed = Campaign(title='Wycieczka'), Campaign(title='Stara', is_closed=True)
+        anna = Parent(name='Anna Nowak', email='anna@example.com', pupil_id='3A-01')
+        jan = Parent(name='Jan Wisniewski', email='jw@example.com')
+        session.add_all([camp, closed, anna, jan])
+        session.commit()
+        session.add_all([
+            Contribution(campaign_id=camp.id, parent_id=anna.id, amount_expected=1250.0),
+            Contribution(campaign_id=closed.id, parent_id=jan.id, amount_expected=50.0),
+        ])
+        session.commit()
+        camp_id, anna_id = camp.id, anna.id
+
+    r = client.post('/api/admin/bank-statements/match', content=MBANK.encode('cp1250'), headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert data['summary'] == {'rows': 3, 'incoming': 2, 'skipped': 1, 'proposed': 1, 'unmatched': 1,
+                               'pending_contributions': 1}
+    items = [p['mark_paid'] for p in data['proposals']]
+    assert items[0]['parent_id'] == anna_id
+
+    r = client.post('/api/admin/contributions/mark-paid/batch', json={'items': items},
+                    headers={'Authorization': headers['Authorization']})
+    assert r.json()['updated'] == 1
+    r = client.post('/api/admin/bank-statements/match', content=MBANK.encode('cp1250'), headers=headers,
+                    params={'campaign_id': camp_id})
+    assert r.json()['summary']['pending_contributions'] == 0
+
+    r = client.post('/api/admin/bank-statements/match', content=b'x;y\n', headers=headers)
+    assert r.status_code == 400
+
+
+def test_match_endpoint_parses_off_the_event_loop(headers, monkeypatch):
+    feed, close = StatementParser.feed, StatementParser.close
+    on_loop = []
+
+    def running_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    def spy(method):
+        def wrapped(self, *args):
+            on_loop.append(running_loop())
+            return method(self, *args)
+        return wrapped
+    monkeypatch.setattr(StatementParser, 'feed', spy(feed))
+    monkeypatch.setattr(StatementParser, 'close', spy(close))
+
+    r = client.post('/api/admin/bank-statements/match', content=MBANK.encode('cp1250'), headers=headers)
+    assert r.status_code == 200
+    assert on_loop and not any(on_loop)
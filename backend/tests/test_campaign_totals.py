@@ -0,0 +1,102 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from app.auth import hash_password
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, CampaignTotals, Parent
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def setup():
+    with get_db() as session:
+        camp = Campaign(title='Teatr', target_amount=200.0)
+        parents = [Parent(name=f'P{i}', email=f'p{i}@example.com', force_password_change=False,
+                          password_hash=hash_password('sekret123')) for i in range(4)]
+        session.add(camp)
+        session.add_all(parents)
+        session.commit()
+        return camp.id, [p.id for p in parents]
+
+
+def _progress(headers, camp_id):
+    rows = {r['campaign_id']: r for r in client.get('/api/admin/campaigns/progress', headers=headers).json()}
+    r = rows[camp_id]
+    return (r['contributions'], r['pending_count'], r['paid_count'], r['expected_sum'], r['paid_sum'])
+
+
+def _consistent(headers):
+    return client.get('/api/admin/campaign-totals/check', headers=headers).json()['ok']
+
+
+def test_totals_follow_every_write_path(headers, setup):
+    camp_id, (p0, p1, p2, p3) = setup
+    assert _progress(headers, camp_id) == (0, 0, 0, 0.0, 0.0)
+
+    client.post('/api/admin/contributions', json={'campaign_id': camp_id, 'parent_id': p0, 'amount_expected': 50},
+                headers=headers)
+    client.post('/api/admin/contributions', json={'campaign_id': camp_id, 'parent_id': p0, 'amount_expected': 50},
+                headers=headers)  # idempotent, no change
+    assert _progress(headers, camp_id) == (1, 1, 0, 50.0, 0.0)
+
+    client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'amount_expected': 40,
+                'parent_ids': [p0, p1, p2]}, headers=headers)
+    assert _progress(headers, camp_id) == (3, 3, 0, 130.0, 0.0)
+
+    client.post('/api/admin/contributions/mark-paid', json={'campaign_id': camp_id, 'parent_id': p0, 'amount': 50},
+                headers=headers)
+    client.post('/api/admin/contributions/mark-paid', json={'campaign_id': camp_id, 'parent_id': p0, 'amount': 45},
+                headers=headers)  # corrected amount replaces the previous one
+    assert _progress(headers, camp_id) == (3, 2, 1, 130.0, 45.0)
+
+    items = [{'campaign_id': camp_id, 'parent_id': p, 'amount': 40} for p in (p1, p2, p3)]
+    client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers)
+    client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers)
+    assert _progress(headers, camp_id) == (3, 0, 3, 130.0, 125.0)
+
+    token = client.post('/api/parents/login', json={'email': 'p3@example.com', 'password': 'sekret123'}).json()['token']
+    parent = {'Authorization': f'Bearer {token}'}
+    client.post('/api/parents/contributions', json={'campaign_id': camp_id, 'amount': 30}, headers=parent)
+    client.post('/api/parents/contributions', json={'campaign_id': camp_id, 'amount': 35}, headers=parent)
+    # a declared payment is pending until an admin marks it paid
+    assert _progress(headers, camp_id) == (4, 1, 3, 130.0, 125.0)
+
+    r = client.get('/api/admin/campaigns/progress', headers=headers)
+    progress = [row for row in r.json() if row['campaign_id'] == camp_id][0]
+    assert progress['progress'] == 0.625
+    # sums and counts are not public
+    assert client.get('/api/admin/campaigns/progress').status_code == 401
+    assert client.get('/api/campaigns/progress').status_code in (404, 405)
+    assert _consistent(headers)
+
+
+def test_check_detects_drift_and_rebuild_fixes_it(headers, setup):
+    camp_id, (p0, p1, *_) = setup
+    client.post(f'/api/admin/campaigns/{camp_id}/contributions/bulk', json={'amount_expected': 10}, headers=headers)
+    with get_db() as session:
+        session.execute(update(CampaignTotals).values(paid_count=7, expected_sum=1.0))
+        session.commit()
+
+    report = client.get('/api/admin/campaign-totals/check', headers=headers).json()
+    assert not report['ok']
+    (mismatch,) = report['mismatches']
+    assert mismatch['campaign_id'] == camp_id
+    assert (mismatch['stored']['paid_count'], mismatch['actual']['paid_count']) == (7, 0)
+    assert mismatch['actual']['expected_sum'] == 40.0
+
+    assert client.post('/api/admin/campaign-totals/rebuild', headers=headers).json() == {'rebuilt': 1}
+    assert _consistent(headers)
+    assert _progress(headers, camp_id) == (4, 4, 0, 40.0, 0.0)
+
+
+def test_check_requires_admin():
+    assert client.get('/api/admin/campaign-totals/check').status_code == 401
@@ -0,0 +1,49 @@
+import asyncio
+
+import httpx
+from sqlmodel import select
+
+from app.db import get_db
+from app.db_async import async_database_url, get_async_db, get_async_engine
+from app.main import app
+from app.models import Parent
+
+
+def test_async_database_url_mapping():
+    assert async_database_url('postgresql+psycopg2://u:p@db:5432/x') == 'postgresql+asyncpg://u:p@db:5432/x'
+    assert async_database_url('postgresql://u:p@db/x') == 'postgresql+asyncpg://u:p@db/x'
+    assert async_database_url('sqlite:///./test.db') == 'sqlite+aiosqlite:///./test.db'
+
+
+def test_async_engine_follows_sync_engine():
+    import app.db as dbmod
+    sync_url = dbmod.get_engine().url
+    async_engine = get_async_engine()
+    assert async_engine is get_async_engine()
+    assert async_engine.url.database == sync_url.database
+    assert async_engine.url.drivername == 'sqlite+aiosqlite'
+
+
+def test_async_session_sees_sync_writes():
+    with get_db() as session:
+        session.add(Parent(name='Async', email='async@example.com'))
+        session.commit()
+
+    async def fetch():
+        async with get_async_db() as session:
+            return (await session.exec(select(Parent).where(Parent.email == 'async@example.com'))).first()
+
+    parent = asyncio.run(fetch())
+    assert parent is not None and parent.name == 'Async'
+
+
+def test_concurrent_async_requests():
+    async def run():
+        async with httpx.AsyncClient(app=app, base_url='http://test') as client:
+            responses = await asyncio.gather(*[
+                client.post('/api/parents/login', json={'email': f'nobody{i}@example.com', 'password': 'x'})
+                for i in range(20)
+            ])
+        return [r.status_code for r in responses]
+
+    assert asyncio.run(run()) == [401] * 20
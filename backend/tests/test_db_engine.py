@@ -0,0 +1,66 @@
+import pytest
+
+import app.db as dbmod
+from app.db import build_engine, dispose_engine, get_engine
+from app.settings import Settings, get_settings
+
+
+@pytest.fixture
+def real_engine(tmp_path, monkeypatch):
+    # conftest swaps get_engine for a per-test engine; exercise the real one here
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'engine.db'}")
+    get_settings.cache_clear()
+    monkeypatch.setattr(dbmod, "get_engine", get_engine)
+    monkeypatch.setattr(dbmod, "_engine", None)
+    yield
+    dispose_engine()
+    get_settings.cache_clear()
+
+
+def test_get_engine_is_process_wide(real_engine):
+    first = get_engine()
+    assert get_engine() is first
+    with dbmod.get_db() as session:
+        assert session.get_bind() is first
+
+
+def test_dispose_engine_rebuilds_on_next_use(real_engine):
+    first = get_engine()
+    dispose_engine()
+    second = get_engine()
+    assert second is not first
+    assert str(second.url) == str(first.url)
+
+
+def test_after_fork_hook_drops_engine(real_engine):
+    get_engine()
+    dbmod._reset_engine_after_fork()
+    assert dbmod._engine is None
+
+
+def test_postgres_engine_uses_configured_queue_pool():
+    settings = Settings(
+        database_url="postgresql+psycopg2://u:p@localhost:5432/db",
+        db_pool_size=7,
+        db_max_overflow=3,
+        db_pool_timeout=2.5,
+        db_pool_recycle=600,
+        db_pool_pre_ping=True,
+    )
+    engine = build_engine(settings)
+    try:
+        assert engine.pool.size() == 7
+        assert engine.pool._max_overflow == 3
+        assert engine.pool._timeout == 2.5
+        assert engine.pool._recycle == 600
+        assert engine.pool._pre_ping is True
+    finally:
+        engine.dispose()
+
+
+def test_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    s = Settings.from_env()
+    assert s.db_pool_size == 12
+    assert s.db_pool_pre_ping is False
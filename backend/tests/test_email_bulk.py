@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from app.email import BulkMessage, TokenBucket
+
+
+def _messages(n, template='temporary_password'):
+    return [BulkMessage(f'p{i}@example.com', template, {'password': f'haslo{i}', 'parent_name': f'Rodzic {i}'})
+            for i in range(n)]
+
+
+def test_bulk_send_reports_every_recipient_in_order(fake_google):
+    google = fake_google()
+    report = google.client().send_bulk(_messages(12), max_workers=4)
+    assert report.sent == 12 and report.failed == 0
+    assert [r.to_email for r in report.results] == [f'p{i}@example.com' for i in range(12)]
+    assert all(r.attempts == 1 for r in report.results)
+    assert google.token_calls == 1
+    assert report.to_dict()['sent'] == 12
+
+
+def test_rate_limit_with_retry_after_is_retried(fake_google):
+    google = fake_google()
+    google.send_failures = [(429, {'Retry-After': '0.2'}), (503, {})]
+    started = time.monotonic()
+    report = google.client().send_bulk(_messages(1), max_workers=1, base_delay=0.01)
+    assert report.results[0].status == 'sent'
+    assert report.results[0].attempts == 3
+    assert time.monotonic() - started >= 0.2
+
+
+def test_persistent_server_errors_fail_after_max_attempts(fake_google):
+    google = fake_google()
+    google.send_failures = [(500, {})] * 10
+    report = google.client().send_bulk(_messages(1), max_workers=1,
+                                       max_attempts=3, base_delay=0.01)
+    result = report.results[0]
+    assert result.status == 'failed' and result.attempts == 3 and result.http_status == 500
+
+
+def test_client_errors_and_unknown_templates_are_not_retried(fake_google):
+    google = fake_google()
+    google.send_failures = [(400, {})]
+    messages = _messages(1) + _messages(1, template='nope')
+    report = google.client().send_bulk(messages, max_workers=1, base_delay=0.01)
+    bad_request, bad_template = report.results
+    assert bad_request.status == 'failed' and bad_request.attempts == 1 and bad_request.http_status == 400
+    assert bad_template.status == 'failed' and bad_template.attempts == 0
+    assert google.send_attempts == 1
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate_per_second=50, capacity=1)
+    started = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    assert time.monotonic() - started == pytest.approx(0.2, abs=0.08)
+
+
+def test_token_bucket_pause_holds_everyone_back():
+    bucket = TokenBucket(rate_per_second=1000, capacity=5)
+    bucket.pause(0.15)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.14
+
+
+def test_concurrent_bulk_sends_share_the_client_bucket(fake_google):
+    client = fake_google().client(rate_per_second=40, burst=1)
+    started = time.monotonic()
+    threads = [threading.Thread(target=client.send_bulk, args=(_messages(5),), kwargs={'max_workers': 2})
+               for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # ten sends through one bucket: each bulk send alone would take half as long
+    assert time.monotonic() - started >= 9 / 40 - 0.02
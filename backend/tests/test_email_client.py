@@ -0,0 +1,43 @@
+import threading
+
+
+def test_access_token_is_cached_and_connection_reused(fake_google):
+    google = fake_google()
+    client = google.client()
+    for i in range(3):
+        client.send_temporary_password_email(f'p{i}@example.com', 'haslo123', parent_name='Ala')
+    client.close()
+    assert google.token_calls == 1
+    assert [token for token, _ in google.sent] == ['token-1'] * 3
+    # token exchange and all sends went over one keep-alive connection
+    assert len(google.connections) == 1
+
+
+def test_token_close_to_expiry_is_refreshed(fake_google):
+    google = fake_google(expires_in=60)  # inside the refresh margin
+    client = google.client()
+    client.send_message('a@example.com', 'Temat', 'Treść')
+    client.send_message('b@example.com', 'Temat', 'Treść')
+    assert google.token_calls == 2
+
+
+def test_concurrent_senders_share_one_refresh(fake_google):
+    google = fake_google(token_delay=0.2)
+    client = google.client()
+    threads = [threading.Thread(target=client.send_message, args=(f'p{i}@example.com', 'Temat', 'Treść')) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert google.token_calls == 1
+    assert len(google.sent) == 8
+
+
+def test_rejected_token_is_refreshed_once(fake_google):
+    google = fake_google()
+    client = google.client()
+    client.send_message('a@example.com', 'Temat', 'Treść')
+    google.reject_tokens.add('token-1')
+    client.send_message('b@example.com', 'Temat', 'Treść')
+    assert google.token_calls == 2
+    assert google.sent[-1][0] == 'token-2'
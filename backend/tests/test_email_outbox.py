@@ -0,0 +1,166 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import outbox
+from app.db import get_db
+from app.main import app
+from app.models import EmailOutbox, Parent
+from app.settings import get_settings
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def admin_headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def outbox_settings(monkeypatch):
+    def configure(**env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        get_settings.cache_clear()
+    yield configure
+    get_settings.cache_clear()
+
+
+def _message(message_id):
+    with get_db() as session:
+        return session.get(EmailOutbox, message_id)
+
+
+def _make_due(message_id):
+    with get_db() as session:
+        m = session.get(EmailOutbox, message_id)
+        m.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        session.add(m)
+        session.commit()
+
+
+def _create_parent(headers, email='outbox@example.com'):
+    r = client.post('/api/admin/parents', json={'name': 'Outbox', 'email': email}, headers=headers)
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_create_parent_delivers_via_outbox_and_clears_payload(admin_headers, fake_email_client):
+    body = _create_parent(admin_headers)
+    assert body['email_status'] == 'pending'
+    assert fake_email_client.sent[-1]['to_email'] == 'outbox@example.com'
+
+    m = _message(body['outbox_id'])
+    assert m.status == 'sent' and m.attempts == 1 and m.sent_at is not None
+    assert m.parent_id == body['id']
+    assert m.payload is None
+
+
+def test_email_failure_keeps_parent_and_schedules_retry(admin_headers, fake_email_client):
+    fake_email_client.should_fail = True
+    body = _create_parent(admin_headers)
+
+    with get_db() as session:
+        assert session.get(Parent, body['id']) is not None
+    m = _message(body['outbox_id'])
+    assert m.status == 'pending' and m.attempts == 1
+    assert 'simulated email failure' in m.last_error
+    assert m.next_attempt_at > datetime.utcnow()
+    # not due yet: the worker leaves it alone
+    assert outbox.drain_outbox(fake_email_client)['claimed'] == 0
+
+    fake_email_client.should_fail = False
+    _make_due(m.id)
+    assert outbox.drain_outbox(fake_email_client)[outbox.SENT] == 1
+    m = _message(m.id)
+    assert m.status == 'sent' and m.attempts == 2 and m.last_error is None
+    # every attempt issues a new temporary password; only the last one logs in
+    first, second = (sent['password'] for sent in fake_email_client.sent)
+    assert first != second
+    login = lambda password: client.post('/api/parents/login', json={'email': 'outbox@example.com', 'password': password})
+    assert login(first).status_code == 401
+    assert login(second).status_code == 200
+
+
+def test_temporary_password_is_never_stored_in_the_outbox(admin_headers, fake_email_client, outbox_settings):
+    outbox_settings(OUTBOX_MAX_ATTEMPTS=1)
+    fake_email_client.should_fail = True
+    message_id = _create_parent(admin_headers)['outbox_id']
+    m = _message(message_id)
+    assert m.status == 'dead'
+    assert fake_email_client.sent[0]['password'] not in (m.payload or '')
+    assert 'password' not in json.loads(m.payload)
+
+
+def test_invitation_is_dropped_once_the_parent_has_a_password(admin_headers, fake_email_client):
+    fake_email_client.should_fail = True
+    body = _create_parent(admin_headers)
+    with get_db() as session:
+        p = session.get(Parent, body['id'])
+        p.force_password_change = False
+        session.add(p)
+        session.commit()
+        password_hash = p.password_hash
+    _make_due(body['outbox_id'])
+    fake_email_client.should_fail = False
+    assert outbox.drain_outbox(fake_email_client)[outbox.DEAD] == 1
+    assert 'no longer awaits' in _message(body['outbox_id']).last_error
+    assert len(fake_email_client.sent) == 1
+    with get_db() as session:
+        assert session.get(Parent, body['id']).password_hash == password_hash
+
+
+def test_message_goes_dead_after_max_attempts_and_admin_can_retry(admin_headers, fake_email_client, outbox_settings):
+    outbox_settings(OUTBOX_MAX_ATTEMPTS=2)
+    fake_email_client.should_fail = True
+    message_id = _create_parent(admin_headers)['outbox_id']
+    _make_due(message_id)
+    assert outbox.drain_outbox(fake_email_client)[outbox.DEAD] == 1
+    assert _message(message_id).status == 'dead'
+
+    r = client.get('/api/admin/outbox', params={'status': 'dead'}, headers=admin_headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert [item['id'] for item in data['items']] == [message_id]
+    assert 'payload' not in data['items'][0]
+    assert data['counts']['dead'] == 1
+
+    fake_email_client.should_fail = False
+    r = client.post(f'/api/admin/outbox/{message_id}/retry', headers=admin_headers)
+    assert r.status_code == 200
+    m = _message(message_id)
+    assert m.status == 'sent' and m.attempts == 1
+
+    r = client.post(f'/api/admin/outbox/{message_id}/retry', headers=admin_headers)
+    assert r.status_code == 409
+
+
+def test_backoff_grows_exponentially_and_is_capped(outbox_settings):
+    outbox_settings(OUTBOX_BACKOFF_BASE=10, OUTBOX_BACKOFF_MAX=60)
+    assert [outbox.backoff_delay(n).total_seconds() for n in (1, 2, 3, 4, 5)] == [10, 20, 40, 60, 60]
+
+
+def test_claimed_message_is_leased(fake_email_client):
+    with get_db() as session:
+        parent = Parent(name='A', email='a@example.com', force_password_change=True)
+        session.add(parent)
+        session.flush()
+        m = EmailOutbox(kind=outbox.TEMPORARY_PASSWORD, to_email='a@example.com', parent_id=parent.id, payload='{}')
+        session.add(m)
+        session.commit()
+        message_id = m.id
+        claimed = outbox._claim(session, None, 10, datetime.utcnow())
+        assert [c.id for c in claimed] == [message_id]
+        # a second worker does not see it until the lease runs out
+        assert outbox._claim(session, None, 10, datetime.utcnow()) == []
+    assert outbox.drain_outbox(fake_email_client)['claimed'] == 0
+    _make_due(message_id)
+    assert outbox.drain_outbox(fake_email_client)[outbox.SENT] == 1
+
+
+def test_list_outbox_rejects_unknown_status(admin_headers):
+    r = client.get('/api/admin/outbox', params={'status': 'bogus'}, headers=admin_headers)
+    assert r.status_code == 400
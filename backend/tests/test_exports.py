@@ -0,0 +1,129 @@
+import csv
+import io
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+
+client = TestClient(app)
+NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def campaign():
+    with get_db() as session:
+        camp = Campaign(title='Wycieczka: Kraków')
+        old = Campaign(title='Stara', is_closed=True)
+        parents = [
+            Parent(name='Anna Żak', email='anna@example.com', pupil_id='1A'),
+            Parent(name='Jan "Janek" Kos', email='jan@example.com'),
+            Parent(name='Ukryty', email='h@example.com', is_hidden=True),
+        ]
+        session.add_all([camp, old, *parents])
+        session.commit()
+        session.add_all([
+            Contribution(campaign_id=camp.id, parent_id=parents[0].id, amount_expected=50.0),
+            Contribution(campaign_id=old.id, parent_id=parents[1].id, amount_expected=20.0),
+        ])
+        session.commit()
+        return camp.id, old.id, [p.id for p in parents]
+
+
+def _sheet_rows(body):
+    archive = zipfile.ZipFile(io.BytesIO(body))
+    assert archive.testzip() is None
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+    rows = []
+    for row in sheet.iterfind('.//x:row', NS):
+        values = []
+        for c in row.iterfind('x:c', NS):
+            text = c.find('.//x:t', NS) if c.get('t') == 'inlineStr' else c.find('x:v', NS)
+            values.append(None if text is None else text.text)
+        rows.append(values)
+    return workbook.find('.//x:sheet', NS).get('name'), rows
+
+
+def test_roster_csv_export(headers, campaign):
+    camp_id, _, (anna, jan, hidden) = campaign
+    r = client.get(f'/api/admin/campaigns/{camp_id}/export', headers=headers)
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/csv')
+    assert f'zbiorka-{camp_id}.csv' in r.headers['content-disposition']
+    rows = list(csv.reader(io.StringIO(r.content.decode('utf-8-sig'))))
+    assert rows[0][:3] == ['parent_id', 'parent_name', 'parent_email']
+    assert [row[:2] for row in rows[1:]] == [[str(anna), 'Anna Żak'], [str(jan), 'Jan "Janek" Kos']]
+    assert rows[1][5:8] == ['50.0', '0.0', 'pending']
+    assert rows[2][4:] == [''] * 6  # no contribution yet
+
+    r = client.get(f'/api/admin/campaigns/{camp_id}/export', params={'include_hidden': 'true', 'status': 'none'},
+                   headers=headers)
+    assert [row[1] for row in csv.reader(io.StringIO(r.content.decode('utf-8-sig')))][1:] == ['Jan "Janek" Kos', 'Ukryty']
+
+
+def test_roster_xlsx_export(headers, campaign):
+    camp_id, _, (anna, *_) = campaign
+    r = client.get(f'/api/admin/campaigns/{camp_id}/export', params={'format': 'xlsx'}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers['content-type'] == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    name, rows = _sheet_rows(r.content)
+    assert name == 'Wycieczka  Kraków'
+    assert rows[0][0] == 'parent_id'
+    assert rows[1][:3] == [str(anna), 'Anna Żak', 'anna@example.com']
+    assert rows[1][5] == '50.0'
+    assert len(rows) == 3
+
+
+def test_payment_history_export(headers, campaign):
+    camp_id, old_id, (anna, jan, _) = campaign
+    client.post('/api/admin/contributions/mark-paid/batch', headers=headers, json={'items': [
+        {'campaign_id': old_id, 'parent_id': jan, 'amount': 20, 'note': 'gotówka\x07'},
+        {'campaign_id': camp_id, 'parent_id': anna, 'amount': 50},
+    ]})
+    r = client.get('/api/admin/payments/export', headers=headers)
+    rows = list(csv.reader(io.StringIO(r.content.decode('utf-8-sig'))))
+    # same paid_at (one batch), then by contribution id
+    assert [(row[2], row[4], row[9]) for row in rows[1:]] == [('Wycieczka: Kraków', 'Anna Żak', '50.0'),
+                                                              ('Stara', 'Jan "Janek" Kos', '20.0')]
+    r = client.get('/api/admin/payments/export', params={'format': 'xlsx'}, headers=headers)
+    _, rows = _sheet_rows(r.content)
+    assert rows[2][10] == 'gotówka'
+
+
+def test_csv_cells_never_start_a_formula(headers, campaign):
+    camp_id, _, (anna, jan, _) = campaign
+    with get_db() as session:
+        session.get(Parent, anna).name = '=HYPERLINK("http://x","y")'
+        session.get(Parent, jan).name = '@SUM(A1)'
+        session.commit()
+    client.post('/api/admin/contributions/mark-paid/batch', headers=headers, json={'items': [
+        {'campaign_id': camp_id, 'parent_id': anna, 'amount': 50, 'note': '-2+3'},
+    ]})
+    r = client.get(f'/api/admin/campaigns/{camp_id}/export', headers=headers)
+    rows = list(csv.reader(io.StringIO(r.content.decode('utf-8-sig'))))
+    assert [row[1] for row in rows[1:]] == ['\'=HYPERLINK("http://x","y")', "'@SUM(A1)"]
+    assert "'-2+3" in rows[1]
+    # numbers are not text: their sign stays as it is
+    assert rows[1][5] == '50.0'
+    # XLSX inline strings are never evaluated, so they are written unchanged
+    r = client.get(f'/api/admin/campaigns/{camp_id}/export', params={'format': 'xlsx'}, headers=headers)
+    _, sheet = _sheet_rows(r.content)
+    assert sheet[1][1] == '=HYPERLINK("http://x","y")'
+
+
+def test_export_validation(headers, campaign):
+    camp_id, *_ = campaign
+    assert client.get(f'/api/admin/campaigns/{camp_id}/export', params={'format': 'pdf'}, headers=headers).status_code == 400
+    assert client.get('/api/admin/campaigns/999/export', headers=headers).status_code == 404
+    assert client.get('/api/admin/payments/export').status_code == 401
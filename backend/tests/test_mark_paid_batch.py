@@ -0,0 +1,98 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import asyncpg
+from sqlmodel import select
+
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+from app.sql import bulk_update_by_id
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def roster():
+    with get_db() as session:
+        camp = Campaign(title='Teatr', target_amount=60.0)
+        parents = [Parent(name=f'P{i}', email=f'p{i}@example.com') for i in range(4)]
+        session.add(camp)
+        session.add_all(parents)
+        session.commit()
+        session.add_all([
+            Contribution(campaign_id=camp.id, parent_id=parents[0].id, amount_expected=20.0),
+            Contribution(campaign_id=camp.id, parent_id=parents[1].id, amount_expected=20.0),
+            Contribution(campaign_id=camp.id, parent_id=parents[2].id, amount_expected=20.0,
+                         amount_paid=20.0, status='paid'),
+        ])
+        session.commit()
+        return camp.id, [p.id for p in parents]
+
+
+def _contribution(campaign_id, parent_id):
+    with get_db() as session:
+        return session.exec(select(Contribution).where(
+            Contribution.campaign_id == campaign_id, Contribution.parent_id == parent_id)).one()
+
+
+def test_batch_mark_paid_reports_each_row(headers, roster):
+    camp, (p0, p1, p2, p3) = roster
+    items = [
+        {'campaign_id': camp, 'parent_id': p0, 'amount': 20, 'note': 'przelew 1'},
+        {'campaign_id': camp, 'parent_id': p1, 'amount': 15.5},
+        {'campaign_id': camp, 'parent_id': p2, 'amount': 25},   # already paid 20
+        {'campaign_id': camp, 'parent_id': p3, 'amount': 20},   # no contribution
+        {'campaign_id': camp, 'parent_id': p0, 'amount': 20},   # repeated
+        {'campaign_id': 'x', 'parent_id': p0},
+    ]
+    r = client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers)
+    assert r.status_code == 200
+    data = r.json()
+    assert (data['updated'], data['not_found'], data['conflict'], data['invalid']) == (2, 1, 2, 1)
+    assert [row['status'] for row in data['results']] == ['updated', 'updated', 'conflict', 'not_found', 'conflict', 'invalid']
+
+    c0, c1, c2 = (_contribution(camp, p) for p in (p0, p1, p2))
+    assert (c0.status, c0.amount_paid, c0.note) == ('paid', 20.0, 'przelew 1')
+    assert c0.paid_at is not None
+    assert (c1.status, c1.amount_paid, c1.note) == ('paid', 15.5, None)
+    assert c2.amount_paid == 20.0
+    assert data['results'][0]['contribution_id'] == c0.id
+
+
+def test_batch_is_idempotent(headers, roster):
+    camp, (p0, p1, *_) = roster
+    items = [{'campaign_id': camp, 'parent_id': p0, 'amount': 20}, {'campaign_id': camp, 'parent_id': p1, 'amount': 20}]
+    first = client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers).json()
+    second = client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers).json()
+    assert first['updated'] == second['updated'] == 2
+
+
+def test_batch_validation(headers):
+    r = client.post('/api/admin/contributions/mark-paid/batch', json={'items': []}, headers=headers)
+    assert r.status_code == 400
+    items = [{'campaign_id': 1, 'parent_id': i} for i in range(1001)]
+    r = client.post('/api/admin/contributions/mark-paid/batch', json={'items': items}, headers=headers)
+    assert r.status_code == 400
+
+
+def test_bulk_update_uses_values_join_on_postgres():
+    session = SimpleNamespace(bind=SimpleNamespace(dialect=postgresql.dialect()))
+    stmt = bulk_update_by_id(session, Contribution.__table__,
+                             [{'id': 1, 'amount_paid': 5.0, 'note': 'a'}, {'id': 2, 'amount_paid': 6.0, 'note': None}],
+                             status='paid')
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert 'FROM (VALUES' in sql
+    assert 'contribution.id = batch.id' in sql
+    # asyncpg binds untyped: every VALUES cell carries its column type
+    sql = str(stmt.compile(dialect=asyncpg.dialect()))
+    assert sql.count('CAST(') == 6
+    assert '(CAST(%s AS INTEGER), CAST(%s AS FLOAT), CAST(%s AS VARCHAR))' in sql
@@ -0,0 +1,135 @@
+import os
+import re
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import metrics
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, EmailOutbox
+from app.settings import get_settings
+
+client = TestClient(app)
+TOKEN = 'scrape-token'
+
+
+@pytest.fixture(autouse=True)
+def metrics_token(monkeypatch):
+    monkeypatch.setenv('METRICS_TOKEN', TOKEN)
+    get_settings.cache_clear()
+    yield
+    get_settings.cache_clear()
+
+
+def _scrape():
+    r = client.get('/metrics', headers={'Authorization': f'Bearer {TOKEN}'})
+    assert r.status_code == 200
+    return r
+
+
+@pytest.fixture
+def metrics_settings(monkeypatch):
+    def configure(**env):
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+        get_settings.cache_clear()
+    yield configure
+    get_settings.cache_clear()
+
+
+def _sample(text, name, **labels):
+    wanted = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = '^' + re.escape(name) + (r'\{' + re.escape(wanted) + r'\}' if labels else '') + r' (\S+)$'
+    match = re.search(pattern, text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_requests_are_counted_per_route_template():
+    with get_db() as session:
+        camp = Campaign(title='Wycieczka', target_amount=10.0)
+        session.add(camp)
+        session.commit()
+        camp_id = camp.id
+    before = _scrape().text
+    route = '/api/campaigns/{campaign_id}/status'
+    old = _sample(before, 'skarbek_http_requests_total', method='GET', route=route, status='200') or 0
+    for _ in range(3):
+        client.get(f'/api/campaigns/{camp_id}/status?email=nobody@example.com')
+    client.get('/nope')
+
+    r = _scrape()
+    assert r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    text = r.text
+    assert _sample(text, 'skarbek_http_requests_total', method='GET', route=route, status='200') == old + 3
+    assert _sample(text, 'skarbek_http_requests_total', method='GET', route='<unmatched>', status='404') >= 1
+    assert _sample(text, 'skarbek_http_request_duration_seconds_count', method='GET', route=route) >= 3
+    assert 'route="/api/campaigns/%d/status"' % camp_id not in text
+    # the scrape itself is in flight
+    assert _sample(text, 'skarbek_http_requests_in_flight') == 1
+
+
+def test_outbox_depth_and_hash_timings_are_exposed():
+    with get_db() as session:
+        session.add_all([EmailOutbox(kind='temporary_password', to_email=f'x{i}@example.com') for i in range(2)])
+        session.add(EmailOutbox(kind='temporary_password', to_email='dead@example.com', status='dead'))
+        session.commit()
+    client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    text = _scrape().text
+    assert _sample(text, 'skarbek_outbox_messages', status='pending') == 2
+    assert _sample(text, 'skarbek_outbox_messages', status='dead') == 1
+    assert _sample(text, 'skarbek_password_hash_seconds_count', operation='verify_and_update_password') >= 1
+
+
+def test_histogram_exposition_and_thread_shards():
+    registry = metrics.Registry()
+    hist = registry.register(metrics.Histogram('t_seconds', 'Test.', ('op',), buckets=(0.1, 1.0)))
+    counter = registry.register(metrics.Counter('t_total', 'Test "quoted".', ('op',)))
+
+    def work():
+        for _ in range(1000):
+            counter.inc('a\n"b"')
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, 'x')
+
+    text = metrics.render(registry.collect())
+    assert 't_total{op="a\\n\\"b\\""} 4000' in text
+    assert '# HELP t_total Test "quoted".' in text
+    assert 't_seconds_bucket{op="x",le="0.1"} 2' in text
+    assert 't_seconds_bucket{op="x",le="1"} 3' in text
+    assert 't_seconds_bucket{op="x",le="+Inf"} 4' in text
+    assert 't_seconds_sum{op="x"} 3.65' in text
+    assert 't_seconds_count{op="x"} 4' in text
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path, metrics_settings):
+    metrics_settings(METRICS_MULTIPROC_DIR=tmp_path)
+    store = metrics.MultiprocessStore(str(tmp_path))
+    other = {
+        'skarbek_http_requests_total': {'type': 'counter', 'help': 'x', 'labelnames': ['method', 'route', 'status'],
+                                        'samples': {('GET', '/a', '200'): 5}},
+        'skarbek_http_requests_in_flight': {'type': 'gauge', 'help': 'x', 'labelnames': [], 'samples': {(): 2}},
+    }
+    # a live sibling worker and one that has exited (pid far beyond pid_max)
+    store.write(other, pid=os.getppid())
+    store.write(other, pid=99999999)
+
+    text = _scrape().text
+    assert _sample(text, 'skarbek_http_requests_total', method='GET', route='/a', status='200') == 10
+    # the scrape itself plus the live sibling's 2; the exited worker's gauge is dropped
+    assert _sample(text, 'skarbek_http_requests_in_flight') == 3
+    assert os.path.exists(tmp_path / f'metrics_{os.getpid()}.json')
+
+
+def test_scrape_requires_the_metrics_token(monkeypatch):
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    monkeypatch.delenv('METRICS_TOKEN')
+    get_settings.cache_clear()
+    assert client.get('/metrics', headers={'Authorization': f'Bearer {TOKEN}'}).status_code == 404
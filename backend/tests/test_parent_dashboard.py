@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+
+from app.auth import create_token
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+
+
+def _seed(force_password_change=False):
+    with get_db() as session:
+        live = Campaign(title='Wycieczka', target_amount=100.0)
+        other = Campaign(title='Teatr', target_amount=40.0)
+        old = Campaign(title='Archiwum', target_amount=10.0, active=False)
+        p = Parent(name='Ola', email='ola@example.com', force_password_change=force_password_change)
+        session.add_all([live, other, old, p])
+        session.commit()
+        session.add_all([
+            Contribution(campaign_id=live.id, parent_id=p.id, amount_expected=100.0, amount_paid=0.0),
+            Contribution(campaign_id=old.id, parent_id=p.id, amount_expected=10.0, amount_paid=10.0, status='paid'),
+        ])
+        session.commit()
+        return p.id, live.id, other.id, old.id
+
+
+def _headers(email='ola@example.com'):
+    return {'Authorization': f"Bearer {create_token({'sub': email, 'role': 'parent'})}"}
+
+
+def test_dashboard_combines_identity_campaigns_and_history():
+    pid, live_id, other_id, old_id = _seed()
+    client = TestClient(app)
+    r = client.get('/api/parents/dashboard', headers=_headers())
+    assert r.status_code == 200
+    body = r.json()
+    assert body['parent'] == {'id': pid, 'name': 'Ola', 'email': 'ola@example.com'}
+    assert [item['campaign']['id'] for item in body['campaigns']] == [live_id, other_id]
+    assert body['campaigns'][0]['contribution']['status'] == 'pending'
+    assert body['campaigns'][1]['contribution'] is None
+    assert sorted(c['campaign_id'] for c in body['contributions']) == [live_id, old_id]
+    # the standalone endpoints agree with the dashboard
+    assert client.get('/api/parents/campaigns', headers=_headers()).json() == body['campaigns']
+
+
+def test_dashboard_etag_roundtrip():
+    pid, live_id, _, _ = _seed()
+    client = TestClient(app)
+    first = client.get('/api/parents/dashboard', headers=_headers())
+    etag = first.headers['etag']
+    assert first.headers['cache-control'] == 'private, no-cache'
+
+    unchanged = client.get('/api/parents/dashboard', headers={**_headers(), 'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.content == b''
+
+    with get_db() as session:
+        contrib = session.query(Contribution).filter(Contribution.campaign_id == live_id).first()
+        contrib.status = 'paid'
+        session.add(contrib)
+        session.commit()
+
+    changed = client.get('/api/parents/dashboard', headers={**_headers(), 'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['etag'] != etag
+
+
+def test_dashboard_requires_password_change_and_token():
+    _seed(force_password_change=True)
+    client = TestClient(app)
+    assert client.get('/api/parents/dashboard').status_code == 401
+    r = client.get('/api/parents/dashboard', headers=_headers())
+    assert r.status_code == 403
+    assert r.json()['detail']['code'] == 'password_change_required'
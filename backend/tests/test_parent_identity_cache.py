@@ -0,0 +1,105 @@
+import time
+
+import jwt
+from fastapi.testclient import TestClient
+
+from app.auth import JWT_ALG, JWT_SECRET, hash_password
+from app.db import get_db
+from app.identity_cache import IdentityCache, ParentIdentity, parent_identity_cache
+from app.main import app
+from app.models import Parent
+
+client = TestClient(app)
+
+
+def _parent(email='cache@example.com', password='secret123'):
+    with get_db() as session:
+        p = Parent(name='Cache', email=email, password_hash=hash_password(password), force_password_change=False)
+        session.add(p)
+        session.commit()
+        return p.id
+
+
+def _login(email='cache@example.com', password='secret123'):
+    r = client.post('/api/parents/login', json={'email': email, 'password': password})
+    assert r.status_code == 200
+    return r.json()['token']
+
+
+def _admin_headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+def test_parent_token_carries_id_and_credentials_version():
+    pid = _parent()
+    claims = jwt.decode(_login(), JWT_SECRET, algorithms=[JWT_ALG])
+    assert claims['pid'] == pid
+    assert claims['cv'] == 0
+    assert claims['pwc'] is False
+
+
+def test_cached_identity_skips_parent_lookup(monkeypatch):
+    _parent()
+    token = _login()
+
+    def no_db():
+        raise AssertionError('identity should come from the cache')
+
+    monkeypatch.setattr('app.api.parents.get_async_db', no_db)
+    r = client.get('/api/parents/me', headers={'Authorization': f'Bearer {token}'})
+    assert r.status_code == 200
+    assert r.json()['email'] == 'cache@example.com'
+
+
+def test_password_change_by_admin_revokes_old_tokens():
+    pid = _parent()
+    token = _login()
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/parents/me', headers=headers).status_code == 200
+
+    r = client.post(f'/api/admin/parents/{pid}/change-password', json={'new_password': 'other456'}, headers=_admin_headers())
+    assert r.status_code == 200
+    assert client.get('/api/parents/me', headers=headers).status_code == 401
+
+    fresh = _login(password='other456')
+    assert client.get('/api/parents/me', headers={'Authorization': f'Bearer {fresh}'}).status_code == 200
+
+
+def test_email_change_invalidates_cached_identity():
+    pid = _parent()
+    token = _login()
+    client.get('/api/parents/me', headers={'Authorization': f'Bearer {token}'})
+    assert parent_identity_cache.get(pid) is not None
+
+    r = client.put(f'/api/admin/parents/{pid}', json={'email': 'moved@example.com'}, headers=_admin_headers())
+    assert r.status_code == 200
+    assert parent_identity_cache.get(pid) is None
+    assert client.get('/api/parents/me', headers={'Authorization': f'Bearer {token}'}).status_code == 401
+
+
+def test_identity_cache_ttl_and_bound():
+    cache = IdentityCache(ttl_seconds=0.05, max_entries=2)
+    for i in range(3):
+        cache.put(ParentIdentity(id=i, email=f'{i}@x', name=None, force_password_change=False, credentials_version=0))
+    assert cache.get(0) is None  # evicted as least recently used
+    assert cache.get(2) is not None
+    time.sleep(0.06)
+    assert cache.get(2) is None
+
+
+def test_newer_token_than_stale_cache_entry_is_accepted():
+    # another worker changed the password: this worker's cache still has cv=0
+    pid = _parent()
+    with get_db() as session:
+        p = session.get(Parent, pid)
+        p.credentials_version = 1
+        session.add(p)
+        session.commit()
+    parent_identity_cache.put(ParentIdentity(id=pid, email='cache@example.com', name='Cache',
+                                             force_password_change=False, credentials_version=0))
+    fresh = _login()
+    assert jwt.decode(fresh, JWT_SECRET, algorithms=[JWT_ALG])['cv'] == 1
+
+    assert client.get('/api/parents/me', headers={'Authorization': f'Bearer {fresh}'}).status_code == 200
+    assert parent_identity_cache.get(pid).credentials_version == 1
@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import select
+
+from app.auth import verify_password
+from app.db import get_db
+from app.main import app
+from app.models import EmailOutbox, Parent
+from app.outbox import drain_outbox
+from app.parent_import import ImportFormatError, parse_parents_csv
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def admin_headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}", 'Content-Type': 'text/csv'}
+
+
+def _import(headers, body, **params):
+    return client.post('/api/admin/parents/import', content=body.encode('utf-8'), headers=headers, params=params)
+
+
+def test_import_creates_parents_and_queues_invitations(admin_headers, fake_email_client):
+    with get_db() as session:
+        session.add(Parent(name='Stary', email='Stary@Example.com'))
+        session.commit()
+
+    body = (
+        'name,email,pupil_id\n'
+        'Anna Nowak,anna@example.com,P1\n'
+        'Jan Kowalski,jan@example.com,P2\n'
+        'Duplikat,ANNA@example.com,P3\n'
+        'Istniejący,stary@example.com,P4\n'
+        'Bez maila,,P5\n'
+        'Zły,nie-email,P6\n'
+    )
+    r = _import(admin_headers, body)
+    assert r.status_code == 200
+    data = r.json()
+    assert data['summary'] == {'created': 2, 'duplicate': 1, 'exists': 1, 'invalid': 2}
+    assert [(row['row'], row['status']) for row in data['rows']] == [
+        (2, 'created'), (3, 'created'), (4, 'duplicate'), (5, 'exists'), (6, 'invalid'), (7, 'invalid'),
+    ]
+
+    with get_db() as session:
+        anna = session.exec(select(Parent).where(Parent.email == 'anna@example.com')).one()
+        assert anna.id == data['rows'][0]['id']
+        assert anna.pupil_id == 'P1' and anna.force_password_change
+        assert anna.password_hash is None
+        messages = session.exec(select(EmailOutbox).order_by(EmailOutbox.id)).all()
+        assert [(m.to_email, m.status) for m in messages] == [('anna@example.com', 'pending'), ('jan@example.com', 'pending')]
+        assert json.loads(messages[0].payload) == {'parent_name': 'Anna Nowak'}
+    # invitations are queued, not sent inline
+    assert fake_email_client.sent == []
+
+    # the password is issued when the invitation is sent
+    assert drain_outbox(fake_email_client)['sent'] == 2
+    with get_db() as session:
+        anna = session.get(Parent, anna.id)
+        assert verify_password(fake_email_client.sent[0]['password'], anna.password_hash)
+
+
+def test_dry_run_validates_without_writing(admin_headers):
+    r = _import(admin_headers, 'email;name\nola@example.com;Ola\n', dry_run='true')
+    assert r.status_code == 200
+    assert r.json()['summary'] == {'valid': 1}
+    with get_db() as session:
+        assert session.exec(select(Parent)).all() == []
+
+
+def test_import_requires_email_column_and_admin(admin_headers):
+    r = _import(admin_headers, 'name,pupil_id\nAla,P1\n')
+    assert r.status_code == 400
+    r = client.post('/api/admin/parents/import', content=b'email\na@example.com\n')
+    assert r.status_code == 401
+
+
+def test_parser_handles_cp1250_semicolons_and_blank_lines():
+    raw = 'imie;email;name\n\nx;zofia@example.com;Zofia Żółć\n'.encode('cp1250')
+    rows = parse_parents_csv(raw)
+    assert [(r.row, r.name, r.email, r.status) for r in rows] == [(3, 'Zofia Żółć', 'zofia@example.com', 'pending')]
+
+
+def test_parser_limits_rows():
+    with pytest.raises(ImportFormatError):
+        parse_parents_csv(b'email\na@example.com\nb@example.com\n', max_rows=1)
@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.auth import build_crypt_context, get_crypt_context, hash_password, verify_and_update_password
+from app.db import get_db
+from app.main import app
+from app.models import AdminUser, Parent
+from app.settings import get_settings
+from sqlmodel import select
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def hash_profile(monkeypatch):
+    def configure(rounds, scheme='pbkdf2_sha256'):
+        monkeypatch.setenv('PASSWORD_HASH_SCHEME', scheme)
+        monkeypatch.setenv('PASSWORD_HASH_ROUNDS', str(rounds))
+        get_settings.cache_clear()
+    yield configure
+    monkeypatch.delenv('PASSWORD_HASH_SCHEME', raising=False)
+    monkeypatch.delenv('PASSWORD_HASH_ROUNDS', raising=False)
+    get_settings.cache_clear()
+
+
+def _stored_hash(parent_id):
+    with get_db() as session:
+        return session.get(Parent, parent_id).password_hash
+
+
+def _parent_with_hash(password_hash, email='rehash@example.com'):
+    with get_db() as session:
+        p = Parent(name='Rehash', email=email, password_hash=password_hash, force_password_change=False)
+        session.add(p)
+        session.commit()
+        return p.id
+
+
+def test_configured_rounds_are_used_for_new_hashes(hash_profile):
+    hash_profile(1500)
+    assert hash_password('abc').startswith('$pbkdf2-sha256$1500$')
+    assert get_crypt_context() is build_crypt_context('pbkdf2_sha256', 1500)
+
+
+def test_verify_and_update_flags_outdated_cost():
+    old = build_crypt_context('pbkdf2_sha256', 1000).hash('abc')
+    valid, new_hash = verify_and_update_password('abc', old, 'pbkdf2_sha256', 2000)
+    assert valid and new_hash.startswith('$pbkdf2-sha256$2000$')
+    assert verify_and_update_password('abc', new_hash, 'pbkdf2_sha256', 2000) == (True, None)
+    assert verify_and_update_password('zle', old, 'pbkdf2_sha256', 2000) == (False, None)
+
+
+def test_parent_login_rehashes_to_current_profile(hash_profile):
+    pid = _parent_with_hash(build_crypt_context('pbkdf2_sha256', 1000).hash('secret123'))
+    hash_profile(2000)
+
+    r = client.post('/api/parents/login', json={'email': 'rehash@example.com', 'password': 'secret123'})
+    assert r.status_code == 200
+    upgraded = _stored_hash(pid)
+    assert upgraded.startswith('$pbkdf2-sha256$2000$')
+
+    # the rehash is transparent: same password, same credentials version, no further rewrite
+    r = client.post('/api/parents/login', json={'email': 'rehash@example.com', 'password': 'secret123'})
+    assert r.status_code == 200
+    assert _stored_hash(pid) == upgraded
+    with get_db() as session:
+        assert session.get(Parent, pid).credentials_version == 0
+
+
+def test_failed_login_does_not_rehash(hash_profile):
+    old = build_crypt_context('pbkdf2_sha256', 1000).hash('secret123')
+    pid = _parent_with_hash(old)
+    hash_profile(2000)
+    r = client.post('/api/parents/login', json={'email': 'rehash@example.com', 'password': 'wrong'})
+    assert r.status_code == 401
+    assert _stored_hash(pid) == old
+
+
+def test_scheme_switch_keeps_legacy_hashes_valid(hash_profile):
+    pid = _parent_with_hash(build_crypt_context('pbkdf2_sha256').hash('secret123'))
+    hash_profile(6000, scheme='sha512_crypt')
+    r = client.post('/api/parents/login', json={'email': 'rehash@example.com', 'password': 'secret123'})
+    assert r.status_code == 200
+    assert _stored_hash(pid).startswith('$6$rounds=6000$')
+
+
+def test_admin_login_rehashes(hash_profile):
+    hash_profile(2000)
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    assert r.status_code == 200
+    with get_db() as session:
+        admin = session.exec(select(AdminUser).where(AdminUser.username == 'admin')).first()
+        assert admin.password_hash.startswith('$pbkdf2-sha256$2000$')
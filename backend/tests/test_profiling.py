@@ -0,0 +1,97 @@
+import pstats
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.profiling import ProfileStore, profile_store
+from app.settings import get_settings
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture(autouse=True)
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(profile_store, 'directory', str(tmp_path / 'profiles'))
+    return profile_store
+
+
+def test_admin_can_profile_a_request_and_download_it(headers, store, tmp_path):
+    token = headers['Authorization'].split()[1]
+    r = client.get('/api/campaigns?_profile=1', headers={'X-Profile-Token': token})
+    assert r.status_code == 200
+    profile_id = r.headers['X-Profile-Id']
+
+    items = client.get('/api/admin/debug/profiles', headers=headers).json()['items']
+    assert items[0]['id'] == profile_id
+    assert items[0]['route'] == '/api/campaigns/'
+    assert items[0]['status'] == 200
+
+    r = client.get(f'/api/admin/debug/profiles/{profile_id}', headers=headers)
+    assert r.status_code == 200
+    assert r.headers['content-disposition'].endswith(f'"{profile_id}.prof"')
+    path = tmp_path / 'downloaded.prof'
+    with open(path, 'wb') as f:
+        f.write(r.content)
+    assert pstats.Stats(str(path)).total_calls > 0
+
+    r = client.get(f'/api/admin/debug/profiles/{profile_id}?format=text&limit=1000', headers=headers)
+    # a sync endpoint runs in the threadpool: only the stack around it is seen
+    assert 'middleware.py' in r.text and 'run_in_threadpool' in r.text
+
+
+def test_admin_routes_can_use_the_authorization_header(headers):
+    r = client.get('/api/admin/parents', headers={**headers, 'X-Profile': '1'})
+    assert r.status_code == 200
+    r = client.get(f"/api/admin/debug/profiles/{r.headers['X-Profile-Id']}?format=text&limit=1000", headers=headers)
+    assert 'admin_list_parents' in r.text
+
+
+def test_flag_is_ignored_without_an_admin_token(store):
+    assert 'X-Profile-Id' not in client.get('/api/campaigns?_profile=1').headers
+    assert 'X-Profile-Id' not in client.get('/api/campaigns', headers={'X-Profile-Token': 'garbage'}).headers
+    assert store.list() == []
+
+
+def test_no_profile_without_the_flag_or_when_disabled(headers, store, monkeypatch):
+    assert 'X-Profile-Id' not in client.get('/api/admin/parents', headers=headers).headers
+    # only an exact _profile=1 or X-Profile: 1 asks for a profile
+    assert 'X-Profile-Id' not in client.get('/api/admin/parents?x_profile=10', headers=headers).headers
+    assert 'X-Profile-Id' not in client.get('/api/admin/parents?_profile=10', headers=headers).headers
+    assert 'X-Profile-Id' not in client.get('/api/admin/parents', headers={**headers, 'X-Profile': '0'}).headers
+    assert 'X-Profile-Id' in client.get('/api/admin/parents?q=a&_profile=1', headers=headers).headers
+    monkeypatch.setenv('PROFILING_ENABLED', 'false')
+    get_settings.cache_clear()
+    try:
+        r = client.get('/api/admin/parents?_profile=1', headers=headers)
+    finally:
+        get_settings.cache_clear()
+    assert 'X-Profile-Id' not in r.headers
+    assert len(store.list()) == 1
+
+
+def test_unknown_profile_and_format(headers):
+    assert client.get('/api/admin/debug/profiles/20260101T000000-1-1', headers=headers).status_code == 404
+    assert client.get('/api/admin/debug/profiles/..%2Fsecret', headers=headers).status_code == 404
+    assert client.get('/api/admin/debug/profiles/x?format=svg', headers=headers).status_code == 400
+    assert client.get('/api/admin/debug/profiles').status_code == 401
+
+
+def test_store_keeps_only_the_newest_profiles(tmp_path):
+    import cProfile
+
+    store = ProfileStore(str(tmp_path / 'profiles'), max_profiles=2)
+    ids = []
+    for i in range(3):
+        profile_id = store.new_id()
+        store.save(profile_id, cProfile.Profile(), {'created': i})
+        ids.append(profile_id)
+    assert [p['id'] for p in store.list()] == ids[:0:-1]
+    assert store.pstats_path(ids[0]) is None
+    assert len(list((tmp_path / 'profiles').iterdir())) == 4
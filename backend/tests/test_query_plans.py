@@ -0,0 +1,58 @@
+"""EXPLAIN checks for the hot lookups in app/api/parents.py and campaigns.py.
+
+Runs against the per-test sqlite database; the same indexes are created on
+Postgres by migrations/002_add_lookup_indexes.sql.
+"""
+import pytest
+from sqlmodel import select
+
+import app.db as dbmod
+from app.db import get_db
+from app.models import Campaign, Contribution, Parent
+
+
+def _plan(stmt):
+    engine = dbmod.get_engine()
+    sql = str(stmt.compile(dialect=engine.dialect, compile_kwargs={'literal_binds': True}))
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+@pytest.fixture(autouse=True)
+def some_rows():
+    with get_db() as session:
+        for i in range(50):
+            session.add(Parent(name=f'P{i}', email=f'p{i}@example.com', pupil_id=f'U{i}'))
+            session.add(Campaign(title=f'C{i}', active=i % 2 == 0))
+        session.commit()
+        session.add(Contribution(campaign_id=1, parent_id=1))
+        session.commit()
+
+
+@pytest.mark.parametrize('stmt, index', [
+    (select(Parent).where(Parent.email == 'p1@example.com'), 'ix_parent_email'),
+    (select(Parent).where(Parent.pupil_id == 'U1'), 'ix_parent_pupil_id'),
+    (select(Contribution).where(Contribution.campaign_id == 1, Contribution.parent_id == 1), 'uq_contribution_campaign_parent'),
+    (select(Contribution).where(Contribution.parent_id == 1), 'ix_contribution_parent_id'),
+    (select(Campaign).where(Campaign.deleted_at == None, Campaign.active == True), 'ix_campaign_active_live'),
+])
+def test_lookup_uses_index(stmt, index):
+    plan = _plan(stmt)
+    assert index in plan, plan
+
+
+def test_contribution_pair_is_unique():
+    from sqlalchemy.exc import IntegrityError
+    with get_db() as session:
+        session.add(Contribution(campaign_id=1, parent_id=1))
+        with pytest.raises(IntegrityError):
+            session.commit()
+
+
+def test_parent_email_unique_case_insensitive():
+    from sqlalchemy.exc import IntegrityError
+    with get_db() as session:
+        session.add(Parent(name='Dup', email='P1@Example.com'))
+        with pytest.raises(IntegrityError):
+            session.commit()
@@ -0,0 +1,96 @@
+import logging
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import get_db
+from app.main import app
+from app.middleware import QueryStatsMiddleware
+from app.models import Campaign, Contribution, Parent
+from app.query_stats import QueryStats, fingerprint
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+def _school(parents):
+    with get_db() as session:
+        camp = Campaign(title='Basen', target_amount=30.0)
+        session.add(camp)
+        session.commit()
+        for i in range(parents):
+            p = Parent(name=f'P{i}', email=f'p{i}@example.com', is_hidden=i % 7 == 0)
+            session.add(p)
+            session.commit()
+            session.add(Contribution(campaign_id=camp.id, parent_id=p.id, amount_expected=30.0,
+                                     status='paid' if i % 2 else 'pending'))
+        session.commit()
+        return camp.id
+
+
+@pytest.mark.parametrize('parents', [3, 40])
+def test_admin_reads_stay_within_budget_regardless_of_size(headers, query_budget, parents):
+    camp = _school(parents)
+    with query_budget(3):
+        assert client.get(f'/api/admin/campaigns/{camp}/roster', headers=headers).status_code == 200
+    with query_budget(3):
+        assert client.get(f'/api/admin/campaigns/{camp}/roster?limit=10', headers=headers).status_code == 200
+    with query_budget(1):
+        assert client.get('/api/admin/contributions', headers=headers).status_code == 200
+
+
+def test_query_budget_reports_the_statements(query_budget):
+    with pytest.raises(AssertionError, match='query budget of 1 exceeded: 3 queries'):
+        with query_budget(1):
+            for i in range(3):
+                with get_db() as session:
+                    session.get(Parent, i)
+
+
+def test_fingerprint_folds_parameters():
+    assert fingerprint('SELECT *\n  FROM parent WHERE id IN (?, ?, ?) LIMIT 10') == \
+        fingerprint('SELECT * FROM parent WHERE id IN (?) LIMIT 20') == 'SELECT * FROM parent WHERE id IN (?...) LIMIT ?'
+    assert fingerprint('INSERT INTO t (a, b) VALUES ($1, $2), ($3, $4)') == 'INSERT INTO t (a, b) VALUES (?...)...'
+    assert fingerprint('SELECT t1.a FROM t1 WHERE t1.b = %(b_1)s') == 'SELECT t1.a FROM t1 WHERE t1.b = %(b_1)s'
+
+
+def test_middleware_adds_headers(headers):
+    camp = _school(3)
+    instrumented = TestClient(QueryStatsMiddleware(app))
+    r = instrumented.get(f'/api/admin/campaigns/{camp}/roster', headers=headers)
+    assert r.headers['x-query-count'] == '3'
+    assert r.headers['server-timing'].startswith('db;dur=')
+    assert r.headers['server-timing'].endswith('desc="3 queries"')
+    # sync endpoint: its queries run in the threadpool
+    assert instrumented.get('/api/campaigns/').headers['x-query-count'] == '1'
+    assert instrumented.get('/health').headers['x-query-count'] == '0'
+
+
+def test_middleware_logs_repeated_statements(caplog):
+    async def per_row_lookups(scope, receive, send):
+        for i in range(4):
+            with get_db() as session:
+                session.get(Parent, i)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    instrumented = TestClient(QueryStatsMiddleware(per_row_lookups, repeat_threshold=3))
+    with caplog.at_level(logging.WARNING, logger='app.middleware'):
+        r = instrumented.get('/rows')
+    assert r.headers['x-query-count'] == '4'
+    [record] = caplog.records
+    assert record.args[:3] == ('GET', '/rows', 4)
+    assert 'FROM parent' in record.args[3]
+
+
+def test_repeated_orders_by_count():
+    stats = QueryStats()
+    for sql in ['SELECT 1 FROM a WHERE id = ?'] * 2 + ['SELECT b.x FROM b WHERE id = ?'] * 5:
+        stats.record(sql, 0.001)
+    assert stats.repeated(2) == [('SELECT b.x FROM b WHERE id = ?', 5), ('SELECT ? FROM a WHERE id = ?', 2)]
+    assert stats.count == 7
@@ -0,0 +1,93 @@
+from fastapi.testclient import TestClient
+
+from app.api import campaigns as campaigns_api
+from app.cache import CAMPAIGNS, MemoryBackend, RedisBackend, ResponseCache
+from app.main import app
+from tests.helpers import FakeRedis
+
+client = TestClient(app)
+
+
+def _admin_headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+def test_campaign_list_is_cached_and_revalidated_without_db(monkeypatch):
+    client.post('/api/campaigns/', json={'title': 'Wycieczka', 'target_amount': 100})
+    first = client.get('/api/campaigns/')
+    assert first.status_code == 200
+    assert first.headers['x-cache'] == 'miss'
+    assert first.headers['cache-control'] == 'public, no-cache'
+    assert [c['title'] for c in first.json()] == ['Wycieczka']
+
+    def no_db(active):
+        raise AssertionError('database queried for a cached list')
+    monkeypatch.setattr(campaigns_api, '_campaign_list', no_db)
+    second = client.get('/api/campaigns/')
+    assert second.headers['x-cache'] == 'hit'
+    assert second.content == first.content
+    revalidated = client.get('/api/campaigns/', headers={'If-None-Match': first.headers['etag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['etag'] == first.headers['etag']
+
+
+def test_campaign_writes_invalidate_the_list():
+    headers = _admin_headers()
+    cid = client.post('/api/campaigns/', json={'title': 'Teatr', 'target_amount': 50}).json()['id']
+    etag = client.get('/api/campaigns/').headers['etag']
+
+    client.put(f'/api/admin/campaigns/{cid}', json={'title': 'Kino'}, headers=headers)
+    r = client.get('/api/campaigns/', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['x-cache'] == 'miss'
+    assert r.json()[0]['title'] == 'Kino'
+
+    client.delete(f'/api/admin/campaigns/{cid}', headers=headers)
+    assert client.get('/api/campaigns/').json() == []
+
+
+def test_active_filter_is_part_of_the_key():
+    client.post('/api/campaigns/', json={'title': 'Stara', 'target_amount': 10, 'active': False})
+    assert client.get('/api/campaigns/').json() == []
+    assert [c['title'] for c in client.get('/api/campaigns/?active=false').json()] == ['Stara']
+
+
+def test_memory_backend_expires_and_evicts(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr('app.cache.time.monotonic', lambda: now[0])
+    backend = MemoryBackend(max_entries=2)
+    backend.set('a', b'1', ttl=10)
+    backend.set('b', b'2', ttl=10)
+    backend.get('a')
+    backend.set('c', b'3', ttl=10)
+    assert backend.get('b') is None
+    assert backend.get('a') == b'1'
+    now[0] = 11
+    assert backend.get('a') is None
+
+
+def test_redis_backend_shares_versions_between_caches():
+    fake = FakeRedis()
+    builds = []
+    one, two = ResponseCache(RedisBackend(fake)), ResponseCache(RedisBackend(fake))
+
+    def build():
+        builds.append(1)
+        return {'n': len(builds)}
+
+    body, etag, hit = one.get_or_build(CAMPAIGNS, 'k', build)
+    assert (body, hit) == (b'{"n":1}', False)
+    assert two.get_or_build(CAMPAIGNS, 'k', build) == (body, etag, True)
+    one.bump(CAMPAIGNS)
+    body, _, hit = two.get_or_build(CAMPAIGNS, 'k', build)
+    assert (body, hit) == (b'{"n":2}', False)
+    # entries expire with the ttl
+    fake.now += 61
+    assert two.get_or_build(CAMPAIGNS, 'k', build)[2] is False
+
+
+def test_disabled_cache_builds_every_time():
+    cache = ResponseCache(None)
+    assert cache.get_or_build(CAMPAIGNS, 'k', lambda: [1])[2] is False
+    cache.bump(CAMPAIGNS)
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db import get_db
+from app.main import app
+from app.models import Campaign, Contribution, Parent
+from app.settings import get_settings
+from app.slow_queries import SlowQueryLog, explain_args, slow_query_log
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def headers():
+    r = client.post('/api/admin/login', json={'username': 'admin', 'password': 'changeme'})
+    return {'Authorization': f"Bearer {r.json()['token']}"}
+
+
+@pytest.fixture
+def log_everything(monkeypatch):
+    monkeypatch.setenv('SLOW_QUERY_THRESHOLD_MS', '0.000001')
+    get_settings.cache_clear()
+    slow_query_log.clear()
+    yield slow_query_log
+    get_settings.cache_clear()
+    slow_query_log.wait_for_plans()
+    slow_query_log.clear()
+
+
+def test_slow_statements_are_logged_with_route_and_plan(headers, log_everything):
+    with get_db() as session:
+        camp = Campaign(title='Kino', target_amount=15.0)
+        parent = Parent(name='Ala', email='ala@example.com')
+        session.add_all([camp, parent])
+        session.commit()
+        session.add(Contribution(campaign_id=camp.id, parent_id=parent.id, amount_expected=15.0))
+        session.commit()
+        camp_id = camp.id
+
+    client.get(f'/api/admin/campaigns/{camp_id}/roster?q=ala', headers=headers)
+    log_everything.wait_for_plans()
+
+    r = client.get('/api/admin/debug/slow-queries?limit=1000', headers=headers)
+    assert r.status_code == 200
+    body = r.json()
+    assert body['threshold_ms'] == 0.000001
+    roster = [e for e in body['entries'] if e['route'] == 'GET /api/admin/campaigns/{campaign_id}/roster']
+    assert roster
+    entry = next(e for e in roster if 'FROM parent' in e['statement'])
+    assert 'ala' not in json.dumps(entry['params'])
+    assert 'str' in entry['params'] and 'int' in entry['params']
+    assert entry['plan'] and any('parent' in line for line in entry['plan'])
+    ids = [e['id'] for e in body['entries']]
+    assert ids == sorted(ids, reverse=True)
+
+
+def test_debug_endpoint_requires_admin():
+    assert client.get('/api/admin/debug/slow-queries').status_code == 401
+
+
+def test_explain_args_rewrites_asyncpg_placeholders():
+    sql, params = explain_args('postgresql', "SELECT * FROM t WHERE a = $2 AND b = $1 AND c LIKE 'x%'", ('one', 'two'))
+    assert sql == "EXPLAIN SELECT * FROM t WHERE a = %s AND b = %s AND c LIKE 'x%%'"
+    assert params == ('two', 'one')
+    assert explain_args('postgresql', 'SELECT 1 WHERE a = %(a)s', {'a': 1}) == ('EXPLAIN SELECT 1 WHERE a = %(a)s', {'a': 1})
+    assert explain_args('sqlite', 'SELECT 1', ()) == ('EXPLAIN QUERY PLAN SELECT 1', ())
+    assert explain_args('postgresql', 'COMMIT', ()) is None
+
+
+def test_ring_buffer_and_jsonl_file(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    log = SlowQueryLog(max_entries=2, path=str(path), explain=False)
+    for i in range(3):
+        log.record(f'UPDATE t SET a = ? WHERE id = {i}', [('secret', i), ('other', i)], 0.75, None, 'sqlite')
+    assert [e['statement'][-1] for e in log.entries()] == ['2', '1']
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 3
+    assert lines[0]['params'] == ['str', 'int']
+    assert lines[0]['duration_ms'] == 750.0
@@ -1,23 +1,52 @@
-import React, { useState } from 'react'
+import React, { useEffect, useState } from 'react'
 import * as api from './api'
 
+const OUTBOX_STATUS_LABELS = {
+  pending: 'w kolejce',
+  sending: 'wysyłanie',
+  sent: 'wysłano',
+  dead: 'nie wysłano',
+}
+
 export default function AdminCreateParentView({ adminToken, onBack }){
   const [name, setName] = useState('')
   const [email, setEmail] = useState('')
   const [status, setStatus] = useState('')
+  const [outbox, setOutbox] = useState([])
+
+  const loadOutbox = async ()=>{
+    try{
+      const res = await api.adminListOutbox({ limit: 20 }, adminToken)
+      setOutbox(res.items || [])
+    }catch(err){
+      setOutbox([])
+    }
+  }
+
+  useEffect(()=>{ loadOutbox() }, [adminToken])
 
   const handleSubmit = async (e)=>{
     e.preventDefault()
     setStatus('Tworzenie...')
     try{
       const res = await api.adminCreateParent({name, email}, adminToken)
-      setStatus('Utworzono: ' + res.email + ' (hasło wysłane e-mailem)')
+      setStatus('Utworzono: ' + res.email + ' (hasło w kolejce do wysłania e-mailem)')
       setName(''); setEmail('')
+      loadOutbox()
     }catch(err){
       setStatus('Błąd: ' + (err && err.message ? err.message : String(err)))
     }
   }
 
+  const handleRetry = async (id)=>{
+    try{
+      await api.adminRetryOutbox(id, adminToken)
+    }catch(err){
+      setStatus('Błąd: ' + (err && err.message ? err.message : String(err)))
+    }
+    loadOutbox()
+  }
+
   return (
     <div className="card">
       <button className="btn btn-ghost" onClick={onBack}>Powrót</button>
@@ -35,6 +64,29 @@ export default function AdminCreateParentView({ adminToken, onBack }){
         <button className="btn btn-primary" type="submit">Utwórz</button>
       </form>
       <div>{status}</div>
+
+      <h4 className="panel-title">Wysyłka e-maili</h4>
+      <button className="btn btn-ghost" onClick={loadOutbox}>Odśwież</button>
+      <table className="contrib-table" style={{ width: '100%' }}>
+        <thead>
+          <tr><th>Adres</th><th>Status</th><th>Próby</th><th>Ostatni błąd</th><th></th></tr>
+        </thead>
+        <tbody>
+          {outbox.map(m => (
+            <tr key={m.id}>
+              <td>{m.to_email}</td>
+              <td>{OUTBOX_STATUS_LABELS[m.status] || m.status}</td>
+              <td>{m.attempts}</td>
+              <td>{m.last_error || ''}</td>
+              <td>
+                {(m.status === 'dead' || m.status === 'pending') && (
+                  <button className="btn btn-ghost" onClick={()=>handleRetry(m.id)}>Wyślij ponownie</button>
+                )}
+              </td>
+            </tr>
+          ))}
+        </tbody>
+      </table>
     </div>
   )
 }
@@ -32,6 +32,10 @@ async function request(path, opts = {}) {
 }
 
 export const listCampaigns = () => request('/campaigns/')
+// per-campaign counts and sums (paid_sum / target_amount as progress); admin only
+export const listCampaignProgress = (token) => request('/admin/campaigns/progress', {
+  headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+})
 export const createCampaign = async (payload, token) => {
   return request('/admin/campaigns-new', {
     method: 'POST',
@@ -141,4 +145,70 @@ export const adminDeleteCampaign = (id, token) => request(`/admin/campaigns/${id
   headers: token ? { Authorization: `Bearer ${token}` } : undefined,
 })
 
+// payload: { amount_expected, pupil_id_prefix, parent_ids, include_hidden } (all optional)
+export const adminBulkAssignContributions = (campaignId, payload, token) => request(`/admin/campaigns/${campaignId}/contributions/bulk`, {
+  method: 'POST',
+  body: JSON.stringify(payload || {}),
+  headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+})
+
+// items: [{ campaign_id, parent_id, amount?, note? }], at most 1000 per call
+export const adminMarkPaidBatch = (items, token) => request('/admin/contributions/mark-paid/batch', {
+  method: 'POST',
+  body: JSON.stringify({ items }),
+  headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+})
+
+// Bank statement CSV as exported by the bank; nothing is written, the
+// proposals' mark_paid items go to adminMarkPaidBatch once reviewed
+export const adminMatchBankStatement = (csvText, token, { campaignId, minConfidence } = {}) => {
+  const params = new URLSearchParams()
+  if (campaignId != null) params.set('campaign_id', campaignId)
+  if (minConfidence != null) params.set('min_confidence', minConfidence)
+  const qs = params.toString()
+  return request(`/admin/bank-statements/match${qs ? `?${qs}` : ''}`, {
+    method: 'POST',
+    body: csvText,
+    headers: { 'Content-Type': 'text/csv', ...(token ? { Authorization: `Bearer ${token}` } : {}) },
+  })
+}
+
+// File downloads (CSV/XLSX exports) resolve to a Blob instead of JSON
+async function download(path, token) {
+  const auth = token || getStoredToken()
+  const res = await fetch(`${apiBase}${path}`, { headers: auth ? { Authorization: `Bearer ${auth}` } : {} })
+  if (!res.ok) {
+    const text = await res.text().catch(() => '')
+    throw new Error(`${res.status} ${res.statusText}: ${text}`)
+  }
+  return res.blob()
+}
+
+export const adminExportCampaignRoster = (campaignId, token, { format = 'csv', includeHidden = false } = {}) =>
+  download(`/admin/campaigns/${campaignId}/export?format=${format}${includeHidden ? '&include_hidden=true' : ''}`, token)
+
+export const adminExportPaymentHistory = (token, { format = 'csv' } = {}) =>
+  download(`/admin/payments/export?format=${format}`, token)
+
+// CSV body with a header row: name,email,pupil_id
+export const adminImportParents = (csvText, token, { dryRun = false } = {}) => request(`/admin/parents/import${dryRun ? '?dry_run=true' : ''}`, {
+  method: 'POST',
+  body: csvText,
+  headers: { 'Content-Type': 'text/csv', ...(token ? { Authorization: `Bearer ${token}` } : {}) },
+})
+
+// Email outbox (delivery status of temporary-password emails)
+export const adminListOutbox = (params = {}, token) => {
+  const qs = new URLSearchParams(params).toString()
+  return request(`/admin/outbox${qs ? `?${qs}` : ''}`, {
+    method: 'GET',
+    headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+  })
+}
+
+export const adminRetryOutbox = (id, token) => request(`/admin/outbox/${id}/retry`, {
+  method: 'POST',
+  headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+})
+
 export default { listCampaigns, createCampaign, adminLogin, adminCreateParent, parentLogin, parentGetCampaigns, parentSubmitContribution, markContributionPaid }